@@ -1,11 +1,26 @@
 import os
+import threading
 import praw
+import requests
 import sys
 import log
+import rate_limiter
 from praw.exceptions import RedditAPIException
 from prawcore import OAuthException
+from requests.adapters import HTTPAdapter
 from args import get_args
 
+USER_AGENT = "r/Cooking Stats Bot by u/96dpi"
+# concurrent scanners share one HTTP session, so it needs enough pooled connections for all of them
+HTTP_POOL_SIZE = 32
+# weight of the latest runtime in `Scanner.avg_runtime_seconds`
+RUNTIME_AVG_ALPHA = 0.3
+
+reddit_sessions = {}
+reddit_sessions_lock = threading.Lock()
+# the HTTP session behind each Reddit session, closed on exit so a cassette being recorded is complete
+http_sessions = []
+
 
 def sys_exit():
     try:
@@ -14,6 +29,59 @@ def sys_exit():
         os.system(exit(130))
 
 
+def build_http_session(bot_name: str) -> requests.Session:
+    """Returns the HTTP session a bot account talks to Reddit through.
+
+    With `--record` it also writes every exchange to a cassette, with `--replay` it answers from one, see `cassette`.
+    """
+    args = get_args()
+    if args.replay is not None:
+        import cassette
+        http_session = cassette.ReplaySession(cassette.get_cassette_path(args.replay, bot_name), args.replay_speed)
+    elif args.record is not None:
+        import cassette
+        http_session = cassette.RecordingSession(cassette.get_cassette_path(args.record, bot_name))
+    else:
+        http_session = requests.Session()
+    http_sessions.append(http_session)
+    return http_session
+
+
+def close_http_sessions() -> None:
+    for http_session in http_sessions:
+        http_session.close()
+    http_sessions.clear()
+
+
+def log_in(bot_name: str) -> praw.Reddit:
+    http_session = build_http_session(bot_name)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    http_session.mount("https://", adapter)
+    # every request from every scanner goes through the same rate limiter
+    reddit = praw.Reddit(bot_name,
+                         user_agent=USER_AGENT,
+                         requestor_class=rate_limiter.RateLimitedRequestor,
+                         requestor_kwargs={"session": http_session})
+    try:
+        # PRAW logs in lazily, so make one request now to find bad credentials before any scanning starts
+        reddit.user.me()
+    except OAuthException:
+        log.critical("Unable to log in! Verify the credentials in the praw.ini file and try again. Terminating program.")
+        sys_exit()
+    return reddit
+
+
+def get_reddit(bot_name: str) -> praw.Reddit:
+    """Returns the Reddit session of a bot account, logging in the first time it is asked for.
+
+    Every scanner of the same bot shares this one session, its HTTP connection pool, and its access token.
+    """
+    with reddit_sessions_lock:
+        if bot_name not in reddit_sessions:
+            reddit_sessions[bot_name] = log_in(bot_name)
+        return reddit_sessions[bot_name]
+
+
 class Scanner:
     previous_day = get_args().day
 
@@ -22,38 +90,42 @@ class Scanner:
         self.num_posts_to_scan = num_posts_to_scan
         self.interval_seconds = interval_sec
         self.bot_name = bot_name
-        self.sub_instance = self.get_subreddit_instance()
-        self.is_mod = self.check_mod_invite()
-        self.individual_avg_runtime_seconds = []
+        self.reddit = get_reddit(bot_name)
+        # PRAW does not fetch the subreddit until we use it, so this costs no request
+        self.sub_instance = self.reddit.subreddit(self.sub_name)
+        self._is_mod = None
+        # a running average, so it takes the same memory however long the bot runs
+        self.avg_runtime_seconds = None
         self.first_pass_done = False
 
-    def log_in(self):
-        return praw.Reddit(self.bot_name, user_agent="r/Cooking Stats Bot by u/96dpi")
-
-    def get_subreddit_instance(self):
-        try:
-            return self.log_in().subreddit(self.sub_name)
-        except OAuthException:
-            log.critical("Unable to log in! Verify the credentials in the praw.ini file and try again. Terminating program.")
-            sys_exit()
+    @property
+    def is_mod(self) -> bool:
+        """Whether the bot moderates this subreddit, checked the first time we need to know."""
+        if self._is_mod is None:
+            self._is_mod = self.check_mod_invite()
+        return self._is_mod
 
     def check_mod_invite(self) -> bool:
-        for mod in self.sub_instance.moderator():
+        # `bot_name` is the praw.ini site, which is usually, but not always, named after the account
+        account_name = self.reddit.config.username or self.bot_name
+        for mod in self.sub_instance.moderator(redditor=account_name):
             # check if this bot is already a mod
-            if self.bot_name == mod.name:
+            if account_name.lower() == mod.name.lower():
                 return True
         try:
             # bot is not a mod, but we'll check for pending invites
             self.sub_instance.mod.accept_invite()
-            log.info("Mod invite accepted from r/" + self.sub_name)
+            log.info("Mod invite accepted from r/%s", self.sub_name)
             return True
         except RedditAPIException:
             # bot is not a mod, and there are no pending invites
             return False
 
-    def append_avg_runtime_seconds(self, seconds: float):
-        self.individual_avg_runtime_seconds.append(seconds)
+    def record_runtime_seconds(self, seconds: float):
+        if self.avg_runtime_seconds is None:
+            self.avg_runtime_seconds = seconds
+        else:
+            self.avg_runtime_seconds += RUNTIME_AVG_ALPHA * (seconds - self.avg_runtime_seconds)
 
     def get_avg_runtime_seconds(self) -> float:
-        return 0 if len(self.individual_avg_runtime_seconds) == 0 \
-            else sum(self.individual_avg_runtime_seconds) / len(self.individual_avg_runtime_seconds)
+        return self.avg_runtime_seconds or 0
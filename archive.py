@@ -0,0 +1,183 @@
+import datetime
+import functools
+import gzip
+import json
+import os
+import threading
+import leaderboard
+import storage
+import user_data
+from typing import Dict, List, Optional
+
+ARCHIVE_DIR_NAME = "archive"
+INDEX_FILENAME = "index.json"
+TOTALS_SUFFIX = ".totals.json.gz"
+COMMENTS_SUFFIX = ".comments.json.gz"
+ARCHIVE_VERSION = 1
+# the index keeps this many leaderboard rows of every month, so most top-N queries never open a partition
+INDEX_TOP_N = 100
+# decoded totals partitions kept in memory, sealed months never change so they can be reused as they are. Comments
+# partitions are much larger and are read again every time.
+CACHED_PARTITIONS = 24
+MONTH_FORMAT = "%Y-%m"
+
+index_lock = threading.Lock()
+
+
+def get_month_key(date: datetime.date) -> str:
+    """Returns the partition name of the month `date` falls in, for example "2024-03"."""
+    return date.strftime(MONTH_FORMAT)
+
+
+def get_previous_month_key(today: Optional[datetime.date] = None) -> str:
+    """Returns the partition name of the month before `today`, the month that is sealed at rollover."""
+    today = today or datetime.date.today()
+    return get_month_key(today.replace(day=1) - datetime.timedelta(days=1))
+
+
+def _compress(obj) -> bytes:
+    return gzip.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+
+def _read_partition(path: str, modified_ns: int):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# `modified_ns` is part of the cache key, so a month that is sealed again is read again
+_read_cached_partition = functools.lru_cache(maxsize=CACHED_PARTITIONS)(_read_partition)
+
+
+@functools.lru_cache(maxsize=CACHED_PARTITIONS)
+def _get_rows_by_user(path: str, modified_ns: int) -> Dict[str, list]:
+    return {row[0]: row for row in _read_cached_partition(path, modified_ns)["totals"]}
+
+
+class Archive:
+    """The sealed months of one subreddit, one compressed partition per month.
+
+    At month rollover the month's data is sealed into `<directory>/archive/<sub>/`, after which the live store only
+    holds the current month. Each month has two partitions, so queries only decompress what they need:
+
+    - `<YYYY-MM>.totals.json.gz`: [username, total comments, total score, negative comments] for every user, most
+      comments first, the same rows as `leaderboard.get_totals_array`.
+    - `<YYYY-MM>.comments.json.gz`: the month's {username: {comment ID: score}}.
+
+    `index.json` lists the sealed months with their user, comment and score totals and their `INDEX_TOP_N` top rows.
+    Archives are written by their subreddit's scanner only, but can be read from any thread.
+    """
+
+    def __init__(self, directory: str, sub_name: str):
+        self.sub_name = sub_name
+        self.path = os.path.join(directory, ARCHIVE_DIR_NAME, sub_name)
+        self.index_path = os.path.join(self.path, INDEX_FILENAME)
+
+    def _get_partition_path(self, month: str, suffix: str) -> str:
+        return os.path.join(self.path, month + suffix)
+
+    def _read(self, month: str, suffix: str, reader=_read_partition):
+        path = self._get_partition_path(month, suffix)
+        try:
+            modified_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise KeyError(f"r/{self.sub_name} has no archive for {month}") from None
+        return reader(path, modified_ns)
+
+    def get_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": ARCHIVE_VERSION, "months": {}}
+
+    def seal(self, obj: dict, month: str) -> dict:
+        """Writes one month of data as compressed partitions and adds it to the index.
+
+        Sealing a month again replaces it. Every file is written atomically, and the index last, so a month only shows
+        up in queries once both of its partitions are complete.
+
+        Args:
+          obj: The per-subreddit data object of the month, see `user_data`.
+          month: The partition name, see `get_month_key`.
+
+        Returns:
+          The index entry of the month.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        totals = leaderboard.get_totals_array(obj)
+        comments = {user: dict(comments.items()) for user, comments in obj["users"].items()}
+        storage.write_atomically(self._get_partition_path(month, TOTALS_SUFFIX),
+                                 _compress({"version": ARCHIVE_VERSION, "month": month, "totals": totals}))
+        storage.write_atomically(self._get_partition_path(month, COMMENTS_SUFFIX),
+                                 _compress({"version": ARCHIVE_VERSION, "month": month, "users": comments}))
+
+        entry = {
+            "users": len(totals),
+            "comments": sum(row[1] for row in totals),
+            "total_score": sum(row[2] for row in totals),
+            "timestamp": obj["timestamp"],
+            "sealed": str(datetime.datetime.utcnow()),
+            "top": totals[:INDEX_TOP_N],
+        }
+        with index_lock:
+            index = self.get_index()
+            index["months"][month] = entry
+            index["months"] = dict(sorted(index["months"].items()))
+            storage.write_atomically(self.index_path, json.dumps(index, separators=(",", ":")))
+        return entry
+
+    def get_months(self) -> List[str]:
+        """Returns every sealed month, oldest first."""
+        return list(self.get_index()["months"])
+
+    def get_month_summary(self, month: str) -> dict:
+        """Returns the index entry of a month, without its top rows."""
+        entry = self.get_index()["months"].get(month)
+        if entry is None:
+            raise KeyError(f"r/{self.sub_name} has no archive for {month}")
+        return {key: value for key, value in entry.items() if key != "top"}
+
+    def get_top(self, month: str, n: int) -> List[list]:
+        """Returns the n users with the most comments in a month, as totals rows.
+
+        Only the index is read when it holds enough rows, which it does for n up to `INDEX_TOP_N`.
+        """
+        entry = self.get_index()["months"].get(month)
+        if entry is None:
+            raise KeyError(f"r/{self.sub_name} has no archive for {month}")
+        if n <= len(entry["top"]) or len(entry["top"]) == entry["users"]:
+            return entry["top"][:n]
+        return self._read(month, TOTALS_SUFFIX, _read_cached_partition)["totals"][:n]
+
+    def get_user_totals(self, user: str, months: Optional[List[str]] = None) -> Dict[str, list]:
+        """Returns {month: [total comments, total score, negative comments]} of one user.
+
+        Args:
+          user: The username.
+          months: The months to look in, every sealed month by default. Only the totals partitions of these months are
+            read, never the comments.
+
+        Returns:
+          An entry for every month the user commented in.
+        """
+        result = {}
+        for month in months if months is not None else self.get_months():
+            row = self._read(month, TOTALS_SUFFIX, _get_rows_by_user).get(user)
+            if row is not None:
+                result[month] = row[1:]
+        return result
+
+    def get_user_comments(self, user: str, month: str) -> Dict[str, int]:
+        """Returns the {comment ID: score} of one user in one month, empty if they did not comment."""
+        return dict(self._read(month, COMMENTS_SUFFIX)["users"].get(user, {}))
+
+    def load_month(self, month: str) -> dict:
+        """Returns a sealed month as a full per-subreddit data object, see `user_data`."""
+        obj = user_data.new_data()
+        obj["timestamp"] = self.get_index()["months"].get(month, {}).get("timestamp", [])
+        table = obj["users"]
+        for user, comments in self._read(month, COMMENTS_SUFFIX)["users"].items():
+            user_index = table.add_user(user)
+            for comment_id, score in comments.items():
+                table.append(user_index, table.add_id(comment_id), score)
+        return obj
@@ -1,7 +1,12 @@
 import argparse
+import functools
 
+DEFAULT_METRICS_PORT = 9180
 
+
+@functools.lru_cache(maxsize=None)
 def get_args():
+    """Parses the command line the first time it is called, every later call returns the same arguments."""
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-de",
@@ -17,16 +22,156 @@ def get_args():
 
     parser.add_argument("-p",
                         "--posts",
-                        help="The number of posts that will be scanned.",
+                        help="The number of posts that will be scanned, for subreddits whose --config does not set it.",
                         choices=range(1, 1001),
                         default=1000,
                         type=int)
 
     parser.add_argument("-i",
                         "--interval",
-                        help="The time between each scan, in seconds",
+                        help="The average time between two scans of a subreddit, in seconds, for subreddits whose "
+                             "--config does not set it. Busy subreddits are scanned more often.",
                         choices=range(1, 21601),
                         default=21600,  # 6 hours
                         type=int)
 
-    return parser.parse_args()
+    parser.add_argument("-c",
+                        "--concurrent",
+                        help="Concurrent Mode, every subreddit is scanned on its own thread and schedule.",
+                        action="store_true")
+
+    parser.add_argument("-s",
+                        "--store",
+                        help="The storage backend for each subreddit's data.",
+                        choices=["json", "sqlite"],
+                        default="sqlite")
+
+    parser.add_argument("-se",
+                        "--serializer",
+                        help="The JSON library for the data files, \"auto\" picks the fastest one installed.",
+                        choices=["auto", "orjson", "msgspec", "json"],
+                        default="auto")
+
+    parser.add_argument("-sp",
+                        "--skip-policy",
+                        help="When to skip fetching the comments of a submission we have already scanned.",
+                        choices=["never", "unchanged"],
+                        default="unchanged")
+
+    parser.add_argument("-sa",
+                        "--skip-max-age",
+                        help="The longest time, in seconds, that an unchanged submission can be skipped.",
+                        default=86400,  # 24 hours
+                        type=int)
+
+    parser.add_argument("-nr",
+                        "--no-refresh",
+                        help="Do not refresh the scores of tracked comments that were not scanned during the pass.",
+                        action="store_true")
+
+    parser.add_argument("-gz",
+                        "--gzip-uploads",
+                        help="Also upload a gzip-compressed copy of every file to the FTP server.",
+                        action="store_true")
+
+    parser.add_argument("-mp",
+                        "--metrics-port",
+                        help=f"The port of the Prometheus metrics endpoint, {DEFAULT_METRICS_PORT} by default, 0 turns "
+                             "it off. Every worker of --coordinator needs its own, so it has no default there.",
+                        type=int)
+
+    parser.add_argument("-mh",
+                        "--metrics-host",
+                        help="The address the metrics endpoint listens on.",
+                        default="127.0.0.1")
+
+    parser.add_argument("-ms",
+                        "--metrics-snapshot",
+                        help="The time between each JSON snapshot of the metrics, in seconds, 0 turns them off.",
+                        default=60,
+                        type=int)
+
+    parser.add_argument("-lr",
+                        "--log-rotate",
+                        help="Start a new debug log when it reaches --log-max-bytes, or every hour or day.",
+                        choices=["size", "hourly", "daily"],
+                        default="size")
+
+    parser.add_argument("-lm",
+                        "--log-max-bytes",
+                        help="The size, in bytes, at which the debug log is rotated.",
+                        default=1048576,  # 1 MiB
+                        type=int)
+
+    parser.add_argument("-lb",
+                        "--log-backups",
+                        help="The number of rotated debug logs to keep.",
+                        default=12,
+                        type=int)
+
+    parser.add_argument("-lj",
+                        "--log-json",
+                        help="Write the debug log as JSON lines instead of plain text.",
+                        action="store_true")
+
+    parser.add_argument("-co",
+                        "--coordinator",
+                        help="Share the subreddits with the other workers that use this lease database, for example "
+                             "json/leases.db. Every worker needs its own --praw-site.")
+
+    parser.add_argument("-ps",
+                        "--praw-site",
+                        help="The praw.ini site this worker logs in with, the bot's name by default.")
+
+    parser.add_argument("-wi",
+                        "--worker-id",
+                        help="The name of this worker in the lease database, its --praw-site by default.")
+
+    parser.add_argument("-le",
+                        "--lease-seconds",
+                        help="How long a worker keeps its subreddits without renewing its leases, in seconds.",
+                        default=120,
+                        type=int)
+
+    parser.add_argument("-cf",
+                        "--config",
+                        help="The file that lists the bot's subreddits and their settings, see statsbot.ini.",
+                        default="statsbot.ini")
+
+    parser.add_argument("-cr",
+                        "--config-reload",
+                        help="How often to check --config for changes, in seconds, 0 only reloads it on SIGHUP.",
+                        default=30,
+                        type=int)
+
+    parser.add_argument("-rc",
+                        "--record",
+                        help="Record every exchange with Reddit to a cassette per bot account in this directory.")
+
+    parser.add_argument("-rp",
+                        "--replay",
+                        help="Answer every Reddit request from the cassettes in this directory, recorded with "
+                             "--record, instead of Reddit.")
+
+    parser.add_argument("-rs",
+                        "--replay-speed",
+                        help="How many times faster than real time --replay runs, including Reddit's latencies and "
+                             "rate limit waits.",
+                        default=1.0,
+                        type=float)
+
+    parser.add_argument("-tc",
+                        "--top-users-capacity",
+                        help="Rank the users for flair from a summary of the top users with this many counters, "
+                             "updated after every pass, instead of totals of every user, see heavy_hitters.py. 0 uses "
+                             "exact totals.",
+                        default=0,
+                        type=int)
+
+    args = parser.parse_args()
+    if args.metrics_port is None:
+        if args.coordinator is not None:
+            # the workers run on one machine, a shared default would leave all but the first without metrics
+            parser.error("--coordinator needs a --metrics-port for each worker, or 0 to turn the endpoint off")
+        args.metrics_port = DEFAULT_METRICS_PORT
+    return args
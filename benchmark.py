@@ -0,0 +1,253 @@
+"""Offline benchmarks for the scanner, with no Reddit account and no network.
+
+Every stage runs against `fake_reddit`, an in-process stand-in for PRAW, on synthetic data or on a seed file like
+`json/test.json`. For each stage we report the wall-clock time, the throughput, the number of requests the stage would
+have sent to Reddit, and the peak memory allocated by Python while it ran. Run it before deploying and compare the
+numbers with the previous run, for example:
+
+    python benchmark.py --users 20000 --comments-per-user 4 --posts 1000
+    python benchmark.py --seed-file json/test.json --json bench_output.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from typing import Callable
+
+
+def get_benchmark_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a synthetic fake-Reddit backend.")
+    parser.add_argument("--users", help="The number of synthetic users.", default=10000, type=int)
+    parser.add_argument("--comments-per-user", help="The average number of comments per user.", default=2, type=int)
+    parser.add_argument("--posts", help="The number of hot posts the comments are spread over.", default=1000,
+                        type=int)
+    parser.add_argument("--seed-file", help="Use the users and comments of this data file instead of synthetic ones.")
+    parser.add_argument("--changed", help="The fraction of scores that change between two passes.", default=0.05,
+                        type=float)
+    parser.add_argument("--latency", help="Simulated seconds per Reddit request.", default=0.0, type=float)
+    parser.add_argument("--top-users-capacity", help="The counters of the approximate top users stage.", default=1000,
+                        type=int)
+    parser.add_argument("--random-seed", help="Seed for the synthetic data.", default=1, type=int)
+    parser.add_argument("--no-memory", help="Do not trace memory, which makes the timings more accurate.",
+                        action="store_true")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    return parser.parse_args()
+
+
+# parse our own arguments before importing the bot, which parses `sys.argv` with its own parser at import time
+BENCHMARK_ARGS = get_benchmark_args()
+sys.argv = sys.argv[:1]
+
+import fake_reddit  # noqa: E402
+import flair_sync  # noqa: E402
+import flair_templates  # noqa: E402
+import ftp  # noqa: E402
+import heavy_hitters  # noqa: E402
+import leaderboard  # noqa: E402
+import main  # noqa: E402
+import score_refresh  # noqa: E402
+import storage  # noqa: E402
+import submission_cache  # noqa: E402
+import user_data  # noqa: E402
+import web_deltas  # noqa: E402
+import web_leaderboard  # noqa: E402
+
+SUB_NAME = "benchmark"
+
+
+class Benchmark:
+    def __init__(self, reddit: fake_reddit.FakeReddit, trace_memory: bool):
+        self.reddit = reddit
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, stage: str, items: Callable[[], int], func: Callable[[], None]) -> None:
+        """Runs one stage and records its time, throughput, simulated requests and peak memory.
+
+        Args:
+          stage: The name of the stage.
+          items: Called after the stage, returns the number of items it processed.
+          func: The stage itself.
+        """
+        requests_before = self.reddit.requests
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        peak_mib = None
+        if self.trace_memory:
+            peak_mib = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+
+        count = items()
+        self.results.append({
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "items": count,
+            "items_per_sec": round(count / seconds) if seconds > 0 else None,
+            "requests": self.reddit.requests - requests_before,
+            "peak_mib": None if peak_mib is None else round(peak_mib, 2),
+        })
+
+    def print_table(self) -> None:
+        print(f"{'stage':<42}{'seconds':>10}{'items':>10}{'items/s':>12}{'requests':>10}{'peak MiB':>10}")
+        for result in self.results:
+            peak = "-" if result["peak_mib"] is None else f"{result['peak_mib']:.2f}"
+            per_sec = "-" if result["items_per_sec"] is None else str(result["items_per_sec"])
+            print(f"{result['stage']:<42}{result['seconds']:>10.4f}{result['items']:>10}{per_sec:>12}"
+                  f"{result['requests']:>10}{peak:>10}")
+        for result in self.results:
+            if "accuracy" in result:
+                print(f"{result['stage']}: " + ", ".join(f"{key} {value}" for key, value in result["accuracy"].items()))
+
+
+def count_comments(obj: dict) -> int:
+    return sum(len(user_data.get_comments(obj, user)) for user in obj["users"])
+
+
+def main_benchmark(args) -> Benchmark:
+    rng = random.Random(args.random_seed)
+    if args.seed_file:
+        comments_by_user = fake_reddit.load_comments(args.seed_file)
+    else:
+        comments_by_user = fake_reddit.generate_comments(args.users, args.comments_per_user, rng)
+
+    reddit = fake_reddit.FakeReddit(args.latency)
+    subreddit = reddit.add_subreddit(SUB_NAME, comments_by_user, args.posts, rng)
+    scanner = types.SimpleNamespace(sub_name=SUB_NAME, sub_instance=subreddit, num_posts_to_scan=args.posts,
+                                    reddit=reddit)
+    bench = Benchmark(reddit, not args.no_memory)
+    directory = tempfile.mkdtemp(prefix="statsbot-benchmark-")
+    ftp.LOCAL_WEB_DIR = os.path.join(directory, "web") + os.sep
+    obj = user_data.new_data()
+    state = {"changes": {}}
+
+    def scan(policy: str) -> Callable[[], None]:
+        def run():
+            state["changes"] = {}
+            cache = submission_cache.SubmissionCache(directory, SUB_NAME, policy, max_age_sec=86400)
+            main.scan_submissions(scanner, obj, state["changes"], cache, set())
+            cache.save(prune=True)
+        return run
+
+    bench.run("scan, first pass", lambda: count_comments(obj), scan("never"))
+    capacity = args.top_users_capacity
+    top_users = heavy_hitters.TopUsers(directory, SUB_NAME, capacity)
+    bench.run(f"top users summary, first pass ({capacity} counters)", lambda: count_comments(obj),
+              lambda: top_users.update(obj["users"]))
+    bench.run("persist sqlite, first save", lambda: len(state["changes"]),
+              lambda: save_store("sqlite", directory, obj, state["changes"]))
+    bench.run("persist json, full rewrite", lambda: count_comments(obj),
+              lambda: save_store("json", directory, obj, state["changes"]))
+
+    reddit.change_scores(args.changed, rng)
+    bench.run(f"scan, second pass ({args.changed:.0%} changed)", lambda: count_comments(obj), scan("never"))
+    bench.run("persist sqlite, changed comments only", lambda: len(state["changes"]),
+              lambda: save_store("sqlite", directory, obj, state["changes"]))
+
+    reddit.change_scores(args.changed, rng)
+    bench.run("scan, watermark cache", lambda: len(subreddit.submissions), scan("unchanged"))
+    bench.run("score refresh, 100 per request", lambda: count_comments(obj),
+              lambda: score_refresh.refresh_scores(reddit, obj, state["changes"], set(), threading.Event()))
+    rescored = len(obj["users"].rescored)
+    bench.run("top users summary, rescored comments", lambda: rescored, lambda: top_users.update(obj["users"]))
+
+    comments = list(reddit.comments.values())
+    bench.run("update_existing", lambda: len(comments),
+              lambda: [main.update_existing(obj, comment, comment.author) for comment in comments])
+    bench.run("get_totals_array", lambda: len(obj["users"]), lambda: main.get_totals_array(obj))
+    bench.run("top 1% and get_ratios_array", lambda: len(obj["users"]),
+              lambda: main.get_ratios_array(leaderboard.get_top_totals(obj, main.TOP_USERS_FRACTION),
+                                            len(obj["users"])))
+    bench.run(f"top 1% from the summary ({capacity} counters)", lambda: len(obj["users"]),
+              lambda: main.get_ratios_array(heavy_hitters.get_top_totals(obj, main.TOP_USERS_FRACTION,
+                                                                         top_users.summary), len(obj["users"])))
+    bench.results[-1]["accuracy"] = compare_top_users(obj, top_users)
+    bench.run("leaderboard stats", lambda: len(obj["users"]), lambda: leaderboard.get_stats(obj))
+    bench.run("load sqlite", lambda: len(obj["users"]), lambda: load_store("sqlite", directory))
+    bench.run("load json", lambda: len(obj["users"]), lambda: load_store("json", directory))
+    bench.run("web export, new base", lambda: len(obj["users"]),
+              lambda: web_deltas.publish(ftp.LOCAL_WEB_DIR, SUB_NAME, obj, set(), rebase=True))
+    changed_users = {user for user, _ in state["changes"]}
+    bench.run("web export, delta", lambda: len(changed_users),
+              lambda: web_deltas.publish(ftp.LOCAL_WEB_DIR, SUB_NAME, obj, changed_users))
+    bench.run("web export, leaderboard pages", lambda: len(obj["users"]),
+              lambda: web_leaderboard.publish(ftp.LOCAL_WEB_DIR, SUB_NAME, obj))
+
+    top_users = [row[main.NAME_IDX] for row in main.get_ratios_array(
+        leaderboard.get_top_totals(obj, main.TOP_USERS_FRACTION), len(obj["users"]))]
+    # the same template lookup and flair as `main.edit_flair`
+    january, february = (
+        flair_sync.get_template_flair(flair_templates.TEMPLATE_CACHE.get_month_template(subreddit, month))
+        for month in ("January", "February"))
+    bench.run("flair sync, empty subreddit", lambda: len(top_users),
+              lambda: flair_sync.sync_flair(subreddit, top_users, january, True, False))
+    next_month = top_users[len(top_users) // 2:] + ["newcomer"]
+    bench.run("flair sync, next month", lambda: len(next_month),
+              lambda: flair_sync.sync_flair(subreddit, next_month, february, True, False))
+
+    shutil.rmtree(directory)
+    return bench
+
+
+def compare_top_users(obj: dict, top_users: heavy_hitters.TopUsers) -> dict:
+    """Compares the top 1% picked by a `heavy_hitters` summary with the exact one.
+
+    Users tied with the last exact top user are as much a top user as they are, so `precision` counts a picked user as
+    right when they have at least that many comments. `flair_recall` is the share of the exact flair users that the
+    summary also gives flair to. `score_error` is the largest difference between the score of a picked user in the
+    summary and their exact score, next to the bound of `heavy_hitters.get_top_totals`. The sizes put the saved summary
+    next to the table that the bot keeps in memory during a pass anyway.
+    """
+    exact = leaderboard.get_totals_array(obj)
+    k = math.ceil(len(exact) * main.TOP_USERS_FRACTION)
+    picked = heavy_hitters.get_top_totals(obj, main.TOP_USERS_FRACTION, top_users.summary)
+    if not picked:
+        return {}
+    totals = {row[main.NAME_IDX]: row for row in exact}
+    last_count = exact[k - 1][main.TOTAL_COMMENTS_IDX]
+    exact_flair = {row[main.NAME_IDX] for row in main.get_ratios_array(exact[:k], len(exact))}
+    picked_flair = {row[main.NAME_IDX] for row in main.get_ratios_array(picked, len(exact))}
+    table = obj["users"]
+    table_bytes = sum(sys.getsizeof(getattr(table, slot)) for slot in table.__slots__) \
+        + sum(sys.getsizeof(name) for name in table.names)
+
+    return {
+        "precision": round(sum(1 for row in picked
+                               if totals[row[main.NAME_IDX]][main.TOTAL_COMMENTS_IDX] >= last_count) / k, 4),
+        "flair_recall": round(len(exact_flair & picked_flair) / len(exact_flair), 4) if exact_flair else 1.0,
+        "summary_max_error": top_users.summary.max_error,
+        "score_error": max(abs(row[main.TOTAL_SCORE_IDX] - totals[row[main.NAME_IDX]][main.TOTAL_SCORE_IDX])
+                           for row in picked),
+        "score_error_bound": top_users.summary.max_error * top_users.summary.max_score,
+        "count_error_bound": count_comments(obj) // top_users.capacity,
+        "summary_kib": round(os.path.getsize(top_users.path) / 1024, 1),
+        "table_kib": round(table_bytes / 1024, 1),
+    }
+
+
+def save_store(backend: str, directory: str, obj: dict, changes: storage.Changes) -> None:
+    with storage.open_store(backend, directory, SUB_NAME) as store:
+        store.save(obj, changes)
+
+
+def load_store(backend: str, directory: str) -> None:
+    with storage.open_store(backend, directory, SUB_NAME) as store:
+        store.load()
+
+
+if __name__ == "__main__":
+    benchmark = main_benchmark(BENCHMARK_ARGS)
+    benchmark.print_table()
+    if BENCHMARK_ARGS.json:
+        with open(BENCHMARK_ARGS.json, "w") as f:
+            json.dump(benchmark.results, f, indent=2)
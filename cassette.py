@@ -0,0 +1,210 @@
+import base64
+import collections
+import gzip
+import json
+import os
+import threading
+import time
+import log
+import requests
+from requests.structures import CaseInsensitiveDict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+CASSETTE_EXTENSION = ".cassette.jsonl.gz"
+CASSETTE_VERSION = 1
+# never written to a cassette, their values are replaced with REDACTED
+SECRET_FIELDS = {"password", "username", "client_secret", "access_token", "refresh_token", "code"}
+REDACTED = "REDACTED"
+# these describe the bytes on the wire, which a cassette does not keep, or hold our session cookie
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+# the headers that tell a client how long to wait, divided by the replay speed so the pacing keeps up with it
+TIMING_HEADERS = ("x-ratelimit-reset", "retry-after")
+
+
+def get_cassette_path(directory: str, bot_name: str) -> str:
+    """Returns the cassette of one Reddit session, every bot account gets its own."""
+    return os.path.join(directory, bot_name + CASSETTE_EXTENSION)
+
+
+def _redact(pairs) -> list:
+    if pairs is None:
+        return []
+    items = pairs.items() if isinstance(pairs, dict) else pairs
+    return sorted([key, REDACTED if key in SECRET_FIELDS else str(value)] for key, value in items)
+
+
+def get_request_key(method: str, url: str, params=None, data=None, json_body=None) -> str:
+    """Returns what identifies a request in a cassette: its method, path, query and form fields, without secrets.
+
+    The host is left out, since Reddit answers the same request on www and oauth.
+    """
+    key = [method.upper(), urlsplit(url).path, _redact(params), _redact(data)]
+    if json_body is not None:
+        key.append(json.dumps(json_body, sort_keys=True))
+    return json.dumps(key)
+
+
+def _redact_body(content: bytes) -> bytes:
+    # the access token response, the only one with a secret in it, is a flat JSON object
+    if b"access_token" not in content:
+        return content
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return content
+    if isinstance(body, dict):
+        body = {key: REDACTED if key in SECRET_FIELDS else value for key, value in body.items()}
+    return json.dumps(body).encode("utf-8")
+
+
+def _dumps(entry: dict) -> str:
+    return json.dumps(entry, separators=(",", ":"))
+
+
+def _scale(seconds: str, speed: float) -> str:
+    # prawcore only accepts whole seconds in X-Ratelimit-Reset, so whole seconds stay whole, and at least 1, since a
+    # window that resets right away looks like a brand new one to `rate_limiter`
+    try:
+        return str(max(min(int(seconds), 1), round(int(seconds) / speed)))
+    except ValueError:
+        pass
+    try:
+        return str(float(seconds) / speed)
+    except ValueError:
+        return seconds
+
+
+class RecordingSession(requests.Session):
+    """A `requests.Session` that writes every exchange with Reddit to a cassette, see `ReplaySession`.
+
+    Each line of the gzipped cassette is one response: the request it answers, see `get_request_key`, its status,
+    headers and body, how long Reddit took to answer, and when it was sent since recording started. Credentials and
+    access tokens are redacted. Exchanges are written as they happen, the cassette is complete once `close` is called.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._file.write(json.dumps({"version": CASSETTE_VERSION, "recorded_at": time.time()}) + "\n")
+        log.info("Recording Reddit traffic to %s", path)
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        sent_at = time.monotonic()
+        response = super().request(method, url, params=params, data=data, json=json, **kwargs)
+        entry = {
+            "key": get_request_key(method, url, params, data, json),
+            "offset": round(sent_at - self._started_at, 4),
+            "elapsed": round(time.monotonic() - sent_at, 4),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: value for name, value in response.headers.items()
+                        if name.lower() not in DROPPED_HEADERS},
+        }
+        content = _redact_body(response.content)
+        try:
+            entry["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_base64"] = base64.b64encode(content).decode("ascii")
+
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(_dumps(entry) + "\n")
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+        super().close()
+
+
+class ReplaySession(requests.Session):
+    """A `requests.Session` that answers from a cassette of `RecordingSession` instead of Reddit.
+
+    A request gets the next recorded response to the same request, in the order they were recorded, so a listing that
+    was fetched once per pass changes from one pass to the next just like it did. Once a request has used up its
+    responses, the last one is repeated. Each answer takes as long as Reddit took, divided by `speed`, and rate limit
+    and 429 responses come back exactly as recorded, with their waiting times divided by `speed` as well. A request
+    that was never recorded fails like a connection error.
+
+    Args:
+      path: The cassette.
+      speed: How many times faster than real time to replay, 1 replays the recorded latencies as they were.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        super().__init__()
+        if speed <= 0:
+            raise ValueError("The replay speed must be greater than 0")
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._responses: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+        self._last: Dict[str, dict] = {}
+        self.replayed = 0
+        self.missed = 0
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"{path} is a version {header.get('version')} cassette")
+            count = 0
+            for line in f:
+                entry = json.loads(line)
+                self._responses[entry["key"]].append(entry)
+                count += 1
+        log.info("Replaying %s Reddit responses from %s at %sx speed", count, path, speed)
+
+    def _next_entry(self, key: str) -> Optional[dict]:
+        with self._lock:
+            queue = self._responses.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+                self.replayed += 1
+                return self._last[key]
+            entry = self._last.get(key)
+            if entry is None:
+                self.missed += 1
+            else:
+                self.replayed += 1
+            return entry
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        key = get_request_key(method, url, params, data, json)
+        entry = self._next_entry(key)
+        if entry is None:
+            log.warn("%s has no recorded response for %s %s", self.path, method.upper(), url)
+            raise requests.ConnectionError(f"No recorded response for {method.upper()} {url}")
+
+        time.sleep(entry["elapsed"] / self.speed)
+        return self._build_response(entry, url)
+
+    def close(self) -> None:
+        log.info("Replayed %s Reddit responses from %s, %s requests were not recorded", self.replayed, self.path,
+                 self.missed)
+        super().close()
+
+    def _build_response(self, entry: dict, url: str) -> requests.Response:
+        if "body" in entry:
+            content = entry["body"].encode("utf-8")
+        else:
+            content = base64.b64decode(entry["body_base64"])
+
+        headers = CaseInsensitiveDict(entry["headers"])
+        for name in TIMING_HEADERS:
+            if name in headers:
+                headers[name] = _scale(headers[name], self.speed)
+        headers["content-length"] = str(len(content))
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = headers
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = content
+        return response
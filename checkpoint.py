@@ -0,0 +1,119 @@
+import datetime
+import os
+import time
+import log
+import serialization
+import storage
+from typing import Dict, Set
+
+CHECKPOINT_EXTENSION = ".checkpoint.json"
+CHECKPOINT_VERSION = 1
+# the longest a scan runs without saving its progress, every save rewrites the pending changes of the whole pass
+CHECKPOINT_INTERVAL_SEC = 60
+MONTH_FORMAT = "%Y-%m"
+
+
+class Checkpoint:
+    """The progress of one pass over a subreddit, saved while it runs so a crash does not lose it.
+
+    `<sub>.checkpoint.json` holds the submissions the pass has finished, their submission cache entries, the comment
+    IDs it scanned, and the changes it has not saved to the store yet. It is rewritten atomically at most every
+    `CHECKPOINT_INTERVAL_SEC`, and deleted once a pass has saved everything and visited every hot submission.
+
+    The next pass of the subreddit, in this process or after a restart, first applies the pending changes, then skips
+    the submissions that are already done, as long as the pass it resumes started less than `max_age_sec` ago. After
+    that, the whole hot list is due anyway. A checkpoint of another month is thrown away, since its changes belong to
+    data that has been archived.
+    """
+
+    def __init__(self, directory: str, sub_name: str, max_age_sec: float):
+        self.path = os.path.join(directory, sub_name + CHECKPOINT_EXTENSION)
+        self.sub_name = sub_name
+        self.max_age_sec = max_age_sec
+        self.started_at = time.time()
+        self.done: Set[str] = set()
+        self.cache_entries: Dict[str, dict] = {}
+        self.last_saved = time.monotonic()
+
+    def resume(self, obj: dict, changes: dict, scanned_ids: Set[str], cache) -> int:
+        """Applies a saved checkpoint to a pass that is about to start.
+
+        Args:
+          obj: The data object of the subreddit, the pending changes are applied to it.
+          changes: The change set of the new pass, the pending changes are added to it so they are saved this time.
+          scanned_ids: Filled with the comment IDs the checkpointed pass scanned.
+          cache: The submission cache, given back the entries of the finished submissions.
+
+        Returns:
+          The number of submissions this pass can skip.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                saved = serialization.loads(f.read())
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            log.warn("%s: Unable to read %s, starting r/%s from scratch", e, self.path, self.sub_name)
+            return 0
+
+        if saved.get("version") != CHECKPOINT_VERSION or saved["month"] != _get_month():
+            log.info("Discarding the checkpoint of r/%s from %s", self.sub_name, saved.get("month"))
+            self.discard()
+            return 0
+
+        for user, comment_id, score in saved["changes"]:
+            obj["users"].set_score(user, comment_id, score)
+            changes[(user, comment_id)] = score
+        log.info("Restored %s unsaved changes of r/%s", len(saved["changes"]), self.sub_name)
+
+        if time.time() - saved["started_at"] >= self.max_age_sec:
+            return 0
+        self.started_at = saved["started_at"]
+        self.done = set(saved["done"])
+        self.cache_entries = saved["cache"]
+        cache.restore(self.cache_entries)
+        scanned_ids.update(saved["scanned_ids"])
+        log.info("Resuming r/%s after %s finished submissions", self.sub_name, len(self.done))
+        return len(self.done)
+
+    def record(self, submission_id: str, cache_entry: dict) -> None:
+        """Marks a submission as finished, once all of its comments are in `changes`."""
+        self.done.add(submission_id)
+        self.cache_entries[submission_id] = cache_entry
+
+    def save_if_due(self, changes: dict, scanned_ids: Set[str]) -> None:
+        if time.monotonic() - self.last_saved >= CHECKPOINT_INTERVAL_SEC:
+            self.save(changes, scanned_ids)
+
+    def save(self, changes: dict, scanned_ids: Set[str]) -> None:
+        """Writes the progress so far.
+
+        Args:
+          changes: The changes that are not in the store yet, empty right after the store was saved.
+          scanned_ids: The comment IDs scanned so far.
+        """
+        saved = {
+            "version": CHECKPOINT_VERSION,
+            "month": _get_month(),
+            "started_at": self.started_at,
+            "done": sorted(self.done),
+            "cache": self.cache_entries,
+            "scanned_ids": sorted(scanned_ids),
+            "changes": [[user, comment_id, score] for (user, comment_id), score in changes.items()],
+        }
+        try:
+            storage.write_atomically(self.path, serialization.dumps(saved))
+        except OSError as e:
+            log.error("%s: Unable to write the checkpoint of r/%s", e, self.sub_name)
+        self.last_saved = time.monotonic()
+
+    def discard(self) -> None:
+        """Deletes the checkpoint, once the pass it belongs to is saved and complete."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _get_month() -> str:
+    return datetime.date.today().strftime(MONTH_FORMAT)
@@ -0,0 +1,168 @@
+import configparser
+import os
+import threading
+import log
+from args import get_args
+from typing import Callable, Dict, List, Optional
+
+BOT_SECTION = "bot"
+# every other section whose name starts with this is a subreddit, for example [r/Cooking]
+SUBREDDIT_PREFIX = "r/"
+DEFAULT_BOT_NAME = "CookingStatsBot"
+# the same limits as --posts and --interval
+MAX_POSTS = 1000
+MAX_INTERVAL_SEC = 21600
+
+
+class SubredditSettings:
+    """How one subreddit is scanned: how many hot posts, and how often."""
+
+    __slots__ = ["name", "posts", "interval_sec"]
+
+    def __init__(self, name: str, posts: int, interval_sec: int):
+        self.name = name
+        self.posts = posts
+        self.interval_sec = interval_sec
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SubredditSettings) \
+            and (self.name, self.posts, self.interval_sec) == (other.name, other.posts, other.interval_sec)
+
+    def __repr__(self) -> str:
+        return f"SubredditSettings({self.name!r}, posts={self.posts}, interval_sec={self.interval_sec})"
+
+
+class BotConfig:
+    """The bot account and the subreddits it scans, as read from the `--config` file."""
+
+    def __init__(self, bot_name: str, subreddits: Dict[str, SubredditSettings], mtime: float):
+        self.bot_name = bot_name
+        self.subreddits = subreddits
+        # when the file was last changed, so a reload can tell whether it needs to read it again
+        self.mtime = mtime
+
+    def get_sub_names(self) -> List[str]:
+        return list(self.subreddits)
+
+
+def parse(path: str, default_posts: int, default_interval_sec: int) -> BotConfig:
+    """Reads a config file, see `statsbot.ini`.
+
+    The [bot] section holds the bot's name, its praw.ini site, and the posts and interval of every subreddit that does
+    not set its own. Each [r/<name>] section adds a subreddit, and can set `posts` and `interval`, in seconds.
+
+    Raises:
+      OSError: The file cannot be read.
+      configparser.Error: The file is not an INI file.
+      ValueError: A setting is not a whole number, or out of range.
+    """
+    parser = configparser.ConfigParser()
+    with open(path, "r") as f:
+        parser.read_file(f)
+    mtime = os.path.getmtime(path)
+
+    bot_name = parser.get(BOT_SECTION, "name", fallback=DEFAULT_BOT_NAME)
+    posts = parser.getint(BOT_SECTION, "posts", fallback=default_posts)
+    interval_sec = parser.getint(BOT_SECTION, "interval", fallback=default_interval_sec)
+    subreddits = {}
+    for section in parser.sections():
+        if not section.startswith(SUBREDDIT_PREFIX):
+            continue
+        settings = SubredditSettings(section[len(SUBREDDIT_PREFIX):],
+                                     parser.getint(section, "posts", fallback=posts),
+                                     parser.getint(section, "interval", fallback=interval_sec))
+        if not settings.name or not 1 <= settings.posts <= MAX_POSTS \
+                or not 1 <= settings.interval_sec <= MAX_INTERVAL_SEC:
+            raise ValueError(f"{path}: invalid settings in [{section}]: {settings}")
+        subreddits[settings.name] = settings
+
+    return BotConfig(bot_name, subreddits, mtime)
+
+
+_config: Optional[BotConfig] = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> BotConfig:
+    """Returns the current configuration, reading `--config` the first time it is asked for."""
+    global _config
+    with _config_lock:
+        if _config is None:
+            args = get_args()
+            _config = parse(args.config, args.posts, args.interval)
+        return _config
+
+
+def get_settings(sub_name: str) -> SubredditSettings:
+    """Returns the settings of a subreddit, or the defaults for one the config does not list."""
+    settings = get_config().subreddits.get(sub_name)
+    if settings is None:
+        args = get_args()
+        settings = SubredditSettings(sub_name, args.posts, args.interval)
+    return settings
+
+
+def reload(force: bool) -> Optional[BotConfig]:
+    """Reads `--config` again if it changed, or always with `force`, and returns the new configuration.
+
+    Returns None when nothing changed, or when the file cannot be read, in which case the current configuration stays
+    as it is.
+    """
+    global _config
+    current = get_config()
+    args = get_args()
+    try:
+        if not force and os.path.getmtime(args.config) == current.mtime:
+            return None
+        new = parse(args.config, args.posts, args.interval)
+    except (OSError, ValueError, configparser.Error) as e:
+        log.error("%s: Unable to reload %s, keeping the current config", e, args.config)
+        return None
+
+    with _config_lock:
+        _config = new
+    if new.bot_name == current.bot_name and new.subreddits == current.subreddits:
+        return None
+    return new
+
+
+class ConfigWatcher(threading.Thread):
+    """Reloads the configuration when its file changes, or when `request_reload` is called, for example on SIGHUP.
+
+    Args:
+      poll_sec: How often to check the file's modification time, 0 to only reload on request.
+      on_change: Called with the old and the new configuration after a reload that changed something.
+    """
+
+    def __init__(self, poll_sec: float, on_change: Callable[[BotConfig, BotConfig], None]):
+        super().__init__(name="config-watcher", daemon=True)
+        self.poll_sec = poll_sec
+        self.on_change = on_change
+        self._wake_event = threading.Event()
+        self._reload_requested = False
+        self._stopping = False
+
+    def request_reload(self) -> None:
+        """Reloads the file right away, even if it looks unchanged. Safe to call from a signal handler."""
+        self._reload_requested = True
+        self._wake_event.set()
+
+    def run(self) -> None:
+        while True:
+            self._wake_event.wait(self.poll_sec or None)
+            self._wake_event.clear()
+            if self._stopping:
+                return
+            force = self._reload_requested
+            self._reload_requested = False
+            old = get_config()
+            new = reload(force)
+            if new is not None:
+                try:
+                    self.on_change(old, new)
+                except (Exception,) as e:
+                    log.error("%s: Unable to apply the new config", e)
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake_event.set()
@@ -0,0 +1,175 @@
+import math
+import sqlite3
+import threading
+import time
+import log
+from typing import Callable, Iterable, Set
+
+# how long a worker owns its subreddits without renewing, a worker that crashes loses them after this long
+DEFAULT_LEASE_SEC = 120
+# leases are renewed this many times per lease, so one slow renewal does not lose them
+RENEWALS_PER_LEASE = 3
+# SQLite waits this long for another worker's transaction before giving up
+BUSY_TIMEOUT_SEC = 30
+
+
+def _placeholders(values: list) -> str:
+    # `IN ()` is a syntax error, and matches nothing anyway
+    return ",".join("?" * len(values)) or "NULL"
+
+
+class LeaseCoordinator:
+    """Shares the subreddits out between worker processes, through leases in a SQLite file they all open.
+
+    Every worker calls `sync` regularly. It renews the worker's own leases and heartbeat, then takes over subreddits
+    that nobody holds, including the ones of a worker whose leases ran out, until the worker has its fair share: the
+    number of subreddits divided by the number of live workers, rounded up. A worker with more than its share, for
+    example after another one has joined, gives back subreddits it is not scanning right now. Each sync is a single
+    `BEGIN IMMEDIATE` transaction, so two workers never take the same subreddit.
+
+    The leases only mean something on a clock that every worker shares, so the workers must run on one machine.
+    """
+
+    def __init__(self, path: str, worker_id: str, lease_sec: float = DEFAULT_LEASE_SEC):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_sec = lease_sec
+        # `holds` is asked from the scanner threads, `sync` from the lease keeper
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SEC, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS leases ("
+                                "sub TEXT PRIMARY KEY, "
+                                "owner TEXT, "
+                                "expires_at REAL NOT NULL DEFAULT 0)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+
+    def _transaction(self, work: Callable[[float], object]):
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(time.time())
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            return result
+
+    def register(self, sub_names: Iterable[str]) -> None:
+        """Adds subreddits to the pool, without a worker yet. Subreddits that are already in it are left alone."""
+        self._transaction(lambda now: self.connection.executemany(
+            "INSERT OR IGNORE INTO leases (sub) VALUES (?)", ((name,) for name in sub_names)))
+
+    def unregister(self, sub_names: Iterable[str]) -> None:
+        """Takes subreddits out of the pool. Their workers give them up on their next `sync`."""
+        self._transaction(lambda now: self.connection.executemany(
+            "DELETE FROM leases WHERE sub = ?", ((name,) for name in sub_names)))
+
+    def sync(self, busy: Set[str] = frozenset()) -> Set[str]:
+        """Renews this worker's leases, takes or gives back subreddits to reach its fair share, and returns them.
+
+        Args:
+          busy: Subreddits this worker is scanning right now, which it keeps even above its share.
+
+        Returns:
+          The names of every subreddit this worker now holds a lease on.
+        """
+        return self._transaction(lambda now: self._sync(now, busy))
+
+    def _sync(self, now: float, busy: Set[str]) -> Set[str]:
+        execute = self.connection.execute
+        expires_at = now + self.lease_sec
+        execute("INSERT INTO workers (id, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at", (self.worker_id, now))
+        execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - self.lease_sec,))
+        live_workers = execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+        total_subs = execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+        share = math.ceil(total_subs / live_workers)
+
+        execute("UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at >= ?",
+                (expires_at, self.worker_id, now))
+        owned = [row[0] for row in execute("SELECT sub FROM leases WHERE owner = ? AND expires_at >= ? ORDER BY sub",
+                                           (self.worker_id, now))]
+
+        if len(owned) > share:
+            surplus = [name for name in owned if name not in busy][:len(owned) - share]
+            execute("UPDATE leases SET owner = NULL, expires_at = 0 WHERE sub IN (%s)" % _placeholders(surplus),
+                    surplus)
+            owned = [name for name in owned if name not in surplus]
+        elif len(owned) < share:
+            free = [row[0] for row in execute("SELECT sub FROM leases WHERE owner IS NULL OR expires_at < ? "
+                                              "ORDER BY expires_at, sub LIMIT ?", (now, share - len(owned)))]
+            execute("UPDATE leases SET owner = ?, expires_at = ? WHERE sub IN (%s)" % _placeholders(free),
+                    [self.worker_id, expires_at] + free)
+            owned += free
+        return set(owned)
+
+    def holds(self, sub_name: str) -> bool:
+        """Whether this worker's lease on a subreddit is still valid, checked before its data is written."""
+        with self._lock:
+            row = self.connection.execute("SELECT 1 FROM leases WHERE sub = ? AND owner = ? AND expires_at >= ?",
+                                          (sub_name, self.worker_id, time.time())).fetchone()
+        return row is not None
+
+    def release_all(self) -> None:
+        """Gives back every lease of this worker, so the others take its subreddits over right away."""
+        def release(now: float) -> None:
+            self.connection.execute("UPDATE leases SET owner = NULL, expires_at = 0 WHERE owner = ?",
+                                    (self.worker_id,))
+            self.connection.execute("DELETE FROM workers WHERE id = ?", (self.worker_id,))
+        self._transaction(release)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class LeaseKeeper(threading.Thread):
+    """Calls `LeaseCoordinator.sync` a few times per lease, and reports the subreddits that were won or lost.
+
+    Args:
+      coordinator: The coordinator of this worker.
+      get_busy: Returns the subreddits being scanned right now.
+      on_acquired: Called with the names of subreddits this worker just took over.
+      on_released: Called with the names of subreddits it no longer holds.
+    """
+
+    def __init__(self,
+                 coordinator: LeaseCoordinator,
+                 get_busy: Callable[[], Set[str]],
+                 on_acquired: Callable[[Set[str]], None],
+                 on_released: Callable[[Set[str]], None]):
+        super().__init__(name="lease-keeper", daemon=True)
+        self.coordinator = coordinator
+        self.get_busy = get_busy
+        self.on_acquired = on_acquired
+        self.on_released = on_released
+        self.owned: Set[str] = set()
+        self._stop_event = threading.Event()
+
+    def sync(self) -> None:
+        try:
+            owned = self.coordinator.sync(self.get_busy())
+        except sqlite3.Error as e:
+            log.error("%s: Unable to renew the leases of %s", e, self.coordinator.worker_id)
+            return
+
+        acquired = owned - self.owned
+        released = self.owned - owned
+        self.owned = owned
+        if released:
+            log.info("Worker %s released %s", self.coordinator.worker_id, sorted(released))
+            self.on_released(released)
+        if acquired:
+            log.info("Worker %s acquired %s", self.coordinator.worker_id, sorted(acquired))
+            self.on_acquired(acquired)
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.coordinator.lease_sec / RENEWALS_PER_LEASE):
+            self.sync()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.coordinator.release_all()
@@ -0,0 +1,191 @@
+import math
+import random
+import time
+import user_data
+from flair_templates import MONTH_NAMES
+from typing import Dict, Iterator, List, Optional
+
+# Reddit comment IDs are base36 numbers, recent ones are 7 digits long
+FIRST_COMMENT_ID = 36 ** 6 * 20
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+LISTING_PAGE_SIZE = 100
+FLAIR_PAGE_SIZE = 1000
+INFO_BATCH_SIZE = 100
+FLAIR_UPDATE_BATCH_SIZE = 100
+
+
+def to_base36(number: int) -> str:
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(BASE36_DIGITS[remainder])
+    return "".join(reversed(digits)) or "0"
+
+
+class FakeComment:
+    __slots__ = ["id", "author", "score", "distinguished"]
+
+    def __init__(self, comment_id: str, author: str, score: int):
+        self.id = comment_id
+        self.author = author
+        self.score = score
+        self.distinguished = None
+
+
+class FakeCommentForest(list):
+    def replace_more(self, limit: Optional[int] = 32) -> list:
+        return []
+
+
+class FakeSubmission:
+    def __init__(self, reddit: "FakeReddit", submission_id: str, comments: List[FakeComment]):
+        self._reddit = reddit
+        self.id = submission_id
+        self.stickied = False
+        self._comments = comments
+        self.num_comments = len(comments)
+
+    @property
+    def comments(self) -> FakeCommentForest:
+        # like PRAW, the comment tree is fetched the first time it is used
+        self._reddit.request()
+        return FakeCommentForest(self._comments)
+
+
+class FakeFlair:
+    def __init__(self, reddit: "FakeReddit", templates: List[dict]):
+        self._reddit = reddit
+        self._templates = templates
+        self.current = {}
+
+    @property
+    def templates(self) -> Iterator[dict]:
+        self._reddit.request()
+        return iter(self._templates)
+
+    def __call__(self, limit: Optional[int] = None) -> Iterator[dict]:
+        users = list(self.current.items())
+        for start in range(0, len(users), FLAIR_PAGE_SIZE):
+            self._reddit.request()
+            for user, (text, css_class) in users[start:start + FLAIR_PAGE_SIZE]:
+                yield {"user": user, "flair_text": text, "flair_css_class": css_class}
+
+    def set(self, redditor: str, css_class: str = "", flair_template_id: Optional[str] = None,
+            text: Optional[str] = None) -> None:
+        # like PRAW, one request per user, and a template fills in whatever is not given
+        self._reddit.request()
+        template = next((template for template in self._templates if template["id"] == flair_template_id), {})
+        text = text if text is not None else template.get("text") or ""
+        css_class = css_class or template.get("css_class") or ""
+        if text or css_class:
+            self.current[redditor] = (text, css_class)
+        else:
+            self.current.pop(redditor, None)
+
+    def update(self, flair_list: List[dict]) -> List[dict]:
+        for start in range(0, len(flair_list), FLAIR_UPDATE_BATCH_SIZE):
+            self._reddit.request()
+        for item in flair_list:
+            if item["flair_text"] or item["flair_css_class"]:
+                self.current[item["user"]] = (item["flair_text"], item["flair_css_class"])
+            else:
+                self.current.pop(item["user"], None)
+        return [{"ok": True} for _ in flair_list]
+
+
+class FakeSubreddit:
+    def __init__(self, reddit: "FakeReddit", display_name: str, submissions: List[FakeSubmission]):
+        self._reddit = reddit
+        self.display_name = display_name
+        self.submissions = submissions
+        self.flair = FakeFlair(reddit, [{"id": f"template-{month}", "text": month, "css_class": ""}
+                                        for month in MONTH_NAMES])
+
+    def __str__(self) -> str:
+        return self.display_name
+
+    def hot(self, limit: Optional[int] = 100) -> Iterator[FakeSubmission]:
+        submissions = self.submissions[:limit]
+        for start in range(0, len(submissions), LISTING_PAGE_SIZE):
+            self._reddit.request()
+            yield from submissions[start:start + LISTING_PAGE_SIZE]
+
+    def moderator(self, redditor: Optional[str] = None) -> list:
+        self._reddit.request()
+        return []
+
+
+class FakeReddit:
+    """An in-process stand-in for `praw.Reddit`, with just enough of its interface for the scanner.
+
+    Nothing leaves the process. Every call that would be an HTTP request with PRAW is counted in `requests`, and can
+    be slowed down by `latency_sec` to mimic the network.
+    """
+
+    def __init__(self, latency_sec: float = 0.0):
+        self.latency_sec = latency_sec
+        self.requests = 0
+        self.subreddits = {}
+        self.comments = {}
+
+    def request(self) -> None:
+        self.requests += 1
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+
+    def subreddit(self, display_name: str) -> FakeSubreddit:
+        return self.subreddits[display_name.lower()]
+
+    def info(self, fullnames: List[str]) -> Iterator[FakeComment]:
+        for start in range(0, len(fullnames), INFO_BATCH_SIZE):
+            self.request()
+            for fullname in fullnames[start:start + INFO_BATCH_SIZE]:
+                comment = self.comments.get(fullname.split("_", 1)[1])
+                if comment is not None:
+                    yield comment
+
+    def add_subreddit(self, display_name: str, comments_by_user: Dict[str, Dict[str, int]], num_posts: int,
+                      rng: random.Random) -> FakeSubreddit:
+        """Creates a subreddit whose hot list holds every given comment, spread randomly over `num_posts` posts."""
+        posts = [[] for _ in range(num_posts)]
+        for user, comments in comments_by_user.items():
+            for comment_id, score in comments.items():
+                comment = FakeComment(comment_id, user, score)
+                self.comments[comment_id] = comment
+                posts[rng.randrange(num_posts)].append(comment)
+
+        submissions = [FakeSubmission(self, f"p{to_base36(index)}", comments) for index, comments in enumerate(posts)]
+        subreddit = FakeSubreddit(self, display_name, submissions)
+        self.subreddits[display_name.lower()] = subreddit
+        return subreddit
+
+    def change_scores(self, fraction: float, rng: random.Random) -> int:
+        """Changes the score of a random `fraction` of all comments, like votes coming in between two passes."""
+        changed = rng.sample(list(self.comments.values()), math.ceil(len(self.comments) * fraction))
+        for comment in changed:
+            comment.score += rng.randint(1, 5)
+        return len(changed)
+
+
+def generate_comments(num_users: int, comments_per_user: int, rng: random.Random) -> Dict[str, Dict[str, int]]:
+    """Generates {username: {comment ID: score}} with Reddit-like skew.
+
+    The number of comments per user follows a Pareto distribution with a mean of about `comments_per_user`, and so do
+    the scores, with about 2% of the comments below zero.
+    """
+    next_id = FIRST_COMMENT_ID
+    comments_by_user = {}
+    for user_index in range(num_users):
+        count = max(1, round(rng.paretovariate(2.0) * comments_per_user / 2))
+        comments = {}
+        for _ in range(count):
+            score = int(rng.paretovariate(1.2))
+            comments[to_base36(next_id)] = -score if rng.random() < 0.02 else score
+            next_id += rng.randint(1, 50)
+        comments_by_user[f"user{user_index}"] = comments
+    return comments_by_user
+
+
+def load_comments(path: str) -> Dict[str, Dict[str, int]]:
+    """Reads {username: {comment ID: score}} from a data file like `json/test.json`."""
+    return dict(user_data.iter_users(path))
@@ -0,0 +1,140 @@
+import praw.models
+import log
+from typing import Dict, List, Tuple
+
+# (flair text, flair css class)
+Flair = Tuple[str, str]
+NO_FLAIR = ("", "")
+
+
+class FlairDiff:
+    """The flair changes needed to go from a subreddit's current user flair to the flair we want.
+
+    Attributes:
+      to_set: {username: flair} for users who should get new or different flair.
+      to_clear: Usernames whose current flair should be removed.
+      unchanged: Usernames who already have the flair we want.
+    """
+
+    def __init__(self):
+        self.to_set = {}
+        self.to_clear = []
+        self.unchanged = []
+
+    def is_empty(self) -> bool:
+        return not self.to_set and not self.to_clear
+
+    def report(self) -> List[str]:
+        """Returns one human-readable line per change, used for the dry-run output."""
+        lines = [f"Flair diff: {len(self.to_set)} to set, {len(self.to_clear)} to clear, "
+                 f"{len(self.unchanged)} unchanged"]
+        for user, (text, css_class) in self.to_set.items():
+            lines.append(f"  set   {user}: \"{text}\" ({css_class})")
+        for user in self.to_clear:
+            lines.append(f"  clear {user}")
+        return lines
+
+
+def get_current_flair(sub_instance: praw.models.Subreddit) -> Dict[str, Flair]:
+    """Reads the user flair of everyone in the subreddit who has any.
+
+    Reddit returns up to 1000 users per request, so this is a handful of requests even on a large subreddit.
+    """
+    current = {}
+    for item in sub_instance.flair(limit=None):
+        current[str(item["user"])] = (item.get("flair_text") or "", item.get("flair_css_class") or "")
+    return current
+
+
+def compute_diff(current: Dict[str, Flair],
+                 users: List[str],
+                 flair: Flair,
+                 clear_others: bool) -> FlairDiff:
+    """Compares the current flair with the flair we want.
+
+    Usernames are compared case-insensitively, the same way Reddit treats them.
+
+    Args:
+      current: The flair we read with `get_current_flair`.
+      users: The users who should end up with `flair`.
+      flair: The (text, css class) to give each user in `users`.
+      clear_others: True to remove the flair of every user who is not in `users`, like `flair.delete_all()` would.
+
+    Returns:
+      A FlairDiff.
+    """
+    diff = FlairDiff()
+    current_by_key = {user.lower(): (user, user_flair) for user, user_flair in current.items()}
+    wanted_keys = set()
+
+    for user in users:
+        key = user.lower()
+        wanted_keys.add(key)
+        if key in current_by_key and current_by_key[key][1] == flair:
+            diff.unchanged.append(user)
+        else:
+            diff.to_set[user] = flair
+
+    if clear_others:
+        for key, (user, user_flair) in current_by_key.items():
+            if key not in wanted_keys and user_flair != NO_FLAIR:
+                diff.to_clear.append(user)
+
+    return diff
+
+
+def apply_diff(sub_instance: praw.models.Subreddit, diff: FlairDiff) -> None:
+    """Applies a FlairDiff through `flair.update`, which sends up to 100 users per request.
+
+    Clearing a user's flair is the same as setting an empty text and css class, so both kinds of change share the same
+    batches. The flair CSV endpoint behind `flair.update` cannot link a user to a template, so users of a template get
+    its text and css class, see `get_template_flair`, and not its colors or emojis.
+    """
+    if diff.is_empty():
+        return
+
+    flair_list = [{"user": user, "flair_text": text, "flair_css_class": css_class}
+                  for user, (text, css_class) in diff.to_set.items()]
+    flair_list += [{"user": user, "flair_text": "", "flair_css_class": ""} for user in diff.to_clear]
+
+    for result in sub_instance.flair.update(flair_list):
+        if not result.get("ok", True):
+            log.warn("Unable to update flair: %s", result)
+
+
+def get_template_flair(template: dict) -> Flair:
+    """Returns the (text, css class) that users get from a flair template, to compare with their current flair."""
+    return template["text"] or "", template.get("css_class") or ""
+
+
+def sync_flair(sub_instance: praw.models.Subreddit,
+               users: List[str],
+               flair: Flair,
+               clear_others: bool,
+               dry_run: bool) -> FlairDiff:
+    """Makes the subreddit's user flair match `users` with as few requests as possible.
+
+    Only users whose flair actually changes are sent to Reddit, and the subreddit never goes through a period where
+    nobody has flair, which is what happened with `flair.delete_all()` followed by one `flair.set()` per user.
+
+    Args:
+      sub_instance: The PRAW subreddit instance.
+      users: The users who should end up with `flair`.
+      flair: The (text, css class) to give each user in `users`.
+      clear_others: True to remove the flair of every user who is not in `users`.
+      dry_run: True to only log the diff without changing anything.
+
+    Returns:
+      The FlairDiff that was applied, or would have been applied during a dry run.
+    """
+    diff = compute_diff(get_current_flair(sub_instance), users, flair, clear_others)
+
+    if dry_run:
+        log.info("Dry run, no flair has been changed in r/%s", sub_instance)
+        for line in diff.report():
+            log.info("%s", line)
+    else:
+        apply_diff(sub_instance, diff)
+        log.info("Flair updated for r/%s: %s", sub_instance, diff.report()[0])
+
+    return diff
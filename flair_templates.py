@@ -0,0 +1,77 @@
+import threading
+import time
+import praw.models
+import log
+from typing import Dict, List, Optional
+
+# templates rarely change, so one listing per subreddit per hour is plenty
+TEMPLATE_CACHE_TTL_SEC = 3600
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+
+
+class _CacheEntry:
+    def __init__(self, templates: List[dict]):
+        self.fetched_at = time.monotonic()
+        self.templates = templates
+        self.by_id = {template["id"]: template for template in templates}
+        self.by_month = {}
+        for month in MONTH_NAMES:
+            for template in templates:
+                if month in (template["text"] or ""):
+                    self.by_month[month] = template
+                    break
+        self.missing_months = [month for month in MONTH_NAMES if month not in self.by_month]
+
+
+class FlairTemplateCache:
+    """Caches the user flair templates of each subreddit, and which template belongs to which month.
+
+    Each subreddit must maintain a unique user flair template that contains the matching string for each month. The
+    templates are listed once per subreddit, indexed by ID and by month, and listed again after `ttl_sec`. Every
+    subreddit has its own entry, so scanners working on different subreddits never see each other's templates.
+    """
+
+    def __init__(self, ttl_sec: float):
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _get_entry(self, sub_instance: praw.models.Subreddit) -> _CacheEntry:
+        key = str(sub_instance).lower()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < self.ttl_sec:
+            return entry
+
+        entry = _CacheEntry(list(sub_instance.flair.templates))
+        if entry.missing_months:
+            log.warn("User Flair template list of r/%s is missing %s month(s): %s",
+                     sub_instance, len(entry.missing_months), ", ".join(entry.missing_months))
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def get_month_template(self, sub_instance: praw.models.Subreddit, month: str) -> Optional[dict]:
+        """Returns the template whose text contains the month's name, or None if there is none."""
+        return self._get_entry(sub_instance).by_month.get(month)
+
+    def get_template(self, sub_instance: praw.models.Subreddit, flair_template_id: str) -> Optional[dict]:
+        """Returns the template with the given ID, or None if the subreddit does not have it."""
+        return self._get_entry(sub_instance).by_id.get(flair_template_id)
+
+    def get_missing_months(self, sub_instance: praw.models.Subreddit) -> List[str]:
+        """Returns the names of the months that have no template in the subreddit."""
+        return list(self._get_entry(sub_instance).missing_months)
+
+    def get_month_index(self, sub_instance: praw.models.Subreddit) -> Dict[str, str]:
+        """Returns {month name: template ID} for every month that has a template."""
+        return {month: template["id"] for month, template in self._get_entry(sub_instance).by_month.items()}
+
+    def invalidate(self, sub_instance: praw.models.Subreddit) -> None:
+        """Forgets the templates of one subreddit, so the next lookup lists them again."""
+        with self._lock:
+            self._entries.pop(str(sub_instance).lower(), None)
+
+
+TEMPLATE_CACHE = FlairTemplateCache(TEMPLATE_CACHE_TTL_SEC)
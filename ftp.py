@@ -1,52 +1,261 @@
-import ftplib
+import collections
+import functools
+import gzip
+import hashlib
+import io
 import os.path
+import threading
 import log
-from ftplib import FTP
-from configparser import ConfigParser
-
-config = ConfigParser()
-config.read("ftp.ini")
-SERVER_ADDRESS = config["ftp"]["server_address"]
-USERNAME = config["ftp"]["username"]
-PASSWORD = config["ftp"]["password"]
+import metrics
+from typing import Optional, Tuple
+
+FTP_CONFIG_FILENAME = "ftp.ini"
 SERVER_JSON_DIR = "public_html/json"
 LOCAL_JSON_DIR = "json/"
+# the files of each sub that the web page reads, see `web_leaderboard.publish` and `web_deltas.publish`
+LOCAL_WEB_DIR = LOCAL_JSON_DIR + "web/"
 SESSION_STORAGE_FILE_DICT = {}
 SESSION_STORAGE_LIMIT = 5242880  # 5 MiB (mebibyte)
+# files are uploaded under this suffix first, then renamed, so the web server never serves a half-written file
+UPLOAD_SUFFIX = ".uploading"
+GZIP_EXTENSION = ".gz"
+STOP_TIMEOUT_SEC = 60
+# what a queued file is for, see `Publisher`
+UPLOAD = "upload"
+REMOVE = "remove"
+# ftplib is imported by the publisher thread, so a run that never uploads does not load it, see `_import_ftplib`
+ftplib = None
+
+
+def _import_ftplib() -> None:
+    global ftplib
+    if ftplib is None:
+        import ftplib as module
+        ftplib = module
+
+
+@functools.lru_cache(maxsize=None)
+def get_credentials() -> Tuple[str, str, str]:
+    """Returns the server address, username and password from ftp.ini, read the first time an upload needs them.
+
+    Without an ftp.ini file, e.g. when benchmarking offline, every upload fails and is logged instead.
+    """
+    from configparser import ConfigParser
+
+    config = ConfigParser()
+    config.read(FTP_CONFIG_FILENAME)
+    return (config.get("ftp", "server_address", fallback=""),
+            config.get("ftp", "username", fallback=""),
+            config.get("ftp", "password", fallback=""))
 
 
-def exceeded_session_storage(file_to_send: str) -> bool:
+def exceeded_session_storage(file_to_send: str, local_dir: str = LOCAL_JSON_DIR) -> bool:
     # make sure we do not exceed the session storage limit before sending the files
     try:
-        size = os.path.getsize(LOCAL_JSON_DIR + file_to_send)
+        size = os.path.getsize(local_dir + file_to_send)
     except OSError as e:
-        log.warn(str(e), ": Unable to check file size, sending file anyway.")
+        log.warn("%s: Unable to check file size, sending file anyway.", e)
         return True
     SESSION_STORAGE_FILE_DICT[file_to_send] = size
     return SESSION_STORAGE_LIMIT < sum(SESSION_STORAGE_FILE_DICT.values())
 
 
-def send_file(file_to_send: str) -> str:
-    """Sends a file to our FTP server.
+class Publisher(threading.Thread):
+    """Uploads files to our FTP server from a background thread.
+
+    Scanners hand files to `publish` and move on right away. The publisher keeps one FTP connection open between
+    uploads and reconnects when the server has dropped it. A file whose content has not changed since its last upload
+    is skipped. Every file is stored under a temporary name and then renamed, so the web server only ever sees complete
+    files. With `use_gzip`, a `<name>.gz` copy is uploaded next to each file, which `web/.htaccess` serves to browsers
+    that accept gzip, as long as it is not older than the file. Without it, a `.gz` left over from an earlier run is
+    older than every new upload, so it is never served in place of one.
+
+    Files go up in the order they were queued, so an index that lists other files is queued after them. A file that
+    is queued again while it is still waiting moves to the back of the queue, and is uploaded once, with its newest
+    content, after everything queued before it.
+    """
+
+    def __init__(self, use_gzip: bool):
+        super().__init__(name="ftp-publisher", daemon=True)
+        self.use_gzip = use_gzip
+        # (UPLOAD or REMOVE, file name, local directory), and None once the publisher is asked to stop
+        self._queue = collections.deque()
+        self._queue_changed = threading.Condition()
+        self._connection = None
+        self._uploaded_hashes = {}
+
+    def _put(self, item: Optional[tuple]) -> None:
+        with self._queue_changed:
+            if item is not None:
+                try:
+                    self._queue.remove(item)
+                except ValueError:
+                    pass
+            self._queue.append(item)
+            self._queue_changed.notify()
+
+    def publish(self, file_name: str, local_dir: str) -> None:
+        """Queues a file for upload, or moves it to the back of the queue if it is already waiting."""
+        self._put((UPLOAD, file_name, local_dir))
+
+    def remove(self, file_name: str, local_dir: str) -> None:
+        """Queues the removal of a file, and of its gzip copy, from the server."""
+        self._put((REMOVE, file_name, local_dir))
+
+    def stop(self, timeout_sec: float) -> None:
+        """Uploads everything still queued, then closes the connection and ends the thread."""
+        self._put(None)
+        self.join(timeout_sec)
+
+    def run(self) -> None:
+        _import_ftplib()
+        while True:
+            with self._queue_changed:
+                while not self._queue:
+                    self._queue_changed.wait()
+                item = self._queue.popleft()
+            if item is None:
+                break
+            action, file_name, local_dir = item
+            try:
+                with metrics.FTP_UPLOAD_SECONDS.time():
+                    result = self._upload(file_name, local_dir) if action == UPLOAD else self._remove(file_name)
+            except (Exception,) as e:
+                result = "failed"
+                log.error("%s: Unable to %s file %s", e, action, file_name)
+            metrics.FTP_UPLOADS.inc(result=result)
+        self._close()
+
+    def _connect(self) -> "ftplib.FTP":
+        if self._connection is None:
+            connection = ftplib.FTP(*get_credentials())
+            try:
+                connection.cwd(SERVER_JSON_DIR)
+            except (Exception,):
+                # only keep connections that made it all the way in, `_close` cannot quit a half-open one
+                connection.close()
+                raise
+            self._connection = connection
+        return self._connection
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except ftplib.all_errors:
+                self._connection.close()
+            self._connection = None
+
+    def _upload(self, file_name: str, local_dir: str) -> str:
+        """Uploads one file unless it is missing, unchanged or too large, and returns which of these happened."""
+        try:
+            with open(local_dir + file_name, "rb") as file:
+                data = file.read()
+        except FileNotFoundError as e:
+            log.warn("%s: Unable to upload file %s\"", e, file_name)
+            return "missing"
+
+        digest = hashlib.sha256(data).hexdigest()
+        if self._uploaded_hashes.get(file_name) == digest:
+            log.debug("%s has not changed, skipping upload", file_name)
+            return "unchanged"
+        # the web page keeps its copy of the web files in IndexedDB, which is not bound by the session storage limit
+        if local_dir != LOCAL_WEB_DIR and exceeded_session_storage(file_name, local_dir):
+            log.warn("Exceeded browser session storage limit: Unable to upload file %s\"", file_name)
+            return "too_large"
+
+        try:
+            result = self._store_all(file_name, data)
+        except ftplib.all_errors:
+            # the server may have closed our idle connection, so try once more on a new one
+            self._close()
+            result = self._store_all(file_name, data)
+
+        self._uploaded_hashes[file_name] = digest
+        log.debug("%s: %s", file_name, result)
+        return "uploaded"
+
+    def _remove(self, file_name: str) -> str:
+        try:
+            self._delete_all(file_name)
+        except ftplib.all_errors:
+            self._close()
+            self._delete_all(file_name)
+        self._uploaded_hashes.pop(file_name, None)
+        log.debug("%s: removed", file_name)
+        return "removed"
+
+    def _delete_all(self, file_name: str) -> None:
+        ftp = self._connect()
+        for remote_name in (file_name, file_name + GZIP_EXTENSION):
+            try:
+                ftp.delete(remote_name)
+            except ftplib.error_perm:
+                # it is not there, for example a gzip copy that was never uploaded
+                pass
+
+    def _store_all(self, file_name: str, data: bytes) -> str:
+        # the gzip copy is written after the file, so it is never older than the file, and goes live first, so it never
+        # stands in for a newer file. `web/.htaccess` only serves a gzip copy that is at least as new as its file.
+        result = self._store(file_name, data)
+        if self.use_gzip:
+            self._store(file_name + GZIP_EXTENSION, gzip.compress(data))
+            self._rename(file_name + GZIP_EXTENSION)
+        self._rename(file_name)
+        return result
+
+    def _store(self, remote_name: str, data: bytes) -> str:
+        return self._connect().storbinary(f"STOR {remote_name + UPLOAD_SUFFIX}", io.BytesIO(data))
+
+    def _rename(self, remote_name: str) -> None:
+        ftp = self._connect()
+        temp_name = remote_name + UPLOAD_SUFFIX
+        try:
+            ftp.rename(temp_name, remote_name)
+        except ftplib.error_perm:
+            # some servers refuse to rename over an existing file
+            ftp.delete(remote_name)
+            ftp.rename(temp_name, remote_name)
+
+
+publisher: Optional[Publisher] = None
+publisher_lock = threading.Lock()
+
+
+def start_publisher(use_gzip: bool) -> None:
+    global publisher
+    with publisher_lock:
+        if publisher is None:
+            publisher = Publisher(use_gzip)
+            publisher.start()
+
+
+def stop_publisher() -> None:
+    global publisher
+    with publisher_lock:
+        if publisher is not None:
+            publisher.stop(STOP_TIMEOUT_SEC)
+            publisher = None
+
+
+def send_file(file_to_send: str, local_dir: str = LOCAL_JSON_DIR) -> None:
+    """Queues a file for upload to our FTP server and returns right away.
 
     Calling code should ensure the file exists in the same directory and that it is formatted correctly for JSON syntax.
+    The upload happens on the publisher thread, see `Publisher`, which is started here if it is not running yet.
 
     Args:
         file_to_send: A string that is the file name with the extension. Example: "Cooking.json".
+        local_dir: The local directory that holds the file, `LOCAL_JSON_DIR` by default.
 
     Returns:
-        A string that is the status of the upload. Examples:
-        "226-File successfully transferred"
-        "226 0.027 seconds (measured here), 449.62 bytes per second"
-        "530 Login authentication failed"
+        None.
     """
-    try:
-        with FTP(SERVER_ADDRESS, USERNAME, PASSWORD) as ftp, open(LOCAL_JSON_DIR + file_to_send, 'rb') as file:
-            if not exceeded_session_storage(file_to_send):
-                ftp.cwd(SERVER_JSON_DIR)
-                return ftp.storbinary(f"STOR {file_to_send}", file)
-            else:
-                raise ftplib.error_perm("Exceeded browser session storage limit")
-    except (FileNotFoundError, ftplib.error_perm) as e:
-        log.warn(str(e), ": Unable to upload file ", file_to_send, "\"")
+    start_publisher(use_gzip=False)
+    publisher.publish(file_to_send, local_dir)
+
 
+def remove_file(file_name: str, local_dir: str = LOCAL_JSON_DIR) -> None:
+    """Queues the removal of a file from our FTP server, after every upload queued before it."""
+    start_publisher(use_gzip=False)
+    publisher.remove(file_name, local_dir)
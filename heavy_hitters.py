@@ -0,0 +1,330 @@
+import base64
+import datetime
+import hashlib
+import heapq
+import math
+import os
+import sys
+import log
+import serialization
+import storage
+from array import array
+from typing import Dict, List, Optional
+
+SUMMARY_EXTENSION = ".topusers.json"
+SUMMARY_VERSION = 2
+MONTH_FORMAT = "%Y-%m"
+# the fields of a counter, see `SpaceSaving`
+COUNT = 0
+ERROR = 1
+SCORE = 2
+NEGATIVES = 3
+FIRST_COMMENT = 4
+# the Count-Min sketch has this many columns per counter and this many rows, see `CountMinSketch`
+SKETCH_WIDTH_PER_COUNTER = 8
+SKETCH_DEPTH = 4
+
+
+def _hash(name: str) -> int:
+    # the built-in `hash` of a str changes with every process, which would change the ranking after a restart
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class CountMinSketch:
+    """How many comments each user has, overestimated, in `width * depth` integers whatever the number of users.
+
+    Each user is hashed to one column of every row, and `add` adds one to those cells. Users that share a cell add up,
+    so a user's estimate, the smallest of their cells, is never below their true count. With N comments it is at most
+    e * N / width above it, with a probability of at least 1 - e^-depth.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.rows = [array("i", [0]) * width for _ in range(depth)]
+
+    def add(self, name: str) -> int:
+        """Counts one comment of a user and returns their estimate, including this comment."""
+        # double hashing, one hash of the name gives a column in every row
+        code = _hash(name)
+        column = code & 0xFFFFFFFF
+        step = (code >> 32) | 1
+        width = self.width
+        estimate = None
+        for row in self.rows:
+            column %= width
+            row[column] += 1
+            if estimate is None or row[column] < estimate:
+                estimate = row[column]
+            column += step
+        return estimate
+
+    def to_json(self) -> List[str]:
+        rows = []
+        for row in self.rows:
+            row = array("i", row)
+            if sys.byteorder == "big":
+                row.byteswap()
+            rows.append(base64.b64encode(row.tobytes()).decode("ascii"))
+        return rows
+
+    @classmethod
+    def from_json(cls, width: int, rows: List[str]) -> "CountMinSketch":
+        sketch = cls(width, 0)
+        for data in rows:
+            row = array("i", base64.b64decode(data))
+            if sys.byteorder == "big":
+                row.byteswap()
+            if len(row) != width:
+                raise ValueError(f"A sketch row has {len(row)} columns instead of {width}")
+            sketch.rows.append(row)
+        return sketch
+
+
+class SpaceSaving:
+    """The users with the most comments in a stream of comments, in a fixed number of counters.
+
+    This is the Space-Saving algorithm of Metwally, Agrawal and El Abbadi. Each tracked user has a counter of
+    [count, error, score, negatives, first comment]. A comment from a tracked user adds to its counter. A comment from
+    anyone else takes a free counter, or, once all `capacity` counters are in use, takes over the counter with the
+    lowest count. Since the new user may have had comments before, while they were not tracked, their counter starts
+    from as many as they can have had, which also becomes its error. Plain Space-Saving assumes the count of the
+    counter it takes over. That is at most the highest count ever taken over, `max_error`, and a `CountMinSketch` of
+    every comment usually knows better, so the counter starts from the smaller of the two.
+
+    The score and the negative comments of a counter only add up the `count - error` comments counted since it was
+    taken over, from the position `first comment` of the stream on. `rescore` keeps them up to date when the score of
+    one of those comments changes. The comments before are not known, but there are at most `error` of them, and none
+    has a score further from 0 than `max_score`.
+
+    With N comments so far and k counters, for every tracked user:
+
+    - their true number of comments is between `count - error` and `count`, and error <= `max_error` <= N / k,
+    - thanks to the sketch, `count` is also at most e * N / (k * SKETCH_WIDTH_PER_COUNTER) above their true number of
+      comments, with a probability of at least 1 - e^-SKETCH_DEPTH,
+    - their true negative comments are between `negatives` and `negatives + error`, and their true score is within
+      `error * max_score` of `score`,
+    - every user with more than N / k comments is tracked, whatever the order of the comments.
+
+    Memory is O(k), and each comment is O(1). Users are hashed with BLAKE2, so the same comments give the same counters
+    in every process.
+    """
+
+    def __init__(self, capacity: int, sketch: Optional[CountMinSketch] = None):
+        if capacity < 1:
+            raise ValueError("A Space-Saving summary needs at least one counter")
+        self.capacity = capacity
+        self.comments = 0
+        self.sketch = sketch or CountMinSketch(capacity * SKETCH_WIDTH_PER_COUNTER, SKETCH_DEPTH)
+        self._counters: Dict[str, list] = {}
+        # the users of each count, oldest first, so the counter to take over is found without a search
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._min_count = 0
+        # the highest count of a counter that was taken over, no user without a counter has more comments than this
+        self._max_evicted = 0
+        self._max_score = 0
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    @property
+    def max_error(self) -> int:
+        """The largest error a counter can have, 0 until all of them are in use."""
+        return self._max_evicted
+
+    @property
+    def max_score(self) -> int:
+        """The largest absolute score of any comment counted or rescored so far."""
+        return self._max_score
+
+    def _remove_from_bucket(self, name: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[name]
+        if not bucket:
+            del self._buckets[count]
+
+    def _place(self, name: str, counter: list) -> None:
+        self._counters[name] = counter
+        self._buckets.setdefault(counter[COUNT], {})[name] = None
+        if counter[COUNT] < self._min_count:
+            self._min_count = counter[COUNT]
+        elif self._min_count not in self._buckets:
+            self._min_count = min(self._buckets)
+
+    def add(self, name: str, score: int = 0) -> None:
+        """Counts one comment and its score."""
+        position = self.comments
+        self.comments += 1
+        estimate = self.sketch.add(name)
+        counter = self._counters.get(name)
+        if counter is not None:
+            self._remove_from_bucket(name, counter[COUNT])
+        elif len(self._counters) < self.capacity:
+            # nobody has been forgotten yet, so this is the user's first comment
+            counter = [0, 0, 0, 0, position]
+        else:
+            evicted = next(iter(self._buckets[self._min_count]))
+            counter = self._counters.pop(evicted)
+            self._remove_from_bucket(evicted, counter[COUNT])
+            self._max_evicted = max(self._max_evicted, counter[COUNT])
+            # the estimate already counts this comment
+            earlier = min(self._max_evicted, estimate - 1)
+            counter[:] = [earlier, earlier, 0, 0, position]
+
+        counter[COUNT] += 1
+        counter[SCORE] += score
+        if score < 0:
+            counter[NEGATIVES] += 1
+        self._max_score = max(self._max_score, abs(score))
+        self._place(name, counter)
+
+    def rescore(self, name: str, position: int, old_score: int, score: int) -> None:
+        """Changes the score of the comment counted at `position` of the stream, from `old_score` to `score`."""
+        self._max_score = max(self._max_score, abs(score))
+        counter = self._counters.get(name)
+        if counter is None or position < counter[FIRST_COMMENT]:
+            # counted by a counter that was taken over since, it is one of the `error` comments nobody knows
+            return
+        counter[SCORE] += score - old_score
+        counter[NEGATIVES] += (score < 0) - (old_score < 0)
+
+    def get_counter(self, name: str) -> List[int]:
+        """Returns the counter of a tracked user, see `SpaceSaving`, raises KeyError for any other user."""
+        return list(self._counters[name])
+
+    def get_top(self, k: int) -> List[str]:
+        """Returns the k tracked users with the highest counts, highest first."""
+        return [name for name, _ in heapq.nlargest(k, self._counters.items(),
+                                                  key=lambda item: (item[1][COUNT], -item[1][ERROR]))]
+
+    def to_json(self) -> dict:
+        # bucket by bucket, so the order in which counters are taken over survives a reload
+        counters = [[name] + self._counters[name] for count in sorted(self._buckets) for name in self._buckets[count]]
+        return {
+            "capacity": self.capacity,
+            "comments": self.comments,
+            "max_evicted": self._max_evicted,
+            "max_score": self._max_score,
+            "counters": counters,
+            "sketch": self.sketch.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, saved: dict) -> "SpaceSaving":
+        capacity = saved["capacity"]
+        summary = cls(capacity, CountMinSketch.from_json(capacity * SKETCH_WIDTH_PER_COUNTER, saved["sketch"]))
+        summary.comments = saved["comments"]
+        summary._max_evicted = saved["max_evicted"]
+        summary._max_score = saved["max_score"]
+        for name, *counter in saved["counters"]:
+            if len(counter) != FIRST_COMMENT + 1:
+                raise ValueError(f"A counter has {len(counter)} fields instead of {FIRST_COMMENT + 1}")
+            summary._place(name, counter)
+        return summary
+
+
+class TopUsers:
+    """The `SpaceSaving` summary of one subreddit's month, kept up to date pass by pass in `<sub>.topusers.json`.
+
+    The comments of a `records.UserTable` are only ever appended during a month, so the summary remembers how many it
+    has counted, and `update` only counts the ones added since. The comments that were rescored since `watch` are
+    handed to `SpaceSaving.rescore`. Comments restored from a checkpoint go through the table too, so they are counted
+    like the ones a pass scanned. The summary is saved before the store. If the process stops between the two, the
+    summary has counted more comments than the store has, and it is counted again from the table. The same happens
+    when the capacity changes, or when the summary is from another month.
+    """
+
+    def __init__(self, directory: str, sub_name: str, capacity: int):
+        self.path = os.path.join(directory, sub_name + SUMMARY_EXTENSION)
+        self.sub_name = sub_name
+        self.capacity = capacity
+        self.summary = SpaceSaving(capacity)
+
+    def _load(self) -> Optional[SpaceSaving]:
+        try:
+            with open(self.path, "rb") as f:
+                saved = serialization.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warn("%s: Unable to read %s, counting the top users of r/%s again", e, self.path, self.sub_name)
+            return None
+        if saved.get("version") != SUMMARY_VERSION or saved.get("month") != _get_month() \
+                or saved.get("capacity") != self.capacity:
+            return None
+        try:
+            return SpaceSaving.from_json(saved)
+        except (KeyError, TypeError, ValueError) as e:
+            log.warn("%s: Unable to read %s, counting the top users of r/%s again", e, self.path, self.sub_name)
+            return None
+
+    @staticmethod
+    def watch(table) -> None:
+        """Records the comments of `table` that get a new score, call it before a pass changes any of them."""
+        table.rescored = {}
+
+    def update(self, table) -> SpaceSaving:
+        """Counts the comments added to, or rescored in, `table` since the last update, saves the summary, and returns
+        it."""
+        summary = self._load()
+        names = table.names
+        owners = table.owners
+        scores = table.scores
+        if summary is None or summary.comments > table.comment_count:
+            summary = SpaceSaving(self.capacity)
+        else:
+            for row, old_score in (table.rescored or {}).items():
+                # the comments after `summary.comments` are counted below, with their new score
+                if row < summary.comments:
+                    summary.rescore(names[owners[row]], row, old_score, scores[row])
+        for row in range(summary.comments, table.comment_count):
+            summary.add(names[owners[row]], scores[row])
+        self.watch(table)
+        self.summary = summary
+
+        saved = summary.to_json()
+        saved["version"] = SUMMARY_VERSION
+        saved["month"] = _get_month()
+        try:
+            storage.write_atomically(self.path, serialization.dumps(saved))
+        except OSError as e:
+            log.error("%s: Unable to write the top users of r/%s", e, self.sub_name)
+        return summary
+
+    def discard(self) -> None:
+        """Deletes the summary, at the start of a new month."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _get_month() -> str:
+    return datetime.date.today().strftime(MONTH_FORMAT)
+
+
+def get_top_totals(obj: dict, fraction: float, summary: SpaceSaving) -> List[list]:
+    """Returns the same rows as `leaderboard.get_top_totals`, for the top users of a `SpaceSaving` summary.
+
+    The users are ranked by their counts in the summary, and their rows come from their counters alone, so nothing is
+    read from the table but its number of users, and nothing is allocated per user, unlike `leaderboard.ScoreArrays`.
+    A row holds the `count - error` comments that the user's counter has counted, with their score and negative
+    comments. They miss at most `max_error` of the user's comments, so the comments and negative comments are at most
+    `max_error` too low, and the score is off by at most `max_error * max_score` either way. A user who got their
+    counter with their first comment, whose error is 0, has exact totals.
+
+    There are at most `capacity` rows. For good results, the capacity should be several times the top `fraction` of
+    users, and the number of comments divided by the capacity should stay below the number of comments of the last top
+    user.
+    """
+    k = math.ceil(len(obj["users"]) * fraction)
+    if k > summary.capacity:
+        log.warn("The top %s users do not fit in %s counters, only the top %s are ranked", k, summary.capacity,
+                 summary.capacity)
+    log.debug("Ranking from %s comments in %s counters, the comment counts are off by at most %s and the scores by at "
+              "most %s", summary.comments, len(summary), summary.max_error, summary.max_error * summary.max_score)
+
+    rows = []
+    for name in summary.get_top(k):
+        counter = summary.get_counter(name)
+        rows.append([name, counter[COUNT] - counter[ERROR], counter[SCORE], counter[NEGATIVES]])
+    return rows
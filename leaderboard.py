@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import math
+from array import array
+from typing import List
+
+# NumPy is optional, plain `array` buffers give the same results, just more slowly. Importing it is a good part of the
+# program's startup time, so it waits until the first leaderboard is computed, see `_import_numpy`.
+numpy = None
+_numpy_imported = False
+
+PERCENTILES = [50, 90, 99]
+
+
+def _import_numpy() -> None:
+    global numpy, _numpy_imported
+    if not _numpy_imported:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        _numpy_imported = True
+
+
+class ScoreArrays:
+    """Every comment score of one subreddit, in flat buffers that can be aggregated in bulk.
+
+    `scores` holds all scores back to back, user by user, in the same order as `names`. `counts`, `sums` and
+    `negatives` hold the number of comments, the total score and the number of negative comments of each user. With
+    NumPy these are NumPy arrays, otherwise they are `array('q')` buffers.
+    """
+
+    def __init__(self, obj: dict):
+        _import_numpy()
+        table = obj["users"]
+        self.names = list(table)
+        size = len(self.names)
+
+        if numpy is not None:
+            self.counts = numpy.frombuffer(table.counts, dtype=numpy.int32).astype(numpy.int64)
+            total = int(self.counts.sum())
+            # the table keeps comments in the order they were added, a stable sort by user groups them back to back
+            # without changing the order within a user
+            owners = numpy.frombuffer(table.owners, dtype=numpy.int32)
+            self.scores = numpy.frombuffer(table.scores, dtype=numpy.int32).astype(numpy.int64)[
+                numpy.argsort(owners, kind="stable")]
+            if total == 0:
+                self.sums = numpy.zeros(size, dtype=numpy.int64)
+                self.negatives = numpy.zeros(size, dtype=numpy.int64)
+            else:
+                starts = numpy.minimum(numpy.cumsum(self.counts) - self.counts, total - 1)
+                has_comments = self.counts > 0
+                self.sums = numpy.where(has_comments, numpy.add.reduceat(self.scores, starts), 0)
+                self.negatives = numpy.where(has_comments,
+                                             numpy.add.reduceat((self.scores < 0).astype(numpy.int64), starts),
+                                             0)
+        else:
+            self.counts = array("q", table.counts)
+            self.scores = array("q", itertools.chain.from_iterable(table[name].values() for name in self.names))
+            self.sums = array("q")
+            self.negatives = array("q")
+            start = 0
+            for count in self.counts:
+                user_scores = self.scores[start:start + count]
+                self.sums.append(sum(user_scores))
+                self.negatives.append(sum(1 for score in user_scores if score < 0))
+                start += count
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_row(self, index: int) -> list:
+        """Returns [username, total comments, total score, negative comments] for one user."""
+        return [self.names[index], int(self.counts[index]), int(self.sums[index]), int(self.negatives[index])]
+
+
+def get_top_indexes(arrays: ScoreArrays, k: int) -> List[int]:
+    """Returns the indexes of the k users with the most comments, most comments first.
+
+    Users with the same number of comments keep the order they were added in, exactly like a stable sort of every
+    user would. Only the top k are ever sorted, with a partial sort, instead of sorting every user.
+    """
+    size = len(arrays)
+    k = min(k, size)
+    if k <= 0:
+        return []
+
+    if numpy is not None:
+        # a unique key per user: more comments first, then the earlier user first
+        keys = -arrays.counts * size + numpy.arange(size, dtype=numpy.int64)
+        top = numpy.argpartition(keys, k - 1)[:k] if k < size else numpy.arange(size)
+        return [int(index) for index in top[numpy.argsort(keys[top])]]
+
+    counts = arrays.counts
+    return heapq.nsmallest(k, range(size), key=lambda index: (-counts[index], index))
+
+
+def get_totals_array(obj: dict) -> List[list]:
+    """Returns [username, total comments, total score, negative comments] for every user, most comments first."""
+    arrays = ScoreArrays(obj)
+    return [arrays.get_row(index) for index in get_top_indexes(arrays, len(arrays))]
+
+
+def get_top_totals(obj: dict, fraction: float) -> List[list]:
+    """Returns the same rows as `get_totals_array`, but only for the top `fraction` of users.
+
+    Like `get_ratios_array`, the number of users is rounded up so there is at least one row whenever there are users.
+    """
+    arrays = ScoreArrays(obj)
+    k = math.ceil(len(arrays) * fraction)
+    return [arrays.get_row(index) for index in get_top_indexes(arrays, k)]
+
+
+def _percentile(sorted_values, percent: float) -> float:
+    # linear interpolation between the closest ranks, the same method NumPy uses by default
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _total(values) -> int:
+    return int(values.sum()) if numpy is not None else sum(values)
+
+
+def get_stats(obj: dict) -> dict:
+    """Returns summary statistics of a subreddit's comments.
+
+    Includes the number of users, comments and negative comments, the total score, and the mean and percentiles (see
+    `PERCENTILES`, p50 is the median) of comments per user and of the score per comment.
+    """
+    arrays = ScoreArrays(obj)
+    stats = {
+        "users": len(arrays),
+        "comments": _total(arrays.counts),
+        "negative_comments": _total(arrays.negatives),
+        "total_score": _total(arrays.sums),
+    }
+    if len(arrays) == 0 or stats["comments"] == 0:
+        return stats
+
+    for name, values in (("comments_per_user", arrays.counts), ("score_per_comment", arrays.scores)):
+        if numpy is not None:
+            percentiles = numpy.percentile(values, PERCENTILES)
+        else:
+            sorted_values = sorted(values)
+            percentiles = [_percentile(sorted_values, percent) for percent in PERCENTILES]
+        stats[name] = {"mean": round(_total(values) / len(values), 2)}
+        for percent, value in zip(PERCENTILES, percentiles):
+            stats[name][f"p{percent}"] = round(float(value), 2)
+
+    return stats
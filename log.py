@@ -1,47 +1,172 @@
+import atexit
+import datetime
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import threading
+from typing import Optional
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    filename="json/debug.log",
-)
+LOG_DIR = "json/"
+LOG_FILENAME = "debug.log"
+LOG_PATH = LOG_DIR + LOG_FILENAME
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# debug.log is uploaded to the web server with everything else, so keep it well below `ftp.SESSION_STORAGE_LIMIT`
+DEFAULT_MAX_BYTES = 1048576  # 1 MiB
+DEFAULT_BACKUP_COUNT = 12
+# `--log-rotate` choices, and the `when` of `TimedRotatingFileHandler` they stand for
+ROTATE_WHEN = {"size": None, "hourly": "H", "daily": "midnight"}
+# arguments of these types cannot change after the call, so formatting them can wait for the listener thread
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
 
 handler = logging.StreamHandler(sys.stderr)
 handler.addFilter(lambda record: record.levelno >= logging.WARNING)
 
 
-def debug(*args: str) -> None:
-    debug_message = ""
-    for arg in args:
-        debug_message += arg
-    logging.debug(debug_message)
+class JsonLinesFormatter(logging.Formatter):
+    """Formats every record as one JSON object per line, for log tools that parse structured logs."""
 
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
 
-def info(*args: str) -> None:
-    info_message = ""
-    for arg in args:
-        info_message += arg
-    logging.info(info_message)
 
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them first.
 
-def warn(*args: str) -> None:
-    warning_message = ""
-    for arg in args:
-        warning_message += arg
-    logging.warning(warning_message)
+    `QueueHandler` formats every message on the calling thread. We only do that when an argument could still change
+    after the call returns, so scanner threads never pay for formatting, and never wait on the disk.
+    """
 
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # tracebacks hold on to every frame of the stack, so render them now and let the frames go
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if record.args and not all(isinstance(arg, IMMUTABLE_TYPES) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
 
-def error(*args: str) -> None:
-    error_message = ""
-    for arg in args:
-        error_message += arg
-    logging.error(error_message)
 
+def build_file_handler(max_bytes: int,
+                       backup_count: int,
+                       rotate: str,
+                       json_lines: bool,
+                       path: str = LOG_PATH) -> logging.Handler:
+    when = ROTATE_WHEN[rotate]
+    if when is None:
+        rotating_handler = logging.handlers.RotatingFileHandler(path,
+                                                                maxBytes=max_bytes,
+                                                                backupCount=backup_count,
+                                                                encoding="utf-8",
+                                                                delay=True)
+    else:
+        rotating_handler = logging.handlers.TimedRotatingFileHandler(path,
+                                                                     when=when,
+                                                                     backupCount=backup_count,
+                                                                     encoding="utf-8",
+                                                                     delay=True)
+    rotating_handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    return rotating_handler
 
-def critical(*args: str) -> None:
-    critical_message = ""
-    for arg in args:
-        critical_message += arg
-    logging.critical(critical_message)
+
+log_queue = queue.SimpleQueue()
+listener_lock = threading.Lock()
+file_handler: Optional[logging.Handler] = None
+listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure(max_bytes: int = DEFAULT_MAX_BYTES,
+              backup_count: int = DEFAULT_BACKUP_COUNT,
+              rotate: str = "size",
+              json_lines: bool = False,
+              filename: str = LOG_FILENAME) -> None:
+    """Sends every log record through a queue to a listener thread, which alone writes `LOG_DIR` + `filename`.
+
+    Logging from a scanner only puts the record in the queue, which never blocks. The file is rotated by size, or
+    every hour or day with `rotate`, and `backup_count` old files are kept next to it as debug.log.1, debug.log.2 and
+    so on. Calling this again replaces the previous settings, after everything already queued has been written.
+
+    Args:
+      max_bytes: Rotate once the file reaches this size, only used when `rotate` is "size". 0 never rotates by size.
+      backup_count: The number of rotated files to keep.
+      rotate: One of `ROTATE_WHEN`.
+      json_lines: Write one JSON object per record instead of plain text.
+      filename: The name of the file in `LOG_DIR`. Processes that share `LOG_DIR` each need their own.
+
+    Returns:
+      None.
+    """
+    global file_handler, listener
+    with listener_lock:
+        if listener is not None:
+            listener.stop()
+            file_handler.close()
+        file_handler = build_file_handler(max_bytes, backup_count, rotate, json_lines, LOG_DIR + filename)
+        listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+
+
+def flush() -> None:
+    """Blocks until every queued record has been written, then keeps logging."""
+    with listener_lock:
+        if listener is not None:
+            listener.stop()
+            listener.start()
+
+
+def rollover() -> None:
+    """Starts a new log file, keeping the old one as debug.log.1, for example at the start of each month."""
+    with listener_lock:
+        # the listener is stopped while we rotate, so no record is written halfway through
+        listener.stop()
+        try:
+            file_handler.doRollover()
+        finally:
+            listener.start()
+
+
+def _stop() -> None:
+    with listener_lock:
+        if listener is not None:
+            listener.stop()
+
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(LazyQueueHandler(log_queue))
+configure()
+# write whatever is still queued when the program exits
+atexit.register(_stop)
+
+
+def debug(message: str, *args) -> None:
+    logging.debug(message, *args)
+
+
+def info(message: str, *args) -> None:
+    logging.info(message, *args)
+
+
+def warn(message: str, *args) -> None:
+    logging.warning(message, *args)
+
+
+def error(message: str, *args) -> None:
+    logging.error(message, *args)
+
+
+def critical(message: str, *args) -> None:
+    logging.critical(message, *args)
@@ -1,102 +1,148 @@
 import praw.models
 import prawcore.exceptions
+import checkpoint
+import config
 import datetime
 import json
 import math
 import os
+import signal
 import sys
 import time
+import threading
+import flair_sync
+import flair_templates
 import ftp
+import heavy_hitters
+import leaderboard
+import metrics
+import rate_limiter
 import scanner_pool
+import scheduler
+import score_refresh
+import serialization
+import storage
+import submission_cache
 import log
-from typing import List
-from Scanner import Scanner
+import user_data
+import web_deltas
+import web_leaderboard
+from typing import List, Optional, Set
+from Scanner import Scanner, close_http_sessions
 from args import get_args
 
 # ************************************************* GLOBAL CONSTANTS ************************************************* #
 # We get the previous month by subtracting 1, so December must be before
 # January, and the 12th month must be None, so we can reference November.
 MONTHS = [
-    ['December', ''],
-    ['January', ''],
-    ['February', ''],
-    ['March', ''],
-    ['April', ''],
-    ['May', ''],
-    ['June', ''],
-    ['July', ''],
-    ['August', ''],
-    ['September', ''],
-    ['October', ''],
-    ['November', ''],
+    'December',
+    'January',
+    'February',
+    'March',
+    'April',
+    'May',
+    'June',
+    'July',
+    'August',
+    'September',
+    'October',
+    'November',
     None]
 
 ARGS = get_args()
 NAME_IDX = 0
-FLAIR_TEMPLATE_ID_IDX = 1
 TOTAL_COMMENTS_IDX = 1
 AVG_SCORE_IDX = 1
 TOTAL_SCORE_IDX = 2
 NEG_COMMENTS_IDX = 3
+TOP_USERS_FRACTION = 0.01
 SUBS_FILENAME = "subreddits.json"
-DEBUG_FILENAME = "debug.log"
+# the upload reads it from `ftp.LOCAL_JSON_DIR`, which is where `log` writes it. Workers that share the directory
+# each write their own, see `main_scanner_loop`.
+DEBUG_FILENAME = log.LOG_FILENAME
+# set once the program is shutting down, so every running scanner can save its file and stop
+STOP_EVENT = threading.Event()
+debug_log_month = None
+# set in `--coordinator` mode, see `start_lease_keeper`
+lease_coordinator: Optional["coordinator.LeaseCoordinator"] = None
+debug_log_lock = threading.Lock()
 
 
-def edit_flair(obj: dict, scanner: Scanner) -> None:
-    """Deletes and sets user flair, then updates the wiki pages.
+def edit_flair(obj: dict, scanner: Scanner, top_users: Optional[heavy_hitters.SpaceSaving] = None) -> None:
+    """Syncs user flair with the most helpful users of the month, then updates the wiki pages.
 
     We determine when it is a new month when the previous_day is greater than today's day (when 31 rolls back to 1). If
-    it is a new month, we delete all current user flair across the entire subreddit, then set the new flair based on the
-    results from the most recent iteration. We then update the wiki.
+    it is a new month, we compare the subreddit's current user flair with the results from the most recent iteration,
+    and only send the differences to Reddit, see `flair_sync`. In debug mode, the differences are only logged. We then
+    update the wiki.
 
     Args:
       obj:
         A json-syntax object that contains an entry for each user, along with that user's comment IDs and scores.
       scanner:
         The Scanner object that we are currently working on.
+      top_users:
+        The month's summary of the top users with `--top-users-capacity`, None to rank them from exact totals.
 
     Returns:
       is_new_month:
         A bool that is true after the first iteration of the main loop on the first day of the month.
     """
-    totals_arr = get_totals_array(obj)
-    ratios_arr = get_ratios_array(totals_arr)
+    # only the top 1% can get flair, so we never sort the rest
+    if top_users is not None:
+        totals_arr = heavy_hitters.get_top_totals(obj, TOP_USERS_FRACTION, top_users)
+    else:
+        totals_arr = leaderboard.get_top_totals(obj, TOP_USERS_FRACTION)
+    ratios_arr = get_ratios_array(totals_arr, len(obj["users"]))
     prev_month = int(datetime.datetime.today().month) - 1
-    set_flair_template_ids(scanner.sub_instance)
-
-    if ARGS.debug is None:
-        # this deletes the flair for all users of a subreddit!
-        # these operations can take several seconds to complete
-        scanner.sub_instance.flair.delete_all()
-        for i in range(0, len(ratios_arr)):
-            scanner.sub_instance.flair.set(
-                ratios_arr[i][NAME_IDX],
-                flair_template_id=MONTHS[prev_month][FLAIR_TEMPLATE_ID_IDX]
-            )
+    template = flair_templates.TEMPLATE_CACHE.get_month_template(scanner.sub_instance, MONTHS[prev_month])
+
+    if template is None:
+        log.warn("No user flair template for %s, no flair has been changed", MONTHS[prev_month])
     else:
-        log.debug("Debug output only, no flair has been changed")
-        for i in range(0, len(ratios_arr)):
-            log.debug("Flair updated for: ",
-                      ratios_arr[i][NAME_IDX],
-                      " for ",
-                      MONTHS[prev_month][FLAIR_TEMPLATE_ID_IDX])
+        # everyone who is no longer in the top users loses their flair, like `flair.delete_all()` used to do
+        flair_sync.sync_flair(scanner.sub_instance,
+                              [user[NAME_IDX] for user in ratios_arr],
+                              flair_sync.get_template_flair(template),
+                              clear_others=True,
+                              dry_run=ARGS.debug is not None)
+
+    # clear out the comment log and start a new debug log at the beginning of each month, the old one is kept
+    user_data.clear_users(obj)
+    rollover_debug_log()
 
-    # clear out the comment log and debug log at the beginning of each month
-    obj["users"] = {}
-    open(DEBUG_FILENAME, "w").close()
+
+def seal_month(obj: dict, scanner: Scanner) -> None:
+    """Archives the month that just ended before it is cleared from the live store, see `archive`."""
+    import archive
+
+    month = archive.get_previous_month_key()
+    try:
+        entry = archive.Archive(ftp.LOCAL_JSON_DIR, scanner.sub_name).seal(obj, month)
+        log.info("Archived %s of r/%s: %s users, %s comments",
+                 month, scanner.sub_name, entry["users"], entry["comments"])
+    except OSError as e:
+        log.error("%s: Unable to archive %s of r/%s, the month is not kept", e, month, scanner.sub_name)
+
+
+def rollover_debug_log() -> None:
+    """Rotates the debug log once per month, however many scanners reach the new month."""
+    global debug_log_month
+    with debug_log_lock:
+        month = datetime.datetime.today().month
+        if debug_log_month != month:
+            debug_log_month = month
+            log.rollover()
 
 
 def get_totals_array(users_obj: dict) -> List[list]:
     """Builds and sorts the totals array.
 
-    Loop through the users_obj, adding up the total number of comments, the total score, and the total number of
-    comments with a negative score.
+    Adds up the total number of comments, the total score, and the total number of comments with a negative score of
+    every user, in bulk, see `leaderboard`.
 
     For example: [["bob",31,278,0],["jane",12,773,2]]
 
-    Not currently not doing anything useful with the total comments and total score besides calculating the average.
-    There is more potential here.
-
     Args:
       users_obj:
         A key-value pair object that contains the user ID, and each comment ID and comment score.
@@ -107,24 +153,10 @@ def get_totals_array(users_obj: dict) -> List[list]:
         total number of negative comments. This list is reverse-sorted by the total number of comments before it is
         returned.
     """
-    totals_arr = []
-    for user in users_obj["users"]:
-        total_user_comments = 0
-        total_user_score = 0
-        total_user_negatives = 0
-        for score in users_obj["users"][user]["commentScore"]:
-            total_user_comments += 1
-            total_user_score += score
-            if score < 0:
-                total_user_negatives += 1
-        totals_arr.append([str(user), int(total_user_comments), int(total_user_score), int(total_user_negatives)])
+    return leaderboard.get_totals_array(users_obj)
 
-    totals_arr.sort(reverse=True, key=lambda x: x[TOTAL_COMMENTS_IDX])
 
-    return totals_arr
-
-
-def get_ratios_array(totals_arr: List[list]) -> List[list]:
+def get_ratios_array(totals_arr: List[list], total_users: Optional[int] = None) -> List[list]:
     """ Returns most helpful users.
 
     Calculate the top 1% of the number of users in totals_arr and starting with totals_arr sorted by most comments,
@@ -132,14 +164,19 @@ def get_ratios_array(totals_arr: List[list]) -> List[list]:
     the format: [[(string) username, (int) average score]]
 
     Args:
-        totals_arr: A list of lists containing user information.
+        totals_arr: A list of lists containing user information, sorted by most comments. It may hold only the top
+          users, see `leaderboard.get_top_totals` and `heavy_hitters.get_top_totals`.
+        total_users: The number of users totals_arr was taken from, len(totals_arr) if it holds every user.
 
     Returns:
         A list of lists, where each inner list contains the username and average
         score for a user.
     """
     ratio_arr = []
-    top_1_percent = math.ceil(len(totals_arr) * 0.01)  # ceil ensures we always have at least 1 entry in the list
+    if total_users is None:
+        total_users = len(totals_arr)
+    # ceil ensures we always have at least 1 entry in the list
+    top_1_percent = min(math.ceil(total_users * TOP_USERS_FRACTION), len(totals_arr))
 
     for i in range(0, top_1_percent):
         if (totals_arr[i][NEG_COMMENTS_IDX] / totals_arr[i][TOTAL_COMMENTS_IDX]) <= 0.02:
@@ -155,46 +192,12 @@ def get_ratios_array(totals_arr: List[list]) -> List[list]:
     return ratio_arr
 
 
-def set_flair_template_ids(sub_instance: praw.models.Subreddit) -> None:
-    """Assigns a user flair template ID to the corresponding month in the MONTHS list.
-
-    Each subreddit must maintain a unique user flair template that contains the matching string for each month. If we
-    don't want to include the name of the month in each flair, then this is all unnecessary. If there is no matching
-    user flair template, then no user flair will be applied.
-
-    Args:
-      sub_instance:
-        The PRAW subreddit instance to search.
-
-    Returns:
-        None.
-    """
-    missing_months = 0
-
-    for month in MONTHS:
-        if month is None:
-            break
-        found = False
-        for template in sub_instance.flair.templates:
-            if month[NAME_IDX] in template["text"]:
-                month[FLAIR_TEMPLATE_ID_IDX] = template["id"]
-                found = True
-                break
-
-        if not found:
-            missing_months += 1
-
-    if missing_months > 0:
-        # TODO this should print the exact months that are missing
-        log.warn("User Flair template list is missing ", str(missing_months), " month(s)")
-
-
-def upload_file_to_ftp_server(file_name: str) -> None:
+def upload_file_to_ftp_server(file_name: str, local_dir: str = ftp.LOCAL_JSON_DIR) -> None:
+    # this only queues the file, the upload itself happens on the publisher thread
     try:
-        result = ftp.send_file(file_name)
-        log.debug(str(result))
+        ftp.send_file(file_name, local_dir)
     except (Exception,) as e:
-        log.error(str(e), ": Unable to upload file")
+        log.error("%s: Unable to upload file", e)
 
 
 def user_exists(obj: dict, user_id_to_check: str) -> bool:
@@ -207,18 +210,13 @@ def user_exists(obj: dict, user_id_to_check: str) -> bool:
     Returns:
       True if a user with the given ID exists, False otherwise.
     """
-    for user in obj["users"]:
-        if user_id_to_check == user:
-            return True
-    return False
+    return user_id_to_check in obj["users"]
 
 
-def update_existing(obj: dict, comment_to_update: praw.models.Comment, user_id: str) -> None:
+def update_existing(obj: dict, comment_to_update: praw.models.Comment, user_id: str) -> bool:
     """Update comment score if comment exist else add new comments.
 
-    The function checks if the comment ID already exists in the 'commentId' list of the user. If the comment ID exists,
-    the score is updated in the corresponding position of the 'commentScore' list. If the comment ID does not exist, the
-    comment ID and score are added to the respective lists.
+    Comments are keyed by their ID, so this is a single dictionary upsert no matter how many comments the user has.
 
     Args:
       obj: A dictionary that represents all user with their comment IDs and scores.
@@ -226,32 +224,22 @@ def update_existing(obj: dict, comment_to_update: praw.models.Comment, user_id:
       user_id: The User ID for whom the comment belongs to.
 
     Returns:
-      None.
+      True if the comment is new or its score changed, False otherwise.
     """
-    users_obj = obj["users"][user_id]
-    id_arr = users_obj["commentId"]
-    score_arr = users_obj["commentScore"]
+    comments = user_data.get_comments(obj, user_id)
+    comment_id = str(comment_to_update.id)
+    if comments.get(comment_id) == comment_to_update.score:
+        return False
 
-    try:
-        index = id_arr.index(str(comment_to_update.id))
-    except ValueError:
-        index = -1
-
-    if index >= 0:
-        # comment already exists, update the score
-        score_arr[index] = comment_to_update.score
-    else:
-        # comment does not exist, add new comment and score
-        id_arr.append(str(comment_to_update.id))
-        score_arr.append(comment_to_update.score)
+    comments[comment_id] = comment_to_update.score
+    return True
 
 
 def add_new(obj: dict, comment_to_add: praw.models.Comment) -> None:
     """Add a new comment to the 'obj' dictionary.
 
-    The function creates a new entry in the 'users' dictionary with the author's username as the key. The 'commentId'
-    list is initialized with the ID of the given comment, and the 'commentScore' list is initialized with the score of
-    the given comment.
+    The function creates a new entry in the 'users' dictionary with the author's username as the key, holding a single
+    {comment ID: score} pair for the given comment.
 
     Args:
       obj: A dictionary that represents all user with their comment IDs and scores.
@@ -260,76 +248,7 @@ def add_new(obj: dict, comment_to_add: praw.models.Comment) -> None:
     Returns:
       None.
     """
-    obj["users"][str(comment_to_add.author)] = {"commentId": [comment_to_add.id],
-                                                "commentScore": [comment_to_add.score]}
-
-
-def sleep(scanner: Scanner) -> None:
-    """Puts the program to sleep for a calculated amount of time.
-
-    We want each scanner to run four times per day, so that means it must complete one iteration every six hours. We
-    must consider the average runtime for all scanners to ensure each scanner can finish within this six-hour window. To
-    calculate the sleep time for each scanner, we start with 6 hours and subtract the cumulative average runtime of all
-    scanners. For example:
-
-    Scanner 1 average runtime =  900 seconds
-    Scanner 2 average runtime = 2268 seconds
-    Scanner 3 average runtime = 2088 seconds
-
-    cumulative average runtime of all scanners = 5256 seconds
-
-    Scanner 1 sleep time = (21600 - 5256) = 16344 seconds (4.54 hours)
-    Scanner 2 sleep time = (21600 - 2268) = 19332 seconds (5.37 hours)
-    Scanner 2 sleep time = (21600 - 2088) = 19512 seconds (5.42 hours)
-
-    The higher the cumulative average runtime gets, the lower the sleep time gets. The closer it gets to 0, the less
-    likely it is for each scanner to finish one loop every 6 hours.
-
-    Args:
-      scanner: The Scanner object that we want to put to sleep after it has completed one iteration.
-
-    Returns:
-      None.
-    """
-    date_time = datetime.datetime.now()
-    sleep_time_seconds = 1
-    """
-    `sleep_time_seconds` should be `1` in two cases: 
-         1.  Until every scanner has completed one pass.
-         2.  If the cumulative average runtimes is greater than the supplied scanner's interval. 
-    
-    If the `adjusted_scanner_interval` is still negative after each scanner has 
-    finished one pass, scanners will take longer than `scanner.interval_seconds` 
-    to complete each pass, and we should print a warning.
-    """
-    adjusted_scanner_interval = scanner_pool.get_cumulative_avg_runtime() - get_variance(scanner)
-
-    if adjusted_scanner_interval >= scanner.interval_seconds and scanner_pool.first_pass_completed():
-        log.warn("Some scanners may not finish within ",
-                 str(round(scanner.interval_seconds / 60 / 60, 2)),
-                 " hours!")
-    elif scanner_pool.first_pass_completed():
-        sleep_time_seconds = adjusted_scanner_interval
-
-    log.info("Cumulative average runtime = ", str(round(scanner_pool.get_cumulative_avg_runtime())))
-    log.info(" Current scanner's runtime = ", str(round(scanner.individual_avg_runtime_seconds[-1], 2)))
-    log.info("                  Variance = ", str(round(get_variance(scanner), 2)))
-
-    sleep_time_string = date_time + datetime.timedelta(seconds=sleep_time_seconds)
-    log.info(f" Now sleeping, waking up at: {str(sleep_time_string.time())}")
-    upload_file_to_ftp_server(DEBUG_FILENAME)
-
-    time.sleep(sleep_time_seconds)
-
-
-def get_variance(scanner: Scanner) -> float:
-    """Returns the variance between all the average scanner runtimes."""
-    vari_min = min(scanner_pool.cumulative_avg_runtime_list)
-    vari_max = max(scanner_pool.cumulative_avg_runtime_list)
-    vari_avg = sum(scanner_pool.cumulative_avg_runtime_list) / len(scanner_pool.cumulative_avg_runtime_list)
-    vari_dif = vari_max - vari_min
-    vari_pct = vari_dif / vari_avg
-    return scanner.individual_avg_runtime_seconds[-1] * vari_pct
+    obj["users"].set_score(str(comment_to_add.author), str(comment_to_add.id), comment_to_add.score)
 
 
 def sys_exit() -> None:
@@ -361,22 +280,22 @@ def create_file(file_name: str, content: str) -> None:
     """
     try:
         if os.path.isfile(ftp.LOCAL_JSON_DIR + file_name):
-            log.debug(file_name, " already exists")
+            log.debug("%s already exists", file_name)
         else:
             with open(ftp.LOCAL_JSON_DIR + file_name, "a") as f:
                 f.write(content)
-                log.debug(file_name, " was created")
+                log.debug("%s was created", file_name)
     except OSError:
         log.critical("Unable to create new file, terminating program")
         sys_exit()
 
 
-def build_subreddit_list(scanner_list) -> None:
+def build_subreddit_list(sub_names: List[str]) -> None:
     sub_list = {"subs": []}
     temp_sub_list = []
 
-    for scanner in scanner_list:
-        temp_sub_list.append(scanner.sub_name)
+    for sub_name in sub_names:
+        temp_sub_list.append(sub_name)
 
     temp_sub_list.sort(key=str.lower)
     sub_list["subs"] = temp_sub_list
@@ -389,108 +308,352 @@ def is_new_month(previous_day) -> bool:
     return previous_day > int(datetime.datetime.today().day)
 
 
+def export_web_files(sub_name: str, obj: dict, changed_users: Set[str], rebase: bool = False) -> None:
+    """Writes the web files of `obj` and queues their upload, see `web_deltas.publish` and `web_leaderboard.publish`.
+
+    Each manifest and index goes up after the files it lists, and the files none lists anymore are removed after that.
+    """
+    delta_files, removed_deltas = web_deltas.publish(ftp.LOCAL_WEB_DIR, sub_name, obj, changed_users, rebase)
+    pages, removed_pages = web_leaderboard.publish(ftp.LOCAL_WEB_DIR, sub_name, obj)
+    written = delta_files + pages
+    removed = removed_deltas + removed_pages
+    for web_file_name in written:
+        upload_file_to_ftp_server(web_file_name, ftp.LOCAL_WEB_DIR)
+    for web_file_name in removed:
+        try:
+            ftp.remove_file(web_file_name, ftp.LOCAL_WEB_DIR)
+        except (Exception,) as e:
+            log.error("%s: Unable to remove file", e)
+
+
+def scan_submissions(scanner: Scanner,
+                     obj: dict,
+                     changes: storage.Changes,
+                     cache: submission_cache.SubmissionCache,
+                     scanned_ids: Set[str],
+                     progress: Optional[checkpoint.Checkpoint] = None) -> bool:
+    """Scans the hot submissions of one subreddit and records every top-level comment in `obj`.
+
+    Every comment that is new or has a new score is also recorded in `changes`, so the store only has to write those.
+    Submissions that `cache` reports as unchanged since our last visit are skipped without fetching their comments.
+    Stops early, keeping everything scanned so far, when `STOP_EVENT` is set. Submissions that `progress` has already
+    finished are skipped, and every finished submission is added to it.
+
+    Args:
+      scanner: The Scanner object that we are currently working on.
+      obj: A dictionary that represents all user with their comment IDs and scores.
+      changes: The change set of the current pass.
+      cache: The submission cache of this subreddit.
+      scanned_ids: Filled with the ID of every comment scanned, so the score refresh can leave them alone.
+      progress: The checkpoint of the pass, if it should be saved while the scan runs.
+
+    Returns:
+      True if every hot submission was visited, False if the scan ended early.
+    """
+    total_posts = 0
+    skipped_posts = 0
+    resumed_posts = 0
+    total_comments = 0
+    completed = False
+    start_seconds = time.perf_counter()
+
+    try:
+        for submission in scanner.sub_instance.hot(limit=scanner.num_posts_to_scan):
+            if STOP_EVENT.is_set():
+                log.info("Stop requested, ending scan of r/%s early", scanner.sub_name)
+                break
+            # scan each post from the top down when sorted by "hot"
+            if submission.stickied is False:
+                total_posts += 1
+                if progress is not None and submission.id in progress.done:
+                    resumed_posts += 1
+                    continue
+                if not cache.should_scan(submission):
+                    skipped_posts += 1
+                    continue
+
+                submission.comments.replace_more(limit=0)
+                comment_ids = []
+
+                for comment in submission.comments:
+                    # scan each top-level comment
+                    if not comment.distinguished:
+                        user_id = str(comment.author)
+                        comment_ids.append(str(comment.id))
+                        total_comments += 1
+                        # FIXME this does not print in Docker logs. Do we want something printing every
+                        #  second in the Docker logs? I don't think that's what they are intended for.
+                        if ARGS.debug is not None:
+                            print("\r", "Began scanning submission ID " + str(submission.id) +
+                                  ", total Comments Scanned: " +
+                                  str(total_comments), end="")
+                        if user_id != "None":
+                            if user_exists(obj, user_id):
+                                changed = update_existing(obj, comment, user_id)
+                            else:
+                                add_new(obj, comment)
+                                changed = True
+                            if changed:
+                                changes[(user_id, str(comment.id))] = comment.score
+
+                # DONE scanning all comments in post
+                cache.record(submission)
+                scanned_ids.update(comment_ids)
+                if progress is not None:
+                    progress.record(submission.id, cache.entries[submission.id])
+                    progress.save_if_due(changes, scanned_ids)
+        else:
+            completed = True
+
+        trimmed_timestamp = datetime.datetime.utcnow()
+        trimmed_timestamp.replace(microsecond=round(trimmed_timestamp.microsecond, -3))
+        obj["timestamp"] = str(trimmed_timestamp)
+    except prawcore.exceptions.ServerError as e:
+        # this will catch HTTP server errors from Reddit's servers
+        log.error("%s", e)
+
+    elapsed_seconds = time.perf_counter() - start_seconds
+    budget = rate_limiter.get_budget()
+    metrics.COMMENTS_SCANNED.inc(total_comments, sub=scanner.sub_name)
+    if elapsed_seconds > 0:
+        metrics.COMMENTS_PER_SECOND.set(round(total_comments / elapsed_seconds, 2), sub=scanner.sub_name)
+    metrics.RATE_BUDGET_REMAINING.set(budget["remaining"])
+
+    log.info("       Total posts scanned = %s", total_posts)
+    log.info("   Unchanged posts skipped = %s", skipped_posts)
+    log.info("  Finished before resuming = %s", resumed_posts)
+    log.info("    Total comments scanned = %s", total_comments)
+    log.info("  Remaining request budget = %s", budget)
+    return completed
+
+
+def scan_subreddit(scanner: Scanner) -> int:
+    """Runs one full scan, flair and save cycle for a single subreddit.
+
+    Each call only ever touches the scanner's own store and export file, so several scanners can run this at the same
+    time.
+
+    Args:
+      scanner: The Scanner object that we are currently working on.
+
+    Returns:
+      The number of comments the scan found new or with a new score, which `scheduler` uses as the sub's activity.
+    """
+    log.info("    Now scanning subreddit = %s", scanner.sub_name)
+    changes = {}
+    new_month = False
+    scanned_ids = set()
+    cache = submission_cache.SubmissionCache(ftp.LOCAL_JSON_DIR, scanner.sub_name, ARGS.skip_policy, ARGS.skip_max_age)
+    # a pass that did not finish, here or before a restart, is picked up where it stopped
+    progress = checkpoint.Checkpoint(ftp.LOCAL_JSON_DIR, scanner.sub_name, scanner.interval_seconds)
+
+    with storage.open_store(ARGS.store, ftp.LOCAL_JSON_DIR, scanner.sub_name) as store:
+        obj = store.load()
+        top_users_file = None
+        if ARGS.top_users_capacity:
+            top_users_file = heavy_hitters.TopUsers(ftp.LOCAL_JSON_DIR, scanner.sub_name, ARGS.top_users_capacity)
+            # from here on, every rescored comment is handed to the summary too
+            top_users_file.watch(obj["users"])
+        progress.resume(obj, changes, scanned_ids, cache)
+        start_seconds = time.perf_counter()
+        try:
+            completed = scan_submissions(scanner, obj, changes, cache, scanned_ids, progress)
+            changed_comments = len(changes)
+            if not ARGS.no_refresh and not STOP_EVENT.is_set():
+                # rescored comments are activity too, a sub whose old comments keep moving is not idle
+                changed_comments += score_refresh.refresh_scores(scanner.reddit, obj, changes, scanned_ids, STOP_EVENT)
+        except (KeyboardInterrupt, SystemExit) as e:
+            # catches Ctrl+C and IDE program interruption to ensure we save what we have scanned
+            log.critical("%s :: Process halted, saving scanned comments! ::", e)
+            store.save(obj, changes)
+            cache.save(prune=False)
+            progress.save({}, scanned_ids)
+            raise
+
+        # DONE scanning all posts in subreddit, moving on to next scanner in the list, but first...
+        runtime_seconds = time.perf_counter() - start_seconds
+        scanner.record_runtime_seconds(runtime_seconds)
+        metrics.PASS_SECONDS.observe(runtime_seconds, sub=scanner.sub_name)
+        scanner.first_pass_done = True
+
+        if lease_coordinator is not None and not lease_coordinator.holds(scanner.sub_name):
+            # the lease ran out during the pass, another worker may be scanning the sub already
+            log.warn("Lost the lease on r/%s, its pass is not saved", scanner.sub_name)
+            progress.discard()
+            return changed_comments
+
+        top_users = None
+        if top_users_file is not None:
+            # counts the comments this pass added or rescored, before the store is saved, see `heavy_hitters.TopUsers`
+            top_users = top_users_file.update(obj["users"])
+
+        if is_new_month(scanner.previous_day) and not STOP_EVENT.is_set():
+            new_month = True
+            seal_month(obj, scanner)
+            if scanner.is_mod:
+                edit_flair(obj, scanner, top_users)
+            else:
+                user_data.clear_users(obj)
+                rollover_debug_log()
+            if top_users_file is not None:
+                top_users_file.discard()
+            # the month's data is archived and emptied, so there is nothing left to upsert
+            changes.clear()
+            store.clear()
+            # the next pass has to find last month's submissions again to fill the new month
+            cache.clear()
+            # and the submissions this pass finished were counted in the month that was just sealed
+            progress.discard()
+            progress = checkpoint.Checkpoint(ftp.LOCAL_JSON_DIR, scanner.sub_name, scanner.interval_seconds)
+
+        # update current day after `edit_flair` and before the next pass
+        scanner.previous_day = ARGS.day if ARGS.day > 0 else datetime.datetime.today().day
+
+        with metrics.PERSIST_SECONDS.time(sub=scanner.sub_name, store=ARGS.store):
+            store.save(obj, changes)
+            cache.save(prune=completed)
+        if completed:
+            progress.discard()
+        else:
+            # everything is in the store now, the next pass only needs to know which submissions are done
+            progress.save({}, scanned_ids)
+        log.info("       Total changes saved = %s", len(changes))
+        log.info("         Leaderboard stats = %s", leaderboard.get_stats(obj))
+
+    try:
+        export_web_files(scanner.sub_name, obj, {user for user, _ in changes}, new_month)
+    except FileNotFoundError as e:
+        log.critical("%s: nothing was exported, moving to next scanner.", e)
+    return changed_comments
+
+
+def run_pass(scanner: Scanner) -> int:
+    """Runs one pass of a scanner for `scheduler.DeadlineScheduler`, then publishes the debug log."""
+    changed_comments = scan_subreddit(scanner)
+    upload_file_to_ftp_server(DEBUG_FILENAME)
+    return changed_comments
+
+
+def start_lease_keeper(deadline_scheduler: scheduler.DeadlineScheduler) -> "coordinator.LeaseKeeper":
+    """Shares the subreddits with the other workers of `--coordinator`, adding and removing scanners as leases move."""
+    global lease_coordinator
+    import coordinator
+
+    lease_coordinator = coordinator.LeaseCoordinator(ARGS.coordinator, scanner_pool.get_worker_id(), ARGS.lease_seconds)
+    lease_coordinator.register(scanner_pool.get_subreddit_names())
+
+    # the lease keeper and the config watcher both change the scanners, each change of the list and the jobs is done
+    # under the scheduler's lock, so neither sees the other's half-done
+    def on_acquired(sub_names: Set[str]) -> None:
+        with deadline_scheduler.lock:
+            for scanner in scanner_pool.add_scanners(sorted(sub_names)):
+                deadline_scheduler.add_scanner(scanner)
+
+    def on_released(sub_names: Set[str]) -> None:
+        with deadline_scheduler.lock:
+            for sub_name in sub_names:
+                deadline_scheduler.remove_scanner(sub_name)
+            scanner_pool.remove_scanners(list(sub_names))
+
+    lease_keeper = coordinator.LeaseKeeper(lease_coordinator, deadline_scheduler.get_running, on_acquired, on_released)
+    # take a first share before the scheduler starts, so there is something to scan right away
+    lease_keeper.sync()
+    lease_keeper.start()
+    return lease_keeper
+
+
+def apply_config(deadline_scheduler: scheduler.DeadlineScheduler, old: config.BotConfig, new: config.BotConfig) -> None:
+    """Adds, removes and updates scanners to match a reloaded config, the scanners it did not change keep running.
+
+    With `--coordinator`, new subreddits go into the lease database and removed ones come out of it, and the lease
+    keeper adds or removes the scanners on its next sync.
+    """
+    added = [name for name in new.subreddits if name not in old.subreddits]
+    removed = [name for name in old.subreddits if name not in new.subreddits]
+    changed = [settings for name, settings in new.subreddits.items()
+               if name in old.subreddits and settings != old.subreddits[name]]
+    log.info("Reloaded %s, added %s, removed %s, changed %s", ARGS.config, added, removed,
+             [settings.name for settings in changed])
+    if new.bot_name != old.bot_name and ARGS.praw_site is None:
+        log.warn("The bot name changed to %s, which only takes effect after a restart", new.bot_name)
+
+    if lease_coordinator is not None:
+        lease_coordinator.register(added)
+        lease_coordinator.unregister(removed)
+    with deadline_scheduler.lock:
+        if lease_coordinator is None:
+            for scanner in scanner_pool.add_scanners(added):
+                deadline_scheduler.add_scanner(scanner)
+            for sub_name in removed:
+                deadline_scheduler.remove_scanner(sub_name)
+            scanner_pool.remove_scanners(removed)
+
+        for settings in changed:
+            scanner_pool.update_scanner(settings)
+            deadline_scheduler.set_base_interval(settings.name, settings.interval_sec)
+    if added or removed:
+        build_subreddit_list(new.get_sub_names())
+
+
+def start_config_watcher(deadline_scheduler: scheduler.DeadlineScheduler) -> config.ConfigWatcher:
+    """Reloads `--config` when it changes, and on SIGHUP where the platform has it."""
+    watcher = config.ConfigWatcher(ARGS.config_reload,
+                                   lambda old, new: apply_config(deadline_scheduler, old, new))
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: watcher.request_reload())
+    watcher.start()
+    return watcher
+
+
 def main_scanner_loop() -> None:
+    global DEBUG_FILENAME
+    metrics_filename = metrics.SNAPSHOT_FILENAME
+    if ARGS.coordinator is not None:
+        DEBUG_FILENAME = f"debug-{scanner_pool.get_worker_id()}.log"
+        metrics_filename = f"metrics-{scanner_pool.get_worker_id()}.json"
+    log.configure(ARGS.log_max_bytes, ARGS.log_backups, ARGS.log_rotate, ARGS.log_json, DEBUG_FILENAME)
+    serialization.use(ARGS.serializer)
     scanner_list = scanner_pool.get_scanner_list()
-    build_subreddit_list(scanner_list)
-    while True:
-        try:
-            for scanner in scanner_list:
-                log.info("    Now scanning subreddit = ", scanner.sub_name)
-                seconds_elapsed = 0
-                total_posts = 0
-                total_comments = 0
-                file_name = scanner.sub_name + ".json"
-                create_file(file_name, "{\"users\":{},\"timestamp\":[]}")
-
-                # we don't need a try/catch here because create_file guarantees the file exists
-                with open(ftp.LOCAL_JSON_DIR + file_name, "r+") as f:
-                    obj = json.load(f)
-                    start_seconds = time.perf_counter()
-
-                    try:
-                        for submission in scanner.sub_instance.hot(limit=scanner.num_posts_to_scan):
-                            # scan each post from the top down when sorted by "hot"
-                            if submission.stickied is False:
-                                total_posts += 1
-                                submission.comments.replace_more(limit=0)
-
-                                for comment in submission.comments:
-                                    # scan each top-level comment
-                                    if not comment.distinguished:
-                                        user_id = str(comment.author)
-                                        total_comments += 1
-                                        # FIXME this does not print in Docker logs. Do we want something printing every
-                                        #  second in the Docker logs? I don't think that's what they are intended for.
-                                        if ARGS.debug is not None:
-                                            print("\r", "Began scanning submission ID " + str(submission.id) +
-                                                  ", total Comments Scanned: " +
-                                                  str(total_comments), end="")
-                                        if user_id != "None":
-                                            if user_exists(obj, user_id):
-                                                update_existing(obj, comment, user_id)
-                                            else:
-                                                add_new(obj, comment)
-                                    time.sleep(0.1)  # avoids HTTP 429 errors
-
-                                # DONE scanning all comments in post
-
-                            time.sleep(0.1)  # avoids HTTP 429 errors
-                        trimmed_timestamp = datetime.datetime.utcnow()
-                        trimmed_timestamp.replace(microsecond=round(trimmed_timestamp.microsecond, -3))
-                        obj["timestamp"] = str(trimmed_timestamp)
-                    except prawcore.exceptions.ServerError as e:
-                        # this will catch HTTP server errors from Reddit's servers
-                        log.error(str(e))
-
-                # DONE scanning all posts in subreddit, moving on to next scanner in the list, but first...
-                seconds_elapsed += time.perf_counter() - start_seconds
-                scanner.append_avg_runtime_seconds(seconds_elapsed)
-                scanner.first_pass_done = True
-
-                log.info("       Total posts scanned = ", str(total_posts))
-                log.info("    Total comments scanned = ", str(total_comments))
-
-                if is_new_month(scanner.previous_day) and scanner.is_mod:
-                    edit_flair(obj, scanner)
-
-                # update current day after `edit_flair` and before `sleep`
-                scanner.previous_day = ARGS.day if ARGS.day > 0 else datetime.datetime.today().day
-
-                try:
-                    with open(ftp.LOCAL_JSON_DIR + file_name, "w") as f:
-                        # overwrite all old data with current data
-                        f.seek(0)
-                        json.dump(obj, f, indent=2)
-                    upload_file_to_ftp_server(file_name)
-                    sleep(scanner)
-                except FileNotFoundError as e:
-                    log.critical(f"{e}: nothing was saved, moving to next scanner.")
-
-            # END for-each scanner loop
-        except (KeyboardInterrupt, SystemExit, prawcore.exceptions.ServerError) as e:
-            # catches Ctrl+C and IDE program interruption to ensure we write to the json file
-            try:
-                log.critical(f"{e} :: Process halted, dumping JSON file! ::")
-                # highly unlikely that file_name is referenced before it is defined
-                with open(ftp.LOCAL_JSON_DIR + file_name, "w") as f:
-                    f.seek(0)
-                    json.dump(obj, f, indent=2)
-            except NameError:
-                sys_exit()
-            sys_exit()
+    ftp.start_publisher(ARGS.gzip_uploads)
+    metrics.start(ARGS.metrics_host, ARGS.metrics_port, ftp.LOCAL_JSON_DIR, ARGS.metrics_snapshot, metrics_filename)
+    # the web page lists every subreddit, whichever worker scans it
+    build_subreddit_list(scanner_pool.get_subreddit_names())
+
+    # in concurrent mode every scanner can run at the same time, otherwise they take turns on one thread. A worker
+    # of `--coordinator` could end up with any of the subreddits.
+    workers = max(1, len(scanner_pool.get_subreddit_names())) if ARGS.concurrent else 1
+    deadline_scheduler = scheduler.DeadlineScheduler(scanner_list, workers, ARGS.concurrent)
+    lease_keeper = start_lease_keeper(deadline_scheduler) if ARGS.coordinator is not None else None
+    config_watcher = start_config_watcher(deadline_scheduler)
+    try:
+        deadline_scheduler.run(run_pass, STOP_EVENT)
+    except (KeyboardInterrupt, SystemExit) as e:
+        log.critical("%s :: Process halted ::", e)
+    finally:
+        # whatever stopped the scheduler, the background threads are stopped too so the process can exit
+        STOP_EVENT.set()
+        config_watcher.stop()
+        if lease_keeper is not None:
+            # hand the subreddits over now, instead of when the leases run out
+            lease_keeper.stop()
+        # give the publisher a chance to upload the files we just saved
+        ftp.stop_publisher()
+        metrics.stop()
+        close_http_sessions()
+    sys_exit()
     # END main scanner loop
 
 
-def debug_function(file_name):
+def debug_function(sub_name):
     total_users = 0
     usage = {}
-    with open(ftp.LOCAL_JSON_DIR + file_name, "r+") as f:
-        obj = json.load(f)
-        debug_list = get_totals_array(obj)
+    with storage.open_store(ARGS.store, ftp.LOCAL_JSON_DIR, sub_name) as store:
+        obj = store.load()
+    debug_list = get_totals_array(obj)
 
-        for user in debug_list:
-            total_users += 1
-            usage[user[TOTAL_COMMENTS_IDX]] = usage.get(user[TOTAL_COMMENTS_IDX], 0) + 1
+    for user in debug_list:
+        total_users += 1
+        usage[user[TOTAL_COMMENTS_IDX]] = usage.get(user[TOTAL_COMMENTS_IDX], 0) + 1
 
     percents = [(num, amount / total_users * 100) for num, amount in usage.items()]
     for percent in percents:
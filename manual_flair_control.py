@@ -1,16 +1,20 @@
 import Scanner
+import flair_sync
+import flair_templates
+import log
 
 user_list = []
 
 
-def set_user_flair(scanner: Scanner, list_of_users: list, flair_template_id: str, delete_first: bool):
+def set_user_flair(scanner: Scanner, list_of_users: list, flair_template_id: str, delete_first: bool,
+                   dry_run: bool = False):
     """Provides a method to manually delete and set user flair, if needed.
 
     Add each reddit username to `user_list` list, provide the function a Scanner
     object and a flair template ID, and it will delete and set user flair.
 
-    Note: These operations take several seconds to complete, depending on the
-    size of the subreddit.
+    Only the users whose flair actually changes are sent to Reddit, 100 users
+    per request, see `flair_sync`.
 
     Args:
         scanner:
@@ -20,18 +24,20 @@ def set_user_flair(scanner: Scanner, list_of_users: list, flair_template_id: str
         flair_template_id:
           The flair template ID that you wish to apply.
         delete_first:
-          True if you want to delete all user flair across the entire sub first.
+          True if you want to delete the flair of every other user across the entire sub.
+        dry_run:
+          True if you only want to log the changes that would be made.
 
     Returns:
-        None
+        The FlairDiff that was applied, or None if the template does not exist.
     """
-
-    if delete_first:
-        # this deletes the flair for all users of a subreddit!
-        scanner.sub_instance.flair.delete_all()
-
-    for user in list_of_users:
-        scanner.sub_instance.flair.set(
-            user,
-            flair_template_id=flair_template_id
-        )
+    template = flair_templates.TEMPLATE_CACHE.get_template(scanner.sub_instance, flair_template_id)
+    if template is None:
+        log.warn("r/%s has no user flair template %s, no flair has been changed", scanner.sub_name, flair_template_id)
+        return None
+
+    return flair_sync.sync_flair(scanner.sub_instance,
+                                 list_of_users,
+                                 flair_sync.get_template_flair(template),
+                                 clear_others=delete_first,
+                                 dry_run=dry_run)
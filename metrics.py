@@ -0,0 +1,339 @@
+import contextlib
+import datetime
+import json
+import math
+import os
+import threading
+import time
+import log
+import storage
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SNAPSHOT_FILENAME = "metrics.json"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# warn once the scanners use this much of `--interval`, so there is time to react before passes start to overrun
+RUNTIME_WARN_FRACTION = 0.8
+# upper bounds, in seconds, of the histogram buckets
+REQUEST_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+PASS_BUCKETS = [10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 21600]
+
+Labels = Tuple[str, ...]
+
+
+class Metric:
+    """One named metric, with a value per combination of label values.
+
+    Every metric is thread safe, since scanners, the rate limiter and the FTP publisher all record from their own
+    threads.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+        if not label_names:
+            # a metric without labels exists from the start, so scrapes see a 0 instead of nothing
+            self._values[()] = self._new_value()
+
+    def _new_value(self):
+        return 0
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, key: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.label_names, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f"{name}=\"{value}\"" for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def get(self, **labels: str):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{self._format_labels(key)} {_format_number(value)}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [{"labels": dict(zip(self.label_names, key)), "value": value}
+                       for key, value in self._values.items()]
+        return {"type": self.type_name, "help": self.help_text, "samples": samples}
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name} is a counter and can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Counts observations in cumulative buckets, like a Prometheus histogram, plus their count and sum."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: List[float] = ()):
+        self.buckets = sorted(buckets) + [math.inf]
+        super().__init__(name, help_text, label_names)
+
+    def _new_value(self) -> dict:
+        return {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = self._new_value()
+            entry = self._values[key]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][index] += 1
+            entry["count"] += 1
+            entry["sum"] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes how many seconds the `with` block took, even if it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            for key, entry in self._values.items():
+                for bound, count in zip(self.buckets, entry["buckets"]):
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': _format_number(bound)})} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_number(entry['sum'])}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {entry['count']}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [{"labels": dict(zip(self.label_names, key)),
+                        "count": entry["count"],
+                        "sum": round(entry["sum"], 4),
+                        "buckets": {_format_number(bound): count
+                                    for bound, count in zip(self.buckets, entry["buckets"])}}
+                       for key, entry in self._values.items()]
+        return {"type": self.type_name, "help": self.help_text, "samples": samples}
+
+
+def _format_number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(round(float(value), 6))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"A metric named {metric.name} already exists")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def metrics(self) -> List[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "timestamp": str(datetime.datetime.utcnow()),
+            "metrics": {metric.name: metric.snapshot() for metric in self.metrics()},
+        }
+
+
+REGISTRY = Registry()
+
+REDDIT_REQUESTS = REGISTRY.register(Counter(
+    "statsbot_reddit_requests_total", "HTTP requests sent to Reddit."))
+REDDIT_ERRORS = REGISTRY.register(Counter(
+    "statsbot_reddit_errors_total", "Reddit responses with a 429 or 5xx status, and failed connections.", ("status",)))
+REDDIT_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "statsbot_reddit_request_seconds", "Time spent on each Reddit request, without the rate limiter's wait.",
+    buckets=REQUEST_BUCKETS))
+RATE_BUDGET_REMAINING = REGISTRY.register(Gauge(
+    "statsbot_rate_budget_remaining", "Requests left in the current Reddit rate limit window."))
+COMMENTS_SCANNED = REGISTRY.register(Counter(
+    "statsbot_comments_scanned_total", "Top-level comments scanned.", ("sub",)))
+COMMENTS_PER_SECOND = REGISTRY.register(Gauge(
+    "statsbot_comments_per_second", "Comments scanned per second during the latest pass.", ("sub",)))
+PASS_SECONDS = REGISTRY.register(Histogram(
+    "statsbot_pass_seconds", "Duration of each scan pass, including the score refresh.", ("sub",),
+    buckets=PASS_BUCKETS))
+SLEEP_SECONDS = REGISTRY.register(Histogram(
+    "statsbot_sleep_seconds", "Time each scanner sleeps between two passes.", ("sub",), buckets=PASS_BUCKETS))
+PERSIST_SECONDS = REGISTRY.register(Histogram(
+    "statsbot_persist_seconds", "Time spent saving a subreddit's data and submission cache.", ("sub", "store"),
+    buckets=REQUEST_BUCKETS))
+FTP_UPLOAD_SECONDS = REGISTRY.register(Histogram(
+    "statsbot_ftp_upload_seconds", "Time spent publishing each file to the FTP server.", buckets=REQUEST_BUCKETS))
+FTP_UPLOADS = REGISTRY.register(Counter(
+    "statsbot_ftp_uploads_total", "Files handled by the FTP publisher, by result.", ("result",)))
+CUMULATIVE_RUNTIME_SECONDS = REGISTRY.register(Gauge(
+    "statsbot_cumulative_runtime_seconds",
+    "Seconds of scanning the scanners need per --interval, across all scanner threads.", ("scope",)))
+SCAN_INTERVAL_SECONDS = REGISTRY.register(Gauge(
+    "statsbot_scan_interval_seconds", "Interval the scheduler currently gives each subreddit.", ("sub",)))
+SCAN_SLACK_SECONDS = REGISTRY.register(Gauge(
+    "statsbot_scan_slack_seconds", "Time between the expected end of the latest pass and its deadline.", ("sub",)))
+COMMENT_VELOCITY = REGISTRY.register(Gauge(
+    "statsbot_comment_velocity", "Comments added or rescored per second between two passes.", ("sub",)))
+SCHEDULER_UTILIZATION = REGISTRY.register(Gauge(
+    "statsbot_scheduler_utilization", "Share of the scanner threads' time that passes need, above 1 they overrun."))
+RUNTIME_BUDGET_RATIO = REGISTRY.register(Gauge(
+    "statsbot_runtime_budget_ratio", "Cumulative runtime divided by --interval, 1 or more means passes overrun.",
+    ("scope",)))
+
+
+def check_runtime_budget(runtime_sec: float, interval_sec: float, scope: str) -> float:
+    """Records how much of `interval_sec` the scanners use, and warns when they get close to using all of it.
+
+    Args:
+      runtime_sec: The seconds of scanning needed per `interval_sec`, see `scheduler.DeadlineScheduler`.
+      interval_sec: The `--interval` every scanner should finish within.
+      scope: "all" for every scanner together.
+
+    Returns:
+      The ratio of `runtime_sec` to `interval_sec`.
+    """
+    ratio = runtime_sec / interval_sec
+    CUMULATIVE_RUNTIME_SECONDS.set(round(runtime_sec, 2), scope=scope)
+    RUNTIME_BUDGET_RATIO.set(round(ratio, 4), scope=scope)
+    if RUNTIME_WARN_FRACTION <= ratio < 1:
+        log.warn("Runtime of %s is %s%% of the %s second interval, scans will soon start to overrun",
+                 scope, round(ratio * 100), interval_sec)
+    return ratio
+
+
+def _create_server(host: str, port: int) -> "ThreadingHTTPServer":
+    # http.server pulls in the email and socketserver modules, so it is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path in ("/", "/metrics"):
+                body = REGISTRY.render_prometheus().encode("utf-8")
+                content_type = PROMETHEUS_CONTENT_TYPE
+            elif self.path == "/metrics.json":
+                body = json.dumps(REGISTRY.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            # scrapes every few seconds would drown out the scanner's own log lines
+            pass
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
+
+
+class SnapshotWriter(threading.Thread):
+    """Writes every metric to a JSON file at a fixed interval, for hosts that cannot scrape the HTTP endpoint."""
+
+    def __init__(self, path: str, interval_sec: float):
+        super().__init__(name="metrics-snapshot", daemon=True)
+        self.path = path
+        self.interval_sec = interval_sec
+        self._stop_event = threading.Event()
+
+    def write(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            storage.write_atomically(self.path, json.dumps(REGISTRY.snapshot(), indent=2))
+        except OSError as e:
+            log.error("%s: Unable to write metrics snapshot", e)
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval_sec):
+            self.write()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.write()
+
+
+server: Optional["ThreadingHTTPServer"] = None
+snapshot_writer: Optional[SnapshotWriter] = None
+
+
+def start(host: str, port: int, snapshot_dir: str, snapshot_interval_sec: float,
+          snapshot_filename: str = SNAPSHOT_FILENAME) -> None:
+    """Starts the HTTP endpoint and the JSON snapshots. A port or interval of 0 turns that one off.
+
+    Metrics are recorded either way, starting only decides whether anybody can read them. Processes that share
+    `snapshot_dir` need a `snapshot_filename` each, or they overwrite each other's snapshots.
+    """
+    global server, snapshot_writer
+    if port and server is None:
+        try:
+            server = _create_server(host, port)
+        except OSError as e:
+            log.error("%s: Unable to serve metrics on %s:%s", e, host, port)
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            log.info("Serving metrics on http://%s:%s/metrics", host, port)
+    if snapshot_interval_sec and snapshot_writer is None:
+        snapshot_writer = SnapshotWriter(os.path.join(snapshot_dir, snapshot_filename), snapshot_interval_sec)
+        snapshot_writer.start()
+
+
+def stop() -> None:
+    """Stops the HTTP endpoint, and writes one last snapshot so the final numbers are not lost."""
+    global server, snapshot_writer
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+    if snapshot_writer is not None:
+        snapshot_writer.stop()
+        snapshot_writer = None
@@ -0,0 +1,173 @@
+import threading
+import time
+import log
+import metrics
+import prawcore
+from typing import Optional
+
+# Reddit allows 600 requests per 10 minute window for OAuth clients. We only use these numbers until the first response
+# tells us what the real budget is.
+DEFAULT_WINDOW_REQUESTS = 600
+DEFAULT_WINDOW_SEC = 600
+# never send two requests closer together than this, even with plenty of budget left
+MIN_REQUEST_INTERVAL_SEC = 0.0
+# how long to wait after a 429 that has no Retry-After header, doubled for each 429 in a row
+BACKOFF_BASE_SEC = 2
+MAX_BACKOFF_SEC = 300
+MAX_429_RETRIES = 5
+
+
+class RateLimiter:
+    """A token bucket that every scanner, and every Reddit session, shares.
+
+    The bucket holds the number of requests we may still send before Reddit's rate limit window resets. It is refilled
+    from the X-Ratelimit-Remaining and X-Ratelimit-Reset headers of every response, so it always mirrors the budget
+    Reddit reports rather than a guess. Requests are spread evenly over the time left in the window, with no bursts:
+    600 requests left and 600 seconds to go means one request per second, however many scanners are waiting. The pace
+    follows the budget, so one that runs low slows everyone down before Reddit has to.
+
+    After a 429 response the bucket is drained and all callers wait for the Retry-After time, or an exponentially
+    growing backoff if the header is missing.
+
+    prawcore also keeps a limiter of its own in every Reddit session, which waits before this one. It holds the next
+    request back by half of (seconds until the reset - requests left), at most 10 seconds, so not at all while as many
+    requests are left as seconds. Both count from the previous request, so their waits overlap rather than add up, and
+    the longer one decides. While the budget lasts at this limiter's pace, that is this one. Once the budget has been
+    spent ahead of the clock, for example by another program on the same account, prawcore's is usually longer.
+    """
+
+    def __init__(self, window_requests: int, window_sec: float, min_interval_sec: float):
+        self.min_interval_sec = min_interval_sec
+        self._lock = threading.Lock()
+        self._window_sec = window_sec
+        self._capacity = float(window_requests)
+        self._tokens = float(window_requests)
+        self._reset_at = time.monotonic() + window_sec
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+        self._consecutive_429s = 0
+        self.total_requests = 0
+        self.total_429s = 0
+
+    def _refill(self, now: float) -> None:
+        if now >= self._reset_at:
+            self._tokens = self._capacity
+            self._reset_at = now + self._window_sec
+
+    def acquire(self) -> None:
+        """Blocks the calling thread until one more request fits in the budget, then takes it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            slot = max(now, self._next_slot, self._blocked_until)
+
+            if self._tokens < 1:
+                # nothing left in this window, so wait for the reset and start a fresh one
+                slot = max(slot, self._reset_at)
+                self._tokens = self._capacity
+                self._reset_at = slot + self._window_sec
+
+            spacing = max(self.min_interval_sec, (self._reset_at - slot) / self._tokens)
+            self._tokens -= 1
+            self._next_slot = slot + spacing
+            self.total_requests += 1
+
+        if slot > now:
+            time.sleep(slot - now)
+
+    def update(self, headers) -> None:
+        """Syncs the bucket with the X-Ratelimit headers of a response, if it has them."""
+        if "x-ratelimit-remaining" not in headers:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            remaining = float(headers["x-ratelimit-remaining"])
+            seconds_to_reset = float(headers.get("x-ratelimit-reset", self._window_sec))
+            used = float(headers.get("x-ratelimit-used", 0))
+            self._tokens = remaining
+            self._capacity = max(1.0, remaining + used)
+            self._window_sec = max(self._window_sec, seconds_to_reset)
+            self._reset_at = now + seconds_to_reset
+            self._consecutive_429s = 0
+
+    def backoff(self, retry_after_sec: Optional[float] = None) -> float:
+        """Drains the bucket after a 429 and returns how long every caller will now wait."""
+        with self._lock:
+            self._consecutive_429s += 1
+            self.total_429s += 1
+            if retry_after_sec is None:
+                retry_after_sec = min(MAX_BACKOFF_SEC, BACKOFF_BASE_SEC ** self._consecutive_429s)
+            now = time.monotonic()
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, now + retry_after_sec)
+            # the next response will tell us the real budget again
+            self._reset_at = self._blocked_until
+            return retry_after_sec
+
+    def budget(self) -> dict:
+        """Returns a snapshot of the remaining budget, for logging and monitoring."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "remaining": int(self._tokens),
+                "capacity": int(self._capacity),
+                "seconds_to_reset": round(max(0.0, self._reset_at - now), 2),
+                "total_requests": self.total_requests,
+                "total_429s": self.total_429s,
+            }
+
+
+SHARED_LIMITER = RateLimiter(DEFAULT_WINDOW_REQUESTS, DEFAULT_WINDOW_SEC, MIN_REQUEST_INTERVAL_SEC)
+# requests sent by the current thread, so each scanner pass can count its own share of the budget
+thread_counts = threading.local()
+
+
+def get_retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """A prawcore requestor that sends every HTTP request through `SHARED_LIMITER`.
+
+    Pass it to `praw.Reddit` as `requestor_class`. Only real HTTP requests are paced, so iterating over comments that
+    PRAW has already fetched costs nothing. 429 responses are retried here, after the limiter's backoff, so they never
+    reach the scan loop unless Reddit keeps refusing us.
+    """
+
+    limiter = SHARED_LIMITER
+
+    def request(self, *args, **kwargs):
+        for _ in range(MAX_429_RETRIES):
+            self.limiter.acquire()
+            metrics.REDDIT_REQUESTS.inc()
+            thread_counts.requests = get_thread_requests() + 1
+            try:
+                with metrics.REDDIT_REQUEST_SECONDS.time():
+                    response = super().request(*args, **kwargs)
+            except prawcore.exceptions.RequestException:
+                metrics.REDDIT_ERRORS.inc(status="connection")
+                raise
+            self.limiter.update(response.headers)
+            if response.status_code >= 500:
+                metrics.REDDIT_ERRORS.inc(status="5xx")
+            if response.status_code != 429:
+                return response
+            metrics.REDDIT_ERRORS.inc(status="429")
+            wait_sec = self.limiter.backoff(get_retry_after(response))
+            log.warn("HTTP 429 from Reddit, all scanners are backing off for %s seconds", round(wait_sec, 2))
+        return response
+
+
+def get_thread_requests() -> int:
+    """Returns how many Reddit requests the calling thread has sent so far."""
+    return getattr(thread_counts, "requests", 0)
+
+
+def get_budget() -> dict:
+    """Returns how much of the shared Reddit rate budget is left, see `RateLimiter.budget`."""
+    return SHARED_LIMITER.budget()
@@ -0,0 +1,237 @@
+import re
+from array import array
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Reddit IDs are base36 numbers without leading zeros, so they survive the round trip through an integer
+BASE36_ID_PATTERN = re.compile("[1-9a-z][0-9a-z]*")
+is_base36_id = BASE36_ID_PATTERN.fullmatch
+BASE36_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# every two-digit base36 string, so an ID is encoded two digits per division
+BASE36_PAIRS = [high + low for high in BASE36_DIGITS for low in BASE36_DIGITS]
+END = -1
+# what `UserTable.encode_id` returns for an ID the table has never seen, no comment has it since "0" is not base36
+UNKNOWN_ID = 0
+# `UserTable._rows_by_id` is resized to keep it at most half full, so a lookup rarely probes more than two slots
+MIN_INDEX_SIZE = 8
+# Fibonacci hashing, spreads the consecutive IDs Reddit hands out over the whole row index
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def encode_base36(number: int) -> str:
+    pairs = []
+    while number:
+        number, remainder = divmod(number, len(BASE36_PAIRS))
+        pairs.append(BASE36_PAIRS[remainder])
+    return "".join(reversed(pairs)).lstrip("0") or "0"
+
+
+class UserTable:
+    """Every user and comment of one subreddit, in flat typed arrays instead of a dict per user and per comment.
+
+    Comment `i` has its ID in `ids[i]`, decoded from base36 into an integer, its score in `scores[i]` and the index of
+    its user in `owners[i]`. The comments of one user are linked in the order they were added, through `_next`, from
+    `_first[user]` to `_last[user]`. `_rows_by_id` is an open-addressing hash table from comment ID to row, so a
+    comment is found without walking its user's list. That costs about 28 bytes per comment and a few more per user,
+    instead of a `str` and a dict slot per comment and two dicts per user.
+
+    It reads like the {username: {comment ID: score}} dict it replaces: `name in table`, `len(table)`, iteration over
+    the names in the order they were added, and `table[name]`, a `UserComments` view that reads and writes that user's
+    comments by their string ID.
+    """
+
+    __slots__ = ["names", "ids", "scores", "owners", "counts", "_user_indexes", "_first", "_last", "_next",
+                 "_rows_by_id", "_odd_ids", "_odd_codes", "rescored"]
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids = array("q")
+        self.scores = array("i")
+        self.owners = array("i")
+        self.counts = array("i")
+        self._user_indexes: Dict[str, int] = {}
+        self._first = array("i")
+        self._last = array("i")
+        self._next = array("i")
+        self._rows_by_id = array("i", [END]) * MIN_INDEX_SIZE
+        # IDs that are not plain base36 are kept as they are, and encoded as -1, -2, ... into this list
+        self._odd_ids: List[str] = []
+        self._odd_codes: Dict[str, int] = {}
+        # {row: score before} of every comment rescored since this was set to a dict, see `heavy_hitters.TopUsers`
+        self.rescored: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._user_indexes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, name: str) -> "UserComments":
+        return UserComments(self, self._user_indexes[name])
+
+    def items(self) -> Iterator[Tuple[str, "UserComments"]]:
+        for index, name in enumerate(self.names):
+            yield name, UserComments(self, index)
+
+    @property
+    def comment_count(self) -> int:
+        return len(self.ids)
+
+    def encode_id(self, comment_id: str) -> int:
+        """Returns the integer of a comment ID to look it up with, `UNKNOWN_ID` for an odd ID that was never added."""
+        if is_base36_id(comment_id):
+            return int(comment_id, 36)
+        return self._odd_codes.get(comment_id, UNKNOWN_ID)
+
+    def add_id(self, comment_id: str) -> int:
+        """Returns the integer of a comment ID to store it under, remembering it first if it is an odd ID."""
+        if is_base36_id(comment_id):
+            return int(comment_id, 36)
+        code = self._odd_codes.get(comment_id)
+        if code is None:
+            self._odd_ids.append(comment_id)
+            code = self._odd_codes[comment_id] = -len(self._odd_ids)
+        return code
+
+    def decode_id(self, code: int) -> str:
+        return encode_base36(code) if code >= 0 else self._odd_ids[-1 - code]
+
+    def add_user(self, name: str) -> int:
+        """Adds a user without comments, if they are new, and returns their index."""
+        index = self._user_indexes.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names.append(name)
+            self._user_indexes[name] = index
+            self.counts.append(0)
+            self._first.append(END)
+            self._last.append(END)
+        return index
+
+    def _find_slot(self, code: int) -> int:
+        rows = self._rows_by_id
+        ids = self.ids
+        mask = len(rows) - 1
+        slot = (code * HASH_MULTIPLIER >> 32) & mask
+        while rows[slot] != END and ids[rows[slot]] != code:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow_rows_by_id(self) -> None:
+        self._rows_by_id = array("i", [END]) * (len(self._rows_by_id) * 2)
+        for row in range(len(self.ids)):
+            self._rows_by_id[self._find_slot(self.ids[row])] = row
+
+    def find(self, user_index: int, code: int) -> int:
+        """Returns the position of one of a user's comments in the flat arrays, or `END` if they do not have it."""
+        # `_find_slot` inlined, this runs once for every scanned comment
+        rows = self._rows_by_id
+        ids = self.ids
+        mask = len(rows) - 1
+        slot = (code * HASH_MULTIPLIER >> 32) & mask
+        row = rows[slot]
+        while row != END and ids[row] != code:
+            slot = (slot + 1) & mask
+            row = rows[slot]
+        if row == END or self.owners[row] == user_index:
+            return row
+        # Reddit IDs are unique, but a file could still list the same ID under two users. The index only knows the
+        # latest of them, so look through the user's own comments.
+        following = self._next
+        row = self._first[user_index]
+        while row != END and self.ids[row] != code:
+            row = following[row]
+        return row
+
+    def append(self, user_index: int, code: int, score: int) -> None:
+        """Adds a comment that the user does not have yet, after all of their other comments."""
+        row = len(self.ids)
+        if (row + 1) * 2 > len(self._rows_by_id):
+            self._grow_rows_by_id()
+        self._rows_by_id[self._find_slot(code)] = row
+        self.ids.append(code)
+        self.scores.append(score)
+        self.owners.append(user_index)
+        self._next.append(END)
+        if self._last[user_index] == END:
+            self._first[user_index] = row
+        else:
+            self._next[self._last[user_index]] = row
+        self._last[user_index] = row
+        self.counts[user_index] += 1
+
+    def set_score(self, name: str, comment_id: str, score: int) -> None:
+        """Sets the score of one comment, adding the user and the comment if they are new."""
+        UserComments(self, self.add_user(name))[comment_id] = score
+
+    def get_rows(self, user_index: int) -> Iterator[int]:
+        row = self._first[user_index]
+        following = self._next
+        while row != END:
+            yield row
+            row = following[row]
+
+
+class UserComments(MutableMapping):
+    """The {comment ID: score} of one user in a `UserTable`, a view that holds no comments itself.
+
+    Comments can be added and rescored, but never removed, since the bot never forgets a comment during a month.
+    """
+
+    __slots__ = ["_table", "_index"]
+
+    def __init__(self, table: UserTable, index: int):
+        self._table = table
+        self._index = index
+
+    def __len__(self) -> int:
+        return self._table.counts[self._index]
+
+    def __iter__(self) -> Iterator[str]:
+        table = self._table
+        for row in table.get_rows(self._index):
+            yield table.decode_id(table.ids[row])
+
+    def __getitem__(self, comment_id: str) -> int:
+        row = self._table.find(self._index, self._table.encode_id(comment_id))
+        if row == END:
+            raise KeyError(comment_id)
+        return self._table.scores[row]
+
+    def get(self, comment_id: str, default=None):
+        # `Mapping.get` goes through `__getitem__` and a KeyError, this is on the scanner's hot path
+        table = self._table
+        row = table.find(self._index, table.encode_id(comment_id))
+        return default if row == END else table.scores[row]
+
+    def __contains__(self, comment_id) -> bool:
+        return self._table.find(self._index, self._table.encode_id(comment_id)) != END
+
+    def __setitem__(self, comment_id: str, score: int) -> None:
+        table = self._table
+        code = table.add_id(comment_id)
+        row = table.find(self._index, code)
+        if row == END:
+            table.append(self._index, code, score)
+        else:
+            rescored = table.rescored
+            if rescored is not None and row not in rescored:
+                rescored[row] = table.scores[row]
+            table.scores[row] = score
+
+    def __delitem__(self, comment_id: str) -> None:
+        raise TypeError("comments are never removed from a UserTable")
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        # one walk over the user's comments, instead of one lookup per ID like `MutableMapping.items` would do
+        table = self._table
+        for row in table.get_rows(self._index):
+            yield table.decode_id(table.ids[row]), table.scores[row]
+
+    def values(self) -> Iterator[int]:
+        table = self._table
+        for row in table.get_rows(self._index):
+            yield table.scores[row]
@@ -1,35 +1,67 @@
+import config
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from args import get_args
-from Scanner import Scanner
+from Scanner import Scanner, get_reddit
 
 ARGS = get_args()
-NUM_POSTS_TO_SCAN = ARGS.posts
-# must be larger than the cumulative average runtime
-SCANNER_INTERVAL_SEC = ARGS.interval
 scanner_list = []
-cumulative_avg_runtime_list = []
 
-# Subreddits added to this list will be automatically added to the list of scanners.
-subreddit_list = [
-    "cooking",
-    "cookingforbeginners",
-    "AskBaking",
-    "AskCulinary"
-]
+
+def get_praw_site() -> str:
+    """Returns the praw.ini site, and so the account and rate budget, of this worker."""
+    return ARGS.praw_site or config.get_config().bot_name
+
+
+def get_worker_id() -> str:
+    return ARGS.worker_id or get_praw_site()
+
+
+def get_subreddit_names() -> List[str]:
+    """Returns every subreddit of the config, see `statsbot.ini`. Scanners are added for them automatically."""
+    return config.get_config().get_sub_names()
+
+
+def build_scanner(name: str) -> Scanner:
+    settings = config.get_settings(name)
+    return Scanner(
+        sub_name=name,
+        bot_name=get_praw_site(),
+        num_posts_to_scan=settings.posts,
+        # the target interval of the scanner, `scheduler` shortens it for busy subs and lengthens it for quiet ones
+        interval_sec=settings.interval_sec
+    )
 
 
 def build_scanner_list():
-    scanner_class_builder = {
-        name: Scanner(
-            sub_name=name,
-            bot_name="CookingStatsBot",
-            num_posts_to_scan=NUM_POSTS_TO_SCAN,
-            interval_sec=SCANNER_INTERVAL_SEC
-        ) for name in subreddit_list
-    }
+    # log in once up front, every scanner then shares this session
+    get_reddit(get_praw_site())
+    if ARGS.coordinator is None:
+        add_scanners(get_subreddit_names())
+    # otherwise the scanners are added as this worker wins leases, see `coordinator`
+
+
+def add_scanners(sub_names: List[str]) -> List[Scanner]:
+    """Builds scanners for more subreddits, adds them to the list and returns them."""
+    if not sub_names:
+        return []
+    # scanners are built side by side, so startup time stays flat as the config grows
+    with ThreadPoolExecutor(max_workers=len(sub_names), thread_name_prefix="startup") as executor:
+        added = list(executor.map(build_scanner, sub_names))
+    scanner_list.extend(added)
+    return added
 
-    for sub in subreddit_list:
-        scanner_list.append(scanner_class_builder[sub])
+
+def remove_scanners(sub_names: List[str]) -> None:
+    scanner_list[:] = [scanner for scanner in scanner_list if scanner.sub_name not in sub_names]
+
+
+def update_scanner(settings: config.SubredditSettings) -> None:
+    """Gives a scanner new settings, which its next pass uses."""
+    for scanner in scanner_list:
+        if scanner.sub_name == settings.name:
+            scanner.num_posts_to_scan = settings.posts
+            scanner.interval_seconds = settings.interval_sec
 
 
 def get_scanner_list() -> List[Scanner]:
@@ -42,15 +74,3 @@ def first_pass_completed() -> bool:
             return False
 
     return True
-
-
-def get_cumulative_avg_runtime() -> int:
-    cumulative_avg_runtime = 0
-
-    for scanner in scanner_list:
-        if scanner.first_pass_done:
-            avg_runtime = scanner.get_avg_runtime_seconds()
-            cumulative_avg_runtime += avg_runtime
-
-    cumulative_avg_runtime_list.append(cumulative_avg_runtime)
-    return round(cumulative_avg_runtime, 2)
@@ -0,0 +1,308 @@
+import datetime
+import math
+import operator
+import threading
+import time
+import log
+import metrics
+import rate_limiter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set
+
+# weight of the newest measurement in every running average, older passes fade out instead of piling up in a list
+EWMA_ALPHA = 0.3
+# how far a subreddit's interval may move away from `--interval` because of its comment velocity
+MIN_INTERVAL_FACTOR = 0.25
+MAX_INTERVAL_FACTOR = 4
+# keeps a subreddit with no new comments at all from getting an infinite interval
+VELOCITY_FLOOR = 1e-4
+# the longest the dispatcher sleeps, so a scanner added from another thread starts within this long
+MAX_WAIT_SEC = 5
+# a failed pass is retried after this long, doubled after every failure in a row, up to the longest interval
+RETRY_BASE_SEC = 30
+
+
+def _ewma(average: Optional[float], value: float) -> float:
+    return value if average is None else average + EWMA_ALPHA * (value - average)
+
+
+class ScanJob:
+    """The schedule of one scanner.
+
+    A pass of the scanner is released `interval_sec` after the previous pass started, and should be finished by its
+    deadline, one more `interval_sec` later, when the pass after it is released. Every other field is a running average
+    of past passes, so a job takes the same memory after months of uptime as after its first pass.
+    """
+
+    __slots__ = ["scanner", "base_interval_sec", "interval_sec", "release_at", "last_start", "running",
+                 "runtime_sec", "requests_per_pass", "velocity", "slack_sec", "failures"]
+
+    def __init__(self, scanner, now: float):
+        self.scanner = scanner
+        self.base_interval_sec = scanner.interval_seconds
+        self.interval_sec = float(scanner.interval_seconds)
+        # every scanner is due right away when the program starts
+        self.release_at = now
+        self.last_start = None
+        self.running = False
+        self.runtime_sec = None
+        self.requests_per_pass = None
+        # comments added or rescored per second between two passes
+        self.velocity = None
+        self.slack_sec = None
+        # passes that failed in a row, see `DeadlineScheduler.fail`
+        self.failures = 0
+
+    @property
+    def deadline(self) -> float:
+        return self.release_at + self.interval_sec
+
+    @property
+    def name(self) -> str:
+        return self.scanner.sub_name
+
+
+class DeadlineScheduler:
+    """Runs scanner passes earliest-deadline-first, rescanning busy subreddits more often than quiet ones.
+
+    Each scanner gets its own interval. With no history yet, that is its `interval_seconds`. After that, the request
+    budget that scanning every subreddit once per `interval_seconds` would take is shared out again, in proportion to
+    the square root of each subreddit's comment velocity, and the intervals follow from what each one gets. The total
+    number of Reddit requests therefore stays the same, but they go where comments actually change.
+
+    Among the passes that are released, the one with the earliest deadline runs first, on up to `workers` threads. If
+    the passes could not all meet their deadlines, every interval is stretched until they can, since EDF meets every
+    deadline whenever that is possible at all. The slack of each pass, the time between its expected end and its
+    deadline, is logged and exported, see `metrics`. Scanners can be added and removed while it runs, see
+    `coordinator` and `main.apply_config`. When `concurrent` is set, the workers grow with the scanners, so every
+    scanner can always run at the same time.
+    """
+
+    def __init__(self, scanners: list, workers: int, concurrent: bool = False):
+        now = time.monotonic()
+        self.jobs = [ScanJob(scanner, now) for scanner in scanners]
+        # removed jobs whose last pass is still running
+        self._retired: List[ScanJob] = []
+        self.concurrent = concurrent
+        self.workers = max(workers, len(self.jobs)) if concurrent else workers
+        # reentrant, so the callers of `add_scanner` and `remove_scanner` can hold it around them, see `lock`
+        self._lock = threading.RLock()
+
+    @property
+    def lock(self) -> threading.RLock:
+        """The lock of the jobs, to hold while the scanners change together with them, like `scanner_pool`'s list."""
+        return self._lock
+
+    def add_scanner(self, scanner) -> None:
+        """Schedules one more scanner, its first pass is due right away."""
+        with self._lock:
+            # the list is replaced rather than changed, so loops over it outside the lock are not disturbed
+            self.jobs = self.jobs + [ScanJob(scanner, time.monotonic())]
+            if self.concurrent:
+                self.workers = max(self.workers, len(self.jobs))
+
+    def remove_scanner(self, sub_name: str) -> None:
+        """Stops scheduling a scanner. A pass of it that is running still finishes."""
+        with self._lock:
+            self._retired += [job for job in self.jobs if job.name == sub_name and job.running]
+            self.jobs = [job for job in self.jobs if job.name != sub_name]
+
+    def set_base_interval(self, sub_name: str, interval_sec: float) -> None:
+        """Changes the interval a scanner gets before its comment velocity is taken into account."""
+        with self._lock:
+            for job in self.jobs:
+                if job.name == sub_name:
+                    job.base_interval_sec = interval_sec
+
+    def _get_running(self) -> Set[str]:
+        return {job.name for job in self.jobs + self._retired if job.running}
+
+    def get_running(self) -> Set[str]:
+        """Returns the names of the subreddits being scanned right now."""
+        with self._lock:
+            return self._get_running()
+
+    def claim_released(self, now: float) -> Optional[ScanJob]:
+        """Marks the released job with the earliest deadline as running and returns it, if there is one."""
+        with self._lock:
+            # a scanner that was removed and added again waits for its old pass to end
+            running = self._get_running()
+            released = [job for job in self.jobs
+                        if not job.running and job.release_at <= now and job.name not in running]
+            if not released:
+                return None
+            # there is one job per subreddit, so a scan of the list costs less than keeping a heap in order
+            job = min(released, key=lambda each: (each.deadline, each.name))
+            job.running = True
+            return job
+
+    def get_next_release(self) -> Optional[float]:
+        with self._lock:
+            waiting = [job.release_at for job in self.jobs if not job.running]
+            return min(waiting) if waiting else None
+
+    def start(self, job: ScanJob, now: float) -> None:
+        with self._lock:
+            job.slack_sec = job.deadline - now - (job.runtime_sec or 0)
+        metrics.SCAN_SLACK_SECONDS.set(round(job.slack_sec, 2), sub=job.name)
+        if job.slack_sec < 0:
+            log.warn("r/%s starts %s seconds too late to meet its deadline", job.name, round(-job.slack_sec, 2))
+
+    def finish(self, job: ScanJob, started: float, runtime_sec: float, comments: int, requests: int) -> None:
+        """Records a finished pass and schedules the next one.
+
+        Args:
+          job: The job that ran.
+          started: When the pass started, from `time.monotonic`.
+          runtime_sec: How long the pass took.
+          comments: The number of comments the pass found new or with a new score.
+          requests: The number of Reddit requests the pass sent.
+        """
+        with self._lock:
+            if job.last_start is not None and started > job.last_start:
+                # the first pass finds the whole month at once, so it says nothing about the velocity
+                job.velocity = _ewma(job.velocity, comments / (started - job.last_start))
+            job.runtime_sec = _ewma(job.runtime_sec, runtime_sec)
+            job.requests_per_pass = _ewma(job.requests_per_pass, max(1, requests))
+            job.last_start = started
+            job.failures = 0
+            job.running = False
+            if job in self._retired:
+                self._retired.remove(job)
+            utilization = self._update_intervals()
+            for each in self.jobs:
+                # a new interval moves the next release of every scanner that has run before, unless it is backing off
+                if not each.running and each.last_start is not None and not each.failures:
+                    each.release_at = each.last_start + each.interval_sec
+
+        for each in self.jobs:
+            metrics.SCAN_INTERVAL_SECONDS.set(round(each.interval_sec, 2), sub=each.name)
+            if each.velocity is not None:
+                metrics.COMMENT_VELOCITY.set(round(each.velocity, 6), sub=each.name)
+        # the same alert as before: how much of `--interval` the scanners need, once every one has run
+        if self.jobs and all(each.runtime_sec is not None for each in self.jobs):
+            base_interval_sec = max(each.base_interval_sec for each in self.jobs)
+            metrics.check_runtime_budget(utilization * base_interval_sec, base_interval_sec, "all")
+
+        sleep_sec = max(0.0, job.release_at - time.monotonic())
+        metrics.SLEEP_SECONDS.observe(sleep_sec, sub=job.name)
+        due = datetime.datetime.now() + datetime.timedelta(seconds=sleep_sec)
+        log.info("    Finished scanning r/%s = %s seconds", job.name, round(runtime_sec, 2))
+        log.info("        Next pass interval = %s", round(job.interval_sec))
+        log.info("            Previous slack = %s", round(job.slack_sec, 2))
+        log.info(" Next pass due, waking up at: %s", due.time())
+
+    def fail(self, job: ScanJob, error: Exception) -> None:
+        """Records a failed pass, and retries it later, waiting twice as long after every failure in a row."""
+        with self._lock:
+            job.failures += 1
+            retry_sec = min(RETRY_BASE_SEC * 2 ** (job.failures - 1), job.base_interval_sec * MAX_INTERVAL_FACTOR)
+            job.release_at = time.monotonic() + retry_sec
+            job.running = False
+            if job in self._retired:
+                self._retired.remove(job)
+        log.error("%s: The pass of r/%s failed %s time(s) in a row, retrying in %s seconds", repr(error), job.name,
+                  job.failures, round(retry_sec))
+
+    def _update_intervals(self) -> float:
+        """Shares the request budget out by comment velocity, and returns the utilization of the workers.
+
+        A utilization of 1 means the workers would be busy all the time. Above 1, passes would miss their deadlines,
+        so every interval is stretched until they fit, and the utilization returned is the one before stretching.
+        """
+        for job in self.jobs:
+            job.interval_sec = float(job.base_interval_sec)
+        measured = [job for job in self.jobs if job.velocity is not None]
+        if measured:
+            # requests per second if each of these subreddits were scanned once per base interval
+            budget = sum(job.requests_per_pass / job.base_interval_sec for job in measured)
+            weights = {job.name: math.sqrt(max(job.velocity, VELOCITY_FLOOR)) for job in measured}
+            # a subreddit whose share falls outside its bounds gets the bound, and the others share what is left. The
+            # ones that are too slow go first: that leaves less for the rest, whose intervals only grow. Then the ones
+            # that are too fast, which leaves more for the rest, whose intervals only shrink.
+            free = measured
+            for factor, is_outside in ((MAX_INTERVAL_FACTOR, operator.gt), (MIN_INTERVAL_FACTOR, operator.lt)):
+                while free:
+                    weighted_requests = sum(weights[job.name] * job.requests_per_pass for job in free)
+                    for job in free:
+                        job.interval_sec = weighted_requests / (budget * weights[job.name])
+                    bounded = [job for job in free if is_outside(job.interval_sec, job.base_interval_sec * factor)]
+                    if not bounded:
+                        break
+                    for job in bounded:
+                        job.interval_sec = job.base_interval_sec * factor
+                        budget -= job.requests_per_pass / job.interval_sec
+                    free = [job for job in free if job not in bounded]
+
+        # there can be more workers than scanners, when scanners come and go
+        utilization = sum((job.runtime_sec or 0) / job.interval_sec for job in self.jobs) / max(
+            1, min(self.workers, len(self.jobs)))
+        if utilization > 1:
+            log.warn("Scanners need %s%% of the time they have, stretching every interval to fit",
+                     round(utilization * 100))
+            for job in self.jobs:
+                job.interval_sec *= utilization
+        metrics.SCHEDULER_UTILIZATION.set(round(utilization, 4))
+        return utilization
+
+    def _run_job(self, job: ScanJob, run_pass: Callable[[object], int]) -> None:
+        started = time.monotonic()
+        self.start(job, started)
+        requests_before = rate_limiter.get_thread_requests()
+        try:
+            comments = run_pass(job.scanner)
+        except Exception as e:
+            # one subreddit failing, or Reddit being down for a while, must not stop the others
+            self.fail(job, e)
+            return
+        runtime_sec = time.monotonic() - started
+        self.finish(job, started, runtime_sec, comments, rate_limiter.get_thread_requests() - requests_before)
+
+    def run(self, run_pass: Callable[[object], int], stop_event: threading.Event) -> None:
+        """Runs passes until `stop_event` is set, then waits for the running ones to end.
+
+        A pass that raises an `Exception` is logged and retried with a backoff, see `fail`. Anything else, like a
+        `KeyboardInterrupt`, ends the loop, and `stop_event` is set whatever ended it, so the other passes stop early.
+        A thread pool cannot grow, so when `add_scanner` raises the number of workers, new passes go to a bigger pool,
+        and the old one lets its passes finish.
+
+        Args:
+          run_pass: Runs one pass of a scanner and returns the number of comments it found new or with a new score.
+          stop_event: Set when the program is shutting down.
+        """
+        running: Dict[Future, ScanJob] = {}
+        pool_size = self.workers
+        executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="scanner")
+        try:
+            try:
+                while not stop_event.is_set():
+                    if self.workers > pool_size:
+                        log.info("Growing the scanner threads from %s to %s", pool_size, self.workers)
+                        executor.shutdown(wait=False)
+                        pool_size = self.workers
+                        executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="scanner")
+                    now = time.monotonic()
+                    job = self.claim_released(now) if len(running) < self.workers else None
+                    if job is not None:
+                        running[executor.submit(self._run_job, job, run_pass)] = job
+                        continue
+
+                    next_release = self.get_next_release()
+                    timeout = None
+                    if len(running) < self.workers:
+                        timeout = MAX_WAIT_SEC if next_release is None else min(max(0.0, next_release - now),
+                                                                                MAX_WAIT_SEC)
+                    if running:
+                        done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            del running[future]
+                            future.result()
+                    else:
+                        stop_event.wait(timeout)
+            except KeyboardInterrupt:
+                log.critical("Process halted, waiting for every scanner to save its file")
+            finally:
+                stop_event.set()
+                wait(list(running))
+        finally:
+            executor.shutdown()
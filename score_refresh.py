@@ -0,0 +1,59 @@
+import threading
+import praw
+import log
+import storage
+import user_data
+from typing import Set
+
+# reddit.info accepts up to 100 fullnames per request
+BATCH_SIZE = 100
+COMMENT_PREFIX = "t1_"
+
+
+def refresh_scores(reddit: praw.Reddit,
+                   obj: dict,
+                   changes: storage.Changes,
+                   skip_ids: Set[str],
+                   stop_event: threading.Event) -> int:
+    """Updates the score of every comment we already track, 100 comments per request.
+
+    Rather than finding each comment again through the hot list and a full comment tree, we ask Reddit for the comments
+    directly by their fullname ("t1_" + ID). This also keeps the scores of comments whose submission has fallen off the
+    hot list up to date, and it costs one request per 100 comments no matter how many submissions they came from.
+
+    Args:
+      reddit: The Reddit instance to send the requests with.
+      obj: A dictionary that represents all user with their comment IDs and scores.
+      changes: The change set of the current pass, every changed score is added to it.
+      skip_ids: Comment IDs whose scores are already fresh, usually the ones scanned earlier in this pass.
+      stop_event: Set when the program is shutting down, checked between batches.
+
+    Returns:
+      The number of comments whose score changed.
+    """
+    owners = {}
+    for user in obj["users"]:
+        for comment_id in user_data.get_comments(obj, user):
+            if comment_id not in skip_ids:
+                owners[comment_id] = user
+
+    comment_ids = list(owners)
+    total_changed = 0
+
+    for start in range(0, len(comment_ids), BATCH_SIZE):
+        if stop_event.is_set():
+            log.info("Stop requested, ending score refresh early")
+            break
+
+        batch = [COMMENT_PREFIX + comment_id for comment_id in comment_ids[start:start + BATCH_SIZE]]
+        for comment in reddit.info(fullnames=batch):
+            user = owners[comment.id]
+            comments = user_data.get_comments(obj, user)
+            if comments[comment.id] != comment.score:
+                comments[comment.id] = comment.score
+                changes[(user, comment.id)] = comment.score
+                total_changed += 1
+
+    log.info("    Total scores refreshed = %s", len(comment_ids))
+    log.info("     Refreshed and changed = %s", total_changed)
+    return total_changed
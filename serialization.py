@@ -0,0 +1,112 @@
+import abc
+import json
+import log
+from typing import Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class Serializer(abc.ABC):
+    """Turns JSON-compatible objects into compact UTF-8 JSON and back.
+
+    Every backend writes plain JSON without indentation or spaces, so files written by one can be read by any other, by
+    the web page and by people with a JSON viewer.
+    """
+
+    name = ""
+
+    @abc.abstractmethod
+    def dumps(self, obj) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def loads(self, data: bytes):
+        pass
+
+
+class StdlibSerializer(Serializer):
+    name = "json"
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+
+class OrjsonSerializer(Serializer):
+    name = "orjson"
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes):
+        return orjson.loads(data)
+
+
+class MsgspecSerializer(Serializer):
+    name = "msgspec"
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj) -> bytes:
+        return self.encoder.encode(obj)
+
+    def loads(self, data: bytes):
+        return self.decoder.decode(data)
+
+
+# the backends whose package is installed, fastest first
+SERIALIZERS: Dict[str, type] = {}
+if orjson is not None:
+    SERIALIZERS[OrjsonSerializer.name] = OrjsonSerializer
+if msgspec is not None:
+    SERIALIZERS[MsgspecSerializer.name] = MsgspecSerializer
+SERIALIZERS[StdlibSerializer.name] = StdlibSerializer
+
+AUTO = "auto"
+CHOICES = [AUTO, OrjsonSerializer.name, MsgspecSerializer.name, StdlibSerializer.name]
+
+current: Serializer = next(iter(SERIALIZERS.values()))()
+
+
+def use(name: str) -> Serializer:
+    """Picks the backend used by `dumps` and `loads`, once at startup.
+
+    Args:
+      name: One of `CHOICES`. "auto" picks the fastest installed backend. A backend that is not installed falls back to
+        the stdlib one, with a warning.
+
+    Returns:
+      The backend now in use.
+    """
+    global current
+    if name == AUTO:
+        serializer_class: Optional[type] = next(iter(SERIALIZERS.values()))
+    else:
+        serializer_class = SERIALIZERS.get(name)
+        if serializer_class is None:
+            log.warn("The %s serializer is not installed, using the stdlib json module instead", name)
+            serializer_class = StdlibSerializer
+
+    current = serializer_class()
+    log.info("Serializing data files with %s", current.name)
+    return current
+
+
+def dumps(obj) -> bytes:
+    return current.dumps(obj)
+
+
+def loads(data: bytes):
+    return current.loads(data)
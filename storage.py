@@ -0,0 +1,182 @@
+import abc
+import json
+import os
+import sqlite3
+import tempfile
+import log
+import user_data
+from typing import Dict, Tuple, Union
+
+# (username, comment ID) -> score for every comment that was added or changed during one pass
+Changes = Dict[Tuple[str, str], int]
+
+JSON_EXTENSION = ".json"
+SQLITE_EXTENSION = ".db"
+
+
+def write_atomically(path: str, data: Union[str, bytes]) -> None:
+    """Writes `data` to `path` so that readers only ever see the old or the new file, never a half-written one.
+
+    The data goes to a temporary file with a unique name in the same directory first, which is flushed to disk and
+    then renamed over the target, so two writers of the same file never share a temporary file. A crash at any point
+    leaves the previous version of the file intact. Bytes are written as they are, text in the default encoding.
+    """
+    directory, name = os.path.split(path)
+    temp_file = tempfile.NamedTemporaryFile("wb" if isinstance(data, bytes) else "w", dir=directory or ".",
+                                            prefix=name + ".", suffix=".tmp", delete=False)
+    try:
+        with temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_file.name, path)
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+
+
+class Store(abc.ABC):
+    """Base class for the persistent storage of one subreddit's data.
+
+    `load` returns the full per-subreddit data object (see `user_data`). `save` receives that object together with
+    the comments that changed since the last save, so each backend can decide how much it actually has to write.
+    Stores are context managers and must be used from a single thread.
+    """
+
+    def __init__(self, directory: str, sub_name: str):
+        self.directory = directory
+        self.sub_name = sub_name
+
+    @abc.abstractmethod
+    def load(self) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def save(self, obj: dict, changes: Changes) -> None:
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Deletes every stored comment, used at the start of a new month."""
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonStore(Store):
+    """Keeps everything in `<sub>.json` and rewrites the whole file on every save.
+
+    Simple and readable by any JSON parser, but the write cost grows with the month's history. The rewrite is atomic.
+    """
+
+    def __init__(self, directory: str, sub_name: str):
+        super().__init__(directory, sub_name)
+        self.path = os.path.join(directory, sub_name + JSON_EXTENSION)
+
+    def load(self) -> dict:
+        if not os.path.isfile(self.path):
+            return user_data.new_data()
+        return user_data.load_file(self.path)
+
+    def save(self, obj: dict, changes: Changes) -> None:
+        write_atomically(self.path, user_data.dumps(obj))
+
+    def clear(self) -> None:
+        write_atomically(self.path, user_data.dumps(user_data.new_data()))
+
+
+class SqliteStore(Store):
+    """Keeps every comment as one row in `<sub>.db`, an embedded SQLite database.
+
+    A save only upserts the comments in the change set, inside a single transaction, so the write cost scales with the
+    number of changed scores rather than with the size of the month. Rows are loaded back in insertion order, which
+    gives the same user and comment order as the JSON format. The first time a subreddit is opened, an existing
+    `<sub>.json` is imported.
+    """
+
+    def __init__(self, directory: str, sub_name: str):
+        super().__init__(directory, sub_name)
+        self.path = os.path.join(directory, sub_name + SQLITE_EXTENSION)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS comments ("
+                                    "id TEXT PRIMARY KEY, "
+                                    "user TEXT NOT NULL, "
+                                    "score INTEGER NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._import_json_file()
+
+    def _import_json_file(self) -> None:
+        json_path = os.path.join(self.directory, self.sub_name + JSON_EXTENSION)
+        if self._get_meta("version") is not None or not os.path.isfile(json_path):
+            return
+
+        obj = user_data.load_file(json_path)
+        changes = {}
+        for user in obj["users"]:
+            for comment_id, score in user_data.get_comments(obj, user).items():
+                changes[(user, comment_id)] = score
+        self.save(obj, changes)
+        log.info("Imported %s into %s", json_path, self.path)
+
+    def _get_meta(self, key: str):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def load(self) -> dict:
+        obj = user_data.new_data()
+        timestamp = self._get_meta("timestamp")
+        if timestamp is not None:
+            obj["timestamp"] = timestamp
+
+        table = obj["users"]
+        for comment_id, user, score in self.connection.execute("SELECT id, user, score FROM comments ORDER BY rowid"):
+            # the ID is the primary key, so every row is a comment the table does not have yet
+            table.append(table.add_user(user), table.add_id(comment_id), score)
+        return obj
+
+    def save(self, obj: dict, changes: Changes) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO comments (id, user, score) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET score = excluded.score",
+                ((comment_id, user, score) for (user, comment_id), score in changes.items()))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (("version", json.dumps(user_data.FORMAT_VERSION)), ("timestamp", json.dumps(obj["timestamp"]))))
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM comments")
+        # give the space back, so the file only ever holds the current month
+        self.connection.execute("VACUUM")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+STORES = {
+    "json": JsonStore,
+    "sqlite": SqliteStore,
+}
+
+
+def open_store(backend: str, directory: str, sub_name: str) -> Store:
+    """Opens the store for one subreddit.
+
+    Args:
+      backend: A key of `STORES`, for example "sqlite".
+      directory: The directory that holds the data files.
+      sub_name: The name of the subreddit, used as the file name.
+
+    Returns:
+      A Store instance. Use it as a context manager so it is always closed.
+    """
+    return STORES[backend](directory, sub_name)
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+import log
+import storage
+
+CACHE_EXTENSION = ".submissions.json"
+# "never" always fetches the full comment tree, "unchanged" skips submissions whose comment count has not moved
+SKIP_POLICIES = ["never", "unchanged"]
+NUM_COMMENTS_KEY = "num_comments"
+SCANNED_AT_KEY = "scanned_at"
+
+
+class SubmissionCache:
+    """Remembers what each hot submission of one subreddit looked like the last time we fetched its comments.
+
+    For every submission we keep its comment count and when we last fetched its comment tree. The comment count comes
+    for free with the hot listing, so comparing it to the cached count tells us whether the expensive `replace_more`
+    and comment fetch can be skipped. The cache lives in `<sub>.submissions.json` next to the sub's data, and only keeps
+    the submissions seen during the latest pass, so it never grows past the size of the hot list.
+    """
+
+    def __init__(self, directory: str, sub_name: str, policy: str, max_age_sec: int):
+        self.path = os.path.join(directory, sub_name + CACHE_EXTENSION)
+        self.policy = policy
+        self.max_age_sec = max_age_sec
+        self.entries = {}
+        self.seen = set()
+
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warn("%s: Unable to read %s, every submission will be scanned", e, self.path)
+
+    def should_scan(self, submission) -> bool:
+        """Returns False if the submission has not changed since we last fetched its comments.
+
+        A submission is always scanned when the policy is "never", when it is new to us, when its comment count has
+        changed, or when our last fetch is older than `max_age_sec`, so scores still get a full refresh once in a while.
+        """
+        self.seen.add(submission.id)
+        if self.policy == "never":
+            return True
+
+        entry = self.entries.get(submission.id)
+        if entry is None:
+            return True
+
+        return entry[NUM_COMMENTS_KEY] != submission.num_comments \
+            or time.time() - entry[SCANNED_AT_KEY] >= self.max_age_sec
+
+    def record(self, submission) -> None:
+        """Stores the watermark of a submission whose comments were just fetched."""
+        self.seen.add(submission.id)
+        self.entries[submission.id] = {
+            NUM_COMMENTS_KEY: submission.num_comments,
+            SCANNED_AT_KEY: round(time.time()),
+        }
+
+    def restore(self, entries: dict) -> None:
+        """Puts back the entries of submissions fetched earlier in this pass, see `checkpoint`."""
+        self.entries.update(entries)
+        self.seen.update(entries)
+
+    def clear(self) -> None:
+        """Forgets every submission, so the next pass fetches every comment tree again."""
+        self.entries = {}
+        self.seen = set()
+
+    def save(self, prune: bool) -> None:
+        """Writes the cache to disk.
+
+        Args:
+          prune: True after a complete pass, to drop the submissions that are no longer in the hot list.
+        """
+        if prune:
+            self.entries = {key: value for key, value in self.entries.items() if key in self.seen}
+        storage.write_atomically(self.path, json.dumps(self.entries))
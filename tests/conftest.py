@@ -0,0 +1,14 @@
+import os
+import sys
+
+# the modules of the bot sit at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import args  # noqa: E402
+
+# the bot's modules read `args.get_args` when they are imported, which parses the command line once and keeps the
+# result, so it is parsed here first without pytest's own arguments
+_pytest_argv = sys.argv
+sys.argv = sys.argv[:1]
+args.get_args()
+sys.argv = _pytest_argv
@@ -0,0 +1,126 @@
+import datetime
+import gzip
+import json
+import os
+import random
+import types
+import pytest
+import archive
+import ftp
+import leaderboard
+import main
+import user_data
+
+SUB_NAME = "cooking"
+
+
+def make_obj(seed: int, users: int) -> dict:
+    rng = random.Random(seed)
+    obj = user_data.new_data()
+    obj["timestamp"] = 1000.0 + seed
+    comments = [f"user{user}" for user in range(users) for _ in range(rng.randint(1, 6))]
+    rng.shuffle(comments)
+    for index, user in enumerate(comments):
+        obj["users"].set_score(user, format(36 ** 5 + seed * 10 ** 5 + index, "x"), rng.randint(-10, 100))
+    return obj
+
+
+def read_partition(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def sealed(tmp_path, monkeypatch):
+    """Seals two months of data the way `main` does at rollover."""
+    directory = str(tmp_path) + os.sep
+    monkeypatch.setattr(ftp, "LOCAL_JSON_DIR", directory)
+    scanner = types.SimpleNamespace(sub_name=SUB_NAME)
+    months = {"2024-01": make_obj(1, 250), "2024-02": make_obj(2, 40)}
+    for month, obj in months.items():
+        monkeypatch.setattr(archive, "get_previous_month_key", lambda: month)
+        main.seal_month(obj, scanner)
+    return archive.Archive(directory, SUB_NAME), months
+
+
+def test_seal_month_writes_both_partitions_and_the_index(sealed):
+    store, months = sealed
+    assert store.get_months() == ["2024-01", "2024-02"]
+    for month, obj in months.items():
+        totals = leaderboard.get_totals_array(obj)
+        partition = read_partition(os.path.join(store.path, month + archive.TOTALS_SUFFIX))
+        assert partition == {"version": archive.ARCHIVE_VERSION, "month": month, "totals": totals}
+        partition = read_partition(os.path.join(store.path, month + archive.COMMENTS_SUFFIX))
+        assert list(partition["users"]) == list(obj["users"])
+
+        summary = store.get_month_summary(month)
+        assert summary["users"] == len(totals)
+        assert summary["comments"] == obj["users"].comment_count
+        assert summary["total_score"] == sum(row[2] for row in totals)
+        assert summary["timestamp"] == obj["timestamp"]
+        assert "top" not in summary
+
+        loaded = store.load_month(month)
+        assert loaded["timestamp"] == obj["timestamp"]
+        assert [(user, list(comments.items())) for user, comments in loaded["users"].items()] == \
+            [(user, list(comments.items())) for user, comments in obj["users"].items()]
+
+    with pytest.raises(KeyError):
+        store.get_month_summary("2023-12")
+
+
+def test_seal_month_logs_when_the_archive_cannot_be_written(tmp_path, monkeypatch):
+    directory = str(tmp_path) + os.sep
+    monkeypatch.setattr(ftp, "LOCAL_JSON_DIR", directory)
+    # a file where the archive directory should be
+    with open(os.path.join(directory, archive.ARCHIVE_DIR_NAME), "w"):
+        pass
+    main.seal_month(make_obj(1, 5), types.SimpleNamespace(sub_name=SUB_NAME))
+    assert os.path.isfile(os.path.join(directory, archive.ARCHIVE_DIR_NAME))
+
+
+def test_index_answers_the_top_100_without_the_partition(sealed, monkeypatch):
+    store, months = sealed
+    totals = leaderboard.get_totals_array(months["2024-01"])
+    index = store.get_index()
+    assert index["months"]["2024-01"]["top"] == totals[:archive.INDEX_TOP_N]
+    # a month with fewer users than that keeps every row
+    assert index["months"]["2024-02"]["top"] == leaderboard.get_totals_array(months["2024-02"])
+
+    reads = []
+    read = store._read
+    monkeypatch.setattr(store, "_read", lambda *args: reads.append(args[:2]) or read(*args))
+    assert store.get_top("2024-01", 10) == totals[:10]
+    assert store.get_top("2024-01", archive.INDEX_TOP_N) == totals[:archive.INDEX_TOP_N]
+    assert store.get_top("2024-02", 1000) == leaderboard.get_totals_array(months["2024-02"])
+    assert reads == []
+
+    assert store.get_top("2024-01", 150) == totals[:150]
+    assert reads == [("2024-01", archive.TOTALS_SUFFIX)]
+    with pytest.raises(KeyError):
+        store.get_top("2023-12", 10)
+
+
+def test_user_totals_and_comments_by_month(sealed):
+    store, months = sealed
+    # user0 to user39 commented in both months, the others only in January
+    both = "user7"
+    expected = {month: next(row[1:] for row in leaderboard.get_totals_array(obj) if row[0] == both)
+                for month, obj in months.items()}
+    assert store.get_user_totals(both) == expected
+    assert store.get_user_totals(both, ["2024-02"]) == {"2024-02": expected["2024-02"]}
+    assert list(store.get_user_totals("user200")) == ["2024-01"]
+    assert store.get_user_totals("nobody") == {}
+
+    for month, obj in months.items():
+        assert list(store.get_user_comments(both, month).items()) == list(obj["users"][both].items())
+    assert store.get_user_comments("user200", "2024-02") == {}
+    with pytest.raises(KeyError):
+        store.get_user_comments(both, "2023-12")
+    with pytest.raises(KeyError):
+        store.get_user_totals(both, ["2023-12"])
+
+
+def test_previous_month_key():
+    assert archive.get_previous_month_key(datetime.date(2024, 3, 1)) == "2024-02"
+    assert archive.get_previous_month_key(datetime.date(2024, 1, 31)) == "2023-12"
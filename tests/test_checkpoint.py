@@ -0,0 +1,141 @@
+import json
+import os
+import random
+import pytest
+import checkpoint
+import fake_reddit
+import ftp
+import main
+import Scanner
+import storage
+
+SUB_NAME = "cooking"
+POSTS = 200
+# the scan is killed after this many finished submissions
+CRASH_AFTER = 80
+# the hot list comes in pages of 100, and the scan reads `submission.comments` twice, which fake_reddit counts as two
+HOT_LIST_REQUESTS = 2
+REQUESTS_PER_SUBMISSION = 2
+
+
+class Crash(BaseException):
+    """Stands in for the process being killed, nothing handles it on the way out."""
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    """Runs passes of `main.scan_subreddit` over a fake subreddit, each one as if the process had just started."""
+    directory = str(tmp_path) + os.sep
+    monkeypatch.setattr(ftp, "LOCAL_JSON_DIR", directory)
+    monkeypatch.setattr(main.ARGS, "store", "sqlite")
+    monkeypatch.setattr(main.ARGS, "skip_policy", "never")
+    monkeypatch.setattr(main.ARGS, "no_refresh", True)
+    monkeypatch.setattr(main.ARGS, "top_users_capacity", 0)
+    monkeypatch.setattr(main.ARGS, "debug", None)
+    monkeypatch.setattr(main, "lease_coordinator", None)
+    # the web files are not what this is about, and uploading them would need an FTP server
+    monkeypatch.setattr(main, "export_web_files", lambda *args: None)
+    # every finished submission is saved to the checkpoint, not just once a minute
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_INTERVAL_SEC", 0)
+
+    rng = random.Random(7)
+    reddit = fake_reddit.FakeReddit()
+    reddit.add_subreddit(SUB_NAME, fake_reddit.generate_comments(2000, 2, rng), POSTS, rng)
+    monkeypatch.setitem(Scanner.reddit_sessions, "TestBot", reddit)
+
+    class Bot:
+        def __init__(self):
+            self.reddit = reddit
+            self.checkpoint_path = os.path.join(directory, SUB_NAME + checkpoint.CHECKPOINT_EXTENSION)
+
+        def run_pass(self, crash_after=None, interval_sec=3600):
+            scanner = Scanner.Scanner(SUB_NAME, "TestBot", POSTS, interval_sec)
+            subreddit = scanner.sub_instance
+            if crash_after is not None:
+                subreddit.hot = lambda limit=None: crash(type(subreddit).hot(subreddit, limit), crash_after)
+            requests_before = reddit.requests
+            try:
+                main.scan_subreddit(scanner)
+            finally:
+                vars(subreddit).pop("hot", None)
+            return reddit.requests - requests_before
+
+        def load(self):
+            with storage.open_store("sqlite", directory, SUB_NAME) as store:
+                obj = store.load()
+            return {user: list(comments.items()) for user, comments in obj["users"].items()}
+
+        def read_checkpoint(self):
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+
+        def write_checkpoint(self, saved):
+            with open(self.checkpoint_path, "w") as f:
+                json.dump(saved, f)
+
+    return Bot()
+
+
+def crash(submissions, crash_after):
+    """Yields the first `crash_after` hot submissions, and kills the scan when it asks for the next one."""
+    for index, submission in enumerate(submissions):
+        if index == crash_after:
+            raise Crash()
+        yield submission
+
+
+def run_crashed_pass(bot):
+    with pytest.raises(Crash):
+        bot.run_pass(crash_after=CRASH_AFTER)
+    saved = bot.read_checkpoint()
+    assert len(saved["done"]) == CRASH_AFTER
+    assert saved["changes"]
+    # nothing reached the store
+    assert bot.load() == {}
+    return saved
+
+
+def test_resumed_pass_reapplies_changes_and_skips_finished_submissions(bot):
+    saved = run_crashed_pass(bot)
+
+    requests = bot.run_pass()
+    # the hot list, and the comments of the submissions the crashed pass did not finish
+    assert requests == HOT_LIST_REQUESTS + REQUESTS_PER_SUBMISSION * (POSTS - CRASH_AFTER)
+    assert not os.path.exists(bot.checkpoint_path)
+    stored = bot.load()
+    for user, comment_id, score in saved["changes"]:
+        assert dict(stored[user])[comment_id] == score
+    assert stored == clean_pass_data(bot)
+
+
+def test_an_old_checkpoint_reapplies_changes_but_scans_everything(bot):
+    saved = run_crashed_pass(bot)
+    saved["started_at"] -= 600
+    bot.write_checkpoint(saved)
+
+    # the interrupted pass started longer ago than the sub's interval, so every submission is due again
+    assert bot.run_pass(interval_sec=300) == HOT_LIST_REQUESTS + REQUESTS_PER_SUBMISSION * POSTS
+    stored = bot.load()
+    for user, comment_id, score in saved["changes"]:
+        assert dict(stored[user])[comment_id] == score
+
+
+def test_a_checkpoint_of_another_month_is_discarded(bot):
+    saved = run_crashed_pass(bot)
+    saved["month"] = "1999-12"
+    saved["changes"].append(["ghost", "zzzzzzz", 5])
+    bot.write_checkpoint(saved)
+
+    assert bot.run_pass() == HOT_LIST_REQUESTS + REQUESTS_PER_SUBMISSION * POSTS
+    stored = bot.load()
+    assert "ghost" not in stored
+    assert stored == clean_pass_data(bot)
+
+
+def clean_pass_data(bot):
+    """What an uninterrupted pass over the whole hot list stores."""
+    expected = {}
+    for submission in bot.reddit.subreddit(SUB_NAME).submissions:
+        for comment in submission._comments:
+            expected.setdefault(comment.author, []).append((comment.id, comment.score))
+    return expected
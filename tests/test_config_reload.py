@@ -0,0 +1,77 @@
+import os
+import random
+import time
+import config
+import fake_reddit
+import main
+import scanner_pool
+import scheduler
+import Scanner
+
+WAIT_SEC = 5
+
+CONFIG = """[bot]
+name = TestBot
+interval = 600
+
+[r/first]
+
+[r/second]
+interval = 900
+"""
+
+RELOADED = """[bot]
+name = TestBot
+interval = 600
+
+[r/first]
+posts = 50
+
+[r/third]
+"""
+
+
+def write_config(path, text, mtime):
+    with open(path, "w") as f:
+        f.write(text)
+    # the watcher compares modification times, which may not move within one tick of the clock
+    os.utime(path, (mtime, mtime))
+
+
+def test_reloaded_config_adds_and_removes_subreddits(tmp_path, monkeypatch):
+    path = str(tmp_path / "statsbot.ini")
+    write_config(path, CONFIG, time.time() - 60)
+    monkeypatch.setattr(main.ARGS, "config", path)
+    monkeypatch.setattr(main.ARGS, "praw_site", None)
+    monkeypatch.setattr(main.ARGS, "coordinator", None)
+    monkeypatch.setattr(config, "_config", None)
+    monkeypatch.setattr(scanner_pool, "scanner_list", [])
+    # the scanners log in with the config's bot name, and find their subreddits there
+    reddit = fake_reddit.FakeReddit()
+    for name in ["first", "second", "third"]:
+        reddit.add_subreddit(name, {}, 1, random.Random(0))
+    monkeypatch.setitem(Scanner.reddit_sessions, "TestBot", reddit)
+    published = []
+    monkeypatch.setattr(main, "build_subreddit_list", published.append)
+
+    deadline_scheduler = scheduler.DeadlineScheduler(scanner_pool.add_scanners(scanner_pool.get_subreddit_names()), 1)
+    assert [job.name for job in deadline_scheduler.jobs] == ["first", "second"]
+    watcher = config.ConfigWatcher(0.01, lambda old, new: main.apply_config(deadline_scheduler, old, new))
+    watcher.start()
+    try:
+        write_config(path, RELOADED, time.time())
+        deadline = time.monotonic() + WAIT_SEC
+        while not published and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+        watcher.join(WAIT_SEC)
+
+    assert published == [["first", "third"]]
+    assert [job.name for job in deadline_scheduler.jobs] == ["first", "third"]
+    assert [scanner.sub_name for scanner in scanner_pool.get_scanner_list()] == ["first", "third"]
+    first = scanner_pool.get_scanner_list()[0]
+    assert first.num_posts_to_scan == 50
+    # the scanner that did not change is the same one, and keeps its schedule
+    assert deadline_scheduler.jobs[0].scanner is first
+
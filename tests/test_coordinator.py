@@ -0,0 +1,100 @@
+import collections
+import threading
+import time
+import coordinator
+
+SUBS = [f"sub{index}" for index in range(10)]
+
+
+def make_workers(path, count, lease_sec=60):
+    workers = [coordinator.LeaseCoordinator(path, f"worker{index}", lease_sec) for index in range(count)]
+    workers[0].register(SUBS)
+    return workers
+
+
+def get_owners(worker):
+    return dict(worker.connection.execute("SELECT sub, owner FROM leases WHERE expires_at >= ?", (time.time(),)))
+
+
+def test_subreddits_are_shared_out_fairly(tmp_path):
+    first, second, third = make_workers(str(tmp_path / "leases.db"), 3)
+    assert first.sync() == set(SUBS)
+
+    # a new worker gets nothing until the first gives back its surplus, which it does on its next sync
+    assert second.sync() == set()
+    assert len(first.sync()) == 5
+    assert len(second.sync()) == 5
+
+    third.sync()
+    # the share is rounded up, 4 + 4 + 2 or so, and every subreddit ends up with one worker
+    for _ in range(2):
+        held = [worker.sync() for worker in (first, second, third)]
+    assert all(len(subs) <= 4 for subs in held)
+    assert set().union(*held) == set(SUBS)
+    assert sum(len(subs) for subs in held) == len(SUBS)
+
+
+def test_a_busy_subreddit_is_kept_above_the_share(tmp_path):
+    first, second = make_workers(str(tmp_path / "leases.db"), 2)
+    first.sync()
+    second.sync()
+    held = first.sync(busy=set(SUBS[:8]))
+    assert held == set(SUBS[:8])
+    assert second.sync() == set(SUBS[8:])
+
+
+def test_expired_leases_are_taken_over(tmp_path):
+    first, second = make_workers(str(tmp_path / "leases.db"), 2, lease_sec=0.2)
+    first.sync()
+    second.sync()
+    first.sync()
+    assert len(second.sync()) == 5
+
+    # the first worker stops renewing, as if it had crashed
+    time.sleep(0.3)
+    assert not first.holds(SUBS[0])
+    assert second.sync() == set(SUBS)
+    assert second.holds(SUBS[0])
+
+
+def test_a_clean_stop_releases_every_lease_right_away(tmp_path):
+    first, second = make_workers(str(tmp_path / "leases.db"), 2)
+    keeper = coordinator.LeaseKeeper(first, set, lambda subs: None, lambda subs: None)
+    keeper.sync()
+    keeper.start()
+    assert second.sync() == set()
+
+    keeper.stop()
+    assert not first.holds(SUBS[0])
+    # the stopped worker is no longer live, so the other one's share is everything
+    assert second.sync() == set(SUBS)
+
+
+def test_no_subreddit_ever_has_two_owners(tmp_path):
+    path = str(tmp_path / "leases.db")
+    workers = make_workers(path, 6)
+    rounds = 20
+    barrier = threading.Barrier(len(workers), timeout=10)
+    results = [[None] * len(workers) for _ in range(rounds)]
+
+    def keep(index):
+        for round_index in range(rounds):
+            # every worker syncs at the same moment, and one more joins every few rounds
+            barrier.wait()
+            if index <= 2 + round_index // 4:
+                results[round_index][index] = workers[index].sync()
+            barrier.wait()
+
+    threads = [threading.Thread(target=keep, args=(index,)) for index in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    for held in results:
+        held = [subs for subs in held if subs is not None]
+        counts = collections.Counter(sub for subs in held for sub in subs)
+        assert all(count == 1 for count in counts.values())
+    # by the end every worker has synced a few times, and every subreddit has exactly one of them
+    assert sorted(counts) == SUBS
+    assert sorted(get_owners(workers[0])) == SUBS
@@ -0,0 +1,193 @@
+import ftplib
+import gzip
+import os
+import threading
+import time
+import ftp
+import pytest
+
+pytest.importorskip("pyftpdlib")
+from pyftpdlib.authorizers import DummyAuthorizer  # noqa: E402
+from pyftpdlib.handlers import FTPHandler  # noqa: E402
+from pyftpdlib.servers import FTPServer  # noqa: E402
+
+WAIT_SEC = 10
+
+
+class FakeHost:
+    """A local FTP server standing in for the web host, which records every command it receives."""
+
+    def __init__(self, root, idle_timeout_sec=300):
+        self.remote_dir = os.path.join(root, *ftp.SERVER_JSON_DIR.split("/"))
+        os.makedirs(self.remote_dir)
+        self.commands = []
+        self.connections = 0
+        # file names the server answers STOR for with a permanent error
+        self.refused = set()
+        host = self
+
+        class Handler(FTPHandler):
+            timeout = idle_timeout_sec
+
+            def on_connect(self):
+                host.connections += 1
+
+            def pre_process_command(self, line, cmd, arg):
+                if cmd in ("STOR", "RNFR", "RNTO", "DELE"):
+                    host.commands.append((cmd, os.path.basename(arg)))
+                if cmd == "STOR" and os.path.basename(arg) in host.refused:
+                    self.respond("550 Refused.")
+                    return
+                super().pre_process_command(line, cmd, arg)
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_user("statsbot", "secret", root, perm="elradfmwMT")
+        Handler.authorizer = authorizer
+        self.server = FTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"timeout": 0.05}, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.close_all()
+        self._thread.join(WAIT_SEC)
+
+    def read(self, name):
+        with open(os.path.join(self.remote_dir, name), "rb") as f:
+            return f.read()
+
+    def list(self):
+        return sorted(os.listdir(self.remote_dir))
+
+    def get_stored(self):
+        return [arg for cmd, arg in self.commands if cmd == "STOR"]
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    host = FakeHost(str(tmp_path / "server"))
+    monkeypatch.setattr(ftp, "get_credentials", lambda: ("127.0.0.1", "statsbot", "secret"))
+    monkeypatch.setattr(ftplib.FTP, "port", host.port)
+    yield host
+    host.close()
+
+
+@pytest.fixture
+def local_dir(tmp_path):
+    directory = tmp_path / "local"
+    directory.mkdir()
+    return str(directory) + os.sep
+
+
+def write(local_dir, name, data):
+    with open(local_dir + name, "wb") as f:
+        f.write(data)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + WAIT_SEC
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_files_go_up_in_queue_order_and_a_requeued_file_moves_back(host, local_dir):
+    for name in ("index.json", "page-1.json", "page-2.json"):
+        write(local_dir, name, name.encode())
+    publisher = ftp.Publisher(use_gzip=False)
+    publisher.publish("index.json", local_dir)
+    publisher.publish("page-1.json", local_dir)
+    publisher.publish("page-2.json", local_dir)
+    # the index is queued again after its pages changed, it must not go up before them
+    write(local_dir, "index.json", b"index, newer")
+    publisher.publish("index.json", local_dir)
+    publisher.start()
+    publisher.stop(WAIT_SEC)
+
+    assert host.get_stored() == ["page-1.json.uploading", "page-2.json.uploading", "index.json.uploading"]
+    assert host.read("index.json") == b"index, newer"
+    assert host.list() == ["index.json", "page-1.json", "page-2.json"]
+
+
+def test_gzip_copy_is_stored_after_and_renamed_before_its_file(host, local_dir):
+    write(local_dir, "sub.json", b"{}" * 100)
+    publisher = ftp.Publisher(use_gzip=True)
+    publisher.publish("sub.json", local_dir)
+    publisher.start()
+    publisher.stop(WAIT_SEC)
+
+    assert [command for command in host.commands if command[0] != "RNFR"] == [
+        ("STOR", "sub.json.uploading"),
+        ("STOR", "sub.json.gz.uploading"),
+        ("RNTO", "sub.json.gz"),
+        ("RNTO", "sub.json"),
+    ]
+    assert gzip.decompress(host.read("sub.json.gz")) == host.read("sub.json")
+    assert host.list() == ["sub.json", "sub.json.gz"]
+
+
+def test_unchanged_file_is_not_uploaded_again(host, local_dir):
+    write(local_dir, "sub.json", b"same")
+    publisher = ftp.Publisher(use_gzip=False)
+    publisher.publish("sub.json", local_dir)
+    publisher.start()
+    wait_for(lambda: "sub.json" in host.list())
+    publisher.publish("sub.json", local_dir)
+    publisher.stop(WAIT_SEC)
+
+    assert host.get_stored() == ["sub.json.uploading"]
+
+
+def test_removal_waits_for_the_uploads_queued_before_it(host, local_dir):
+    write(local_dir, "old.json", b"old")
+    publisher = ftp.Publisher(use_gzip=True)
+    publisher.publish("old.json", local_dir)
+    publisher.start()
+    wait_for(lambda: host.list() == ["old.json", "old.json.gz"])
+
+    write(local_dir, "new.json", b"new")
+    publisher.publish("new.json", local_dir)
+    publisher.remove("old.json", local_dir)
+    publisher.stop(WAIT_SEC)
+
+    assert host.list() == ["new.json", "new.json.gz"]
+    assert host.commands.index(("RNTO", "new.json")) < host.commands.index(("DELE", "old.json"))
+
+
+def test_upload_is_retried_on_a_new_connection_when_the_server_dropped_it(tmp_path, monkeypatch, local_dir):
+    host = FakeHost(str(tmp_path / "server"), idle_timeout_sec=0.2)
+    monkeypatch.setattr(ftp, "get_credentials", lambda: ("127.0.0.1", "statsbot", "secret"))
+    monkeypatch.setattr(ftplib.FTP, "port", host.port)
+    try:
+        write(local_dir, "sub.json", b"first")
+        publisher = ftp.Publisher(use_gzip=False)
+        publisher.publish("sub.json", local_dir)
+        publisher.start()
+        wait_for(lambda: "sub.json" in host.list())
+        # long enough for the server to close the idle connection the publisher keeps open
+        time.sleep(0.5)
+        write(local_dir, "sub.json", b"second")
+        publisher.publish("sub.json", local_dir)
+        publisher.stop(WAIT_SEC)
+    finally:
+        host.close()
+
+    assert host.read("sub.json") == b"second"
+    assert host.connections == 2
+    assert host.list() == ["sub.json"]
+
+
+def test_failed_upload_is_logged_and_the_queue_moves_on(host, local_dir):
+    host.refused.add("bad.json.uploading")
+    for name in ("bad.json", "good.json"):
+        write(local_dir, name, name.encode())
+    publisher = ftp.Publisher(use_gzip=False)
+    publisher.publish("bad.json", local_dir)
+    publisher.publish("missing.json", local_dir)
+    publisher.publish("good.json", local_dir)
+    publisher.start()
+    publisher.stop(WAIT_SEC)
+
+    # tried twice, the second time on a new connection, then given up
+    assert host.get_stored() == ["bad.json.uploading", "bad.json.uploading", "good.json.uploading"]
+    assert host.list() == ["good.json"]
@@ -0,0 +1,80 @@
+import random
+import heavy_hitters
+import leaderboard
+import records
+import user_data
+
+
+def make_obj(rng, users=2000):
+    obj = user_data.new_data()
+    table = obj["users"]
+    comments = []
+    for user in range(users):
+        for _ in range(max(1, int(rng.paretovariate(1.5)))):
+            comments.append(f"user{user}")
+    rng.shuffle(comments)
+    for index, user in enumerate(comments):
+        table.set_score(user, records.encode_base36(36 ** 5 + index), rng.randint(-20, 200))
+    return obj
+
+
+def rescore(obj, rng, fraction):
+    table = obj["users"]
+    for row in rng.sample(range(table.comment_count), int(table.comment_count * fraction)):
+        name = table.names[table.owners[row]]
+        table[name][table.decode_id(table.ids[row])] = rng.randint(-50, 300)
+
+
+def assert_within_bounds(obj, summary):
+    exact = {row[0]: row for row in leaderboard.get_totals_array(obj)}
+    bound = summary.max_error
+    for name, comments, score, negatives in heavy_hitters.get_top_totals(obj, 0.05, summary):
+        true = exact[name]
+        error = summary.get_counter(name)[heavy_hitters.ERROR]
+        assert 0 <= true[1] - comments <= error <= bound
+        assert 0 <= true[3] - negatives <= error
+        assert abs(true[2] - score) <= error * summary.max_score
+        if error == 0:
+            assert [comments, score, negatives] == true[1:]
+
+
+def test_rows_come_from_the_counters_within_their_bounds(tmp_path):
+    rng = random.Random(3)
+    obj = make_obj(rng)
+    top_users = heavy_hitters.TopUsers(str(tmp_path), "sub", 300)
+    top_users.watch(obj["users"])
+    summary = top_users.update(obj["users"])
+    assert summary.max_error > 0
+    assert_within_bounds(obj, summary)
+
+
+def test_rescored_comments_reach_the_saved_summary(tmp_path):
+    rng = random.Random(4)
+    obj = make_obj(rng)
+    top_users = heavy_hitters.TopUsers(str(tmp_path), "sub", 300)
+    top_users.update(obj["users"])
+
+    # the next pass loads the table and the summary again, rescores and adds comments
+    table = obj["users"]
+    top_users.watch(table)
+    rescore(obj, rng, 0.3)
+    table.set_score("newcomer", "zzzzzz", -5)
+    rescore(obj, rng, 0.1)
+    summary = heavy_hitters.TopUsers(str(tmp_path), "sub", 300).update(table)
+    assert summary.comments == table.comment_count
+    assert_within_bounds(obj, summary)
+
+
+def test_enough_counters_give_exact_totals(tmp_path):
+    rng = random.Random(5)
+    obj = make_obj(rng, users=200)
+    top_users = heavy_hitters.TopUsers(str(tmp_path), "sub", 200)
+    top_users.update(obj["users"])
+    rescore(obj, rng, 0.5)
+    summary = top_users.update(obj["users"])
+    assert summary.max_error == 0
+    picked = heavy_hitters.get_top_totals(obj, 0.1, summary)
+    exact = leaderboard.get_totals_array(obj)
+    # ties with the last top user may be broken either way
+    last_count = exact[len(picked) - 1][1]
+    assert all(row in exact and row[1] >= last_count for row in picked)
@@ -0,0 +1,89 @@
+import math
+import random
+import pytest
+import leaderboard
+import main
+import user_data
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    """Runs a test with NumPy, when it is installed, and with the plain `array` buffers."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        leaderboard._import_numpy()
+    else:
+        monkeypatch.setattr(leaderboard, "numpy", None)
+        monkeypatch.setattr(leaderboard, "_numpy_imported", True)
+    return request.param
+
+
+def get_baseline_totals(comments_by_user: dict) -> list:
+    """The totals loop of the bot before `leaderboard`, one user and one score at a time, then a stable sort."""
+    totals_arr = []
+    for user, comments in comments_by_user.items():
+        total_user_comments = 0
+        total_user_score = 0
+        total_user_negatives = 0
+        for score in comments.values():
+            total_user_comments += 1
+            total_user_score += score
+            if score < 0:
+                total_user_negatives += 1
+        totals_arr.append([user, total_user_comments, total_user_score, total_user_negatives])
+    totals_arr.sort(reverse=True, key=lambda x: x[main.TOTAL_COMMENTS_IDX])
+    return totals_arr
+
+
+def make_data(seed: int, users: int) -> dict:
+    rng = random.Random(seed)
+    comments_by_user = {}
+    next_id = 36 ** 5
+    for user in range(users):
+        comments = {}
+        # few distinct comment counts, so most users are tied with many others
+        for _ in range(rng.choice([0, 1, 1, 2, 2, 3, 5, 8])):
+            comments[format(next_id, "x")] = rng.randint(-30, 500)
+            next_id += 1
+        comments_by_user[f"user{rng.randrange(10 ** 6)}-{user}"] = comments
+    return comments_by_user
+
+
+def to_obj(comments_by_user: dict, shuffle_seed: int) -> dict:
+    """Adds every user first, like the baseline dict has them, then their comments interleaved, like a scan finds them.
+
+    Each user's own comments keep their order, so every user ends up with the same comments as the baseline.
+    """
+    rng = random.Random(shuffle_seed)
+    obj = user_data.new_data()
+    for user in comments_by_user:
+        obj["users"].add_user(user)
+    pending = {user: list(comments.items()) for user, comments in comments_by_user.items() if comments}
+    while pending:
+        user = rng.choice(list(pending))
+        comment_id, score = pending[user].pop(0)
+        obj["users"].set_score(user, comment_id, score)
+        if not pending[user]:
+            del pending[user]
+    return obj
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_totals_match_the_baseline_loop(backend, seed):
+    comments_by_user = make_data(seed, 3000)
+    obj = to_obj(comments_by_user, seed)
+    baseline = get_baseline_totals(comments_by_user)
+
+    assert main.get_totals_array(obj) == baseline
+    for fraction in (0.01, 0.1, 1.0):
+        # ties with the last top user keep the order they were added in, like the stable sort
+        assert leaderboard.get_top_totals(obj, fraction) == baseline[:math.ceil(len(baseline) * fraction)]
+    assert main.get_ratios_array(leaderboard.get_top_totals(obj, main.TOP_USERS_FRACTION), len(baseline)) == \
+        main.get_ratios_array(baseline)
+
+
+def test_users_without_comments_and_empty_data(backend):
+    obj = to_obj({"a": {}, "b": {"k1": -1}, "c": {}, "d": {"k2": 4}}, 0)
+    assert main.get_totals_array(obj) == [["b", 1, -1, 1], ["d", 1, 4, 0], ["a", 0, 0, 0], ["c", 0, 0, 0]]
+    assert leaderboard.get_top_totals(user_data.new_data(), 0.01) == []
+    assert main.get_totals_array(user_data.new_data()) == []
@@ -0,0 +1,144 @@
+import threading
+import time
+import prawcore
+import pytest
+import rate_limiter
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# timers and sleeps are not exact, so every expected wait may come up this much short
+TOLERANCE_SEC = 0.03
+
+
+class FakeReddit:
+    """A local HTTP endpoint that answers with scripted statuses and rate limit headers, and records when it was hit."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.request_times = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.request_times.append(time.monotonic())
+                status, headers = fake.responses.pop(0) if len(fake.responses) > 1 else fake.responses[0]
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v1/me"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_gaps(self):
+        return [later - earlier for earlier, later in zip(self.request_times, self.request_times[1:])]
+
+
+def budget(remaining, reset_sec, used=0):
+    return {"x-ratelimit-remaining": str(remaining), "x-ratelimit-reset": str(reset_sec),
+            "x-ratelimit-used": str(used)}
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = rate_limiter.RateLimiter(1000, 1, 0)
+    monkeypatch.setattr(rate_limiter.RateLimitedRequestor, "limiter", limiter)
+    return limiter
+
+
+@pytest.fixture
+def requestor():
+    requestor = rate_limiter.RateLimitedRequestor("statsbot tests", session=requests.Session())
+    yield requestor
+    requestor.close()
+
+
+def test_requests_are_spread_evenly_over_the_budget(limiter, requestor):
+    # 10 requests left for the next second: one every 0.1 seconds, never in a burst
+    fake = FakeReddit([(200, budget(10, 1))])
+    try:
+        for _ in range(6):
+            assert requestor.request("GET", fake.url).status_code == 200
+    finally:
+        fake.close()
+    assert all(gap >= 0.1 - TOLERANCE_SEC for gap in fake.get_gaps()[1:])
+    assert limiter.budget()["total_requests"] == 6
+
+
+def test_empty_budget_waits_for_the_reset(limiter, requestor):
+    fake = FakeReddit([(200, budget(0, 0.5, used=600)), (200, budget(599, 600, used=1))])
+    try:
+        requestor.request("GET", fake.url)
+        requestor.request("GET", fake.url)
+    finally:
+        fake.close()
+    assert fake.get_gaps()[0] >= 0.5 - TOLERANCE_SEC
+    assert limiter.budget()["capacity"] == 600
+
+
+def test_429_is_retried_after_retry_after(limiter, requestor):
+    fake = FakeReddit([(429, {"retry-after": "0.3"}), (200, budget(500, 100))])
+    try:
+        response = requestor.request("GET", fake.url)
+    finally:
+        fake.close()
+    assert response.status_code == 200
+    assert len(fake.request_times) == 2
+    assert fake.get_gaps()[0] >= 0.3 - TOLERANCE_SEC
+    assert limiter.total_429s == 1
+
+
+def test_429_without_retry_after_backs_off_exponentially(limiter, monkeypatch, requestor):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_BASE_SEC", 0.5)
+    fake = FakeReddit([(429, {}), (200, budget(500, 100))])
+    try:
+        requestor.request("GET", fake.url)
+    finally:
+        fake.close()
+    # the first 429 in a row waits BACKOFF_BASE_SEC ** 1
+    assert fake.get_gaps()[0] >= 0.5 - TOLERANCE_SEC
+
+
+def test_gives_up_after_max_429_retries(limiter, monkeypatch, requestor):
+    monkeypatch.setattr(rate_limiter, "MAX_429_RETRIES", 3)
+    fake = FakeReddit([(429, {"retry-after": "0"})])
+    try:
+        response = requestor.request("GET", fake.url)
+    finally:
+        fake.close()
+    assert response.status_code == 429
+    assert len(fake.request_times) == 3
+
+
+def test_threads_share_the_budget_and_count_their_own_requests(monkeypatch, requestor):
+    monkeypatch.setattr(rate_limiter.RateLimitedRequestor, "limiter", rate_limiter.RateLimiter(20, 1, 0))
+    fake = FakeReddit([(200, budget(20, 1))])
+    counts = {}
+
+    def scan(name, requests_to_send):
+        before = rate_limiter.get_thread_requests()
+        for _ in range(requests_to_send):
+            requestor.request("GET", fake.url)
+        counts[name] = rate_limiter.get_thread_requests() - before
+
+    threads = [threading.Thread(target=scan, args=(name, 3)) for name in ("a", "b", "c")]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        fake.close()
+    assert counts == {"a": 3, "b": 3, "c": 3}
+    # 20 requests per second between all three threads, not per thread
+    assert all(gap >= 0.05 - TOLERANCE_SEC for gap in fake.get_gaps())
@@ -0,0 +1,102 @@
+import random
+import pytest
+import records
+
+
+def to_dict(table: records.UserTable) -> dict:
+    return {name: list(comments.items()) for name, comments in table.items()}
+
+
+def test_base36_ids_round_trip():
+    rng = random.Random(1)
+    numbers = [0, 1, 35, 36, 37, 36 ** 2 - 1, 36 ** 2, 36 ** 7 + 5] + [rng.randrange(36 ** 13) for _ in range(1000)]
+    table = records.UserTable()
+    for number in numbers:
+        comment_id = records.encode_base36(number)
+        assert int(comment_id, 36) == number
+        assert comment_id == "0" or not comment_id.startswith("0")
+        if number:
+            assert table.add_id(comment_id) == table.encode_id(comment_id) == number
+            assert table.decode_id(number) == comment_id
+    assert records.encode_base36(0) == "0"
+
+
+def test_non_canonical_ids_are_kept_as_they_are():
+    table = records.UserTable()
+    odd_ids = ["0abc", "ABC", "0", "", "t1_abc", "abc "]
+    for odd_id in odd_ids:
+        assert table.encode_id(odd_id) == records.UNKNOWN_ID
+    for score, odd_id in enumerate(odd_ids):
+        table.set_score("alice", odd_id, score)
+    table.set_score("alice", "abc", 100)
+
+    # each one is a comment of its own, none of them is "abc"
+    assert to_dict(table) == {"alice": [(odd_id, score) for score, odd_id in enumerate(odd_ids)] + [("abc", 100)]}
+    assert all(table.encode_id(odd_id) < 0 for odd_id in odd_ids)
+    assert table.add_id("0abc") == table.encode_id("0abc")
+    assert table["alice"]["ABC"] == 1
+    assert "0abc" in table["alice"] and "0abcd" not in table["alice"]
+
+
+def test_users_and_comments_keep_the_order_they_were_added_in():
+    rng = random.Random(2)
+    table = records.UserTable()
+    expected = {}
+    for index in range(2000):
+        name = f"user{rng.randrange(50)}"
+        comment_id = records.encode_base36(36 ** 6 + index * 7)
+        score = rng.randint(-5, 50)
+        table.set_score(name, comment_id, score)
+        expected.setdefault(name, {})[comment_id] = score
+    # rescoring a comment keeps it where it is
+    for name, comments in expected.items():
+        comment_id = rng.choice(list(comments))
+        table[name][comment_id] = comments[comment_id] = -1
+
+    assert list(table) == list(expected)
+    assert to_dict(table) == {name: list(comments.items()) for name, comments in expected.items()}
+    assert [len(table[name]) for name in table] == [len(comments) for comments in expected.values()]
+    assert table.comment_count == 2000
+
+
+def test_row_index_grows_and_survives_collisions(monkeypatch):
+    for multiplier in (records.HASH_MULTIPLIER, 0):
+        # with 0 every ID hashes to the same slot, so every lookup walks the probe sequence
+        monkeypatch.setattr(records, "HASH_MULTIPLIER", multiplier)
+        table = records.UserTable()
+        sizes = {len(table._rows_by_id)}
+        for index in range(1000):
+            table.set_score(f"user{index % 3}", records.encode_base36(36 ** 5 + index), index)
+            assert table.comment_count * 2 <= len(table._rows_by_id)
+            sizes.add(len(table._rows_by_id))
+        assert sorted(sizes) == [records.MIN_INDEX_SIZE * 2 ** power for power in range(len(sizes))]
+        for index in range(1000):
+            comment_id = records.encode_base36(36 ** 5 + index)
+            assert table[f"user{index % 3}"][comment_id] == index
+            assert comment_id not in table[f"user{(index + 1) % 3}"]
+        assert table["user0"].get("zzzzzz", "missing") == "missing"
+
+
+def test_the_same_id_under_two_users():
+    table = records.UserTable()
+    table.set_score("alice", "abc", 1)
+    table.set_score("alice", "abd", 2)
+    table.set_score("bob", "abc", 3)
+    # the row index only points at bob's copy, alice's is found through her own comments
+    table.set_score("alice", "abc", 4)
+    assert to_dict(table) == {"alice": [("abc", 4), ("abd", 2)], "bob": [("abc", 3)]}
+    assert table.comment_count == 3
+    table.add_user("carol")
+    assert "abc" not in table["carol"]
+
+
+def test_rescored_rows_keep_their_first_score():
+    table = records.UserTable()
+    table.set_score("alice", "abc", 1)
+    table.rescored = {}
+    table.set_score("alice", "abc", 5)
+    table.set_score("alice", "abc", 7)
+    table.set_score("alice", "abd", 2)
+    assert table.rescored == {0: 1}
+    with pytest.raises(TypeError):
+        del table["alice"]["abc"]
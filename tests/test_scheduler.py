@@ -0,0 +1,122 @@
+import threading
+import time
+import types
+import pytest
+import scheduler
+
+
+def make_scanner(name, interval_sec=600):
+    return types.SimpleNamespace(sub_name=name, interval_seconds=interval_sec)
+
+
+def run_passes(deadline_scheduler, passes):
+    """Runs one finished pass of each (name, runtime, comments, requests), `started` a base interval apart."""
+    jobs = {job.name: job for job in deadline_scheduler.jobs}
+    for name, runtime_sec, comments, requests in passes:
+        job = jobs[name]
+        started = (job.last_start or 0) + job.base_interval_sec
+        job.running = True
+        deadline_scheduler.start(job, started)
+        deadline_scheduler.finish(job, started, runtime_sec, comments, requests)
+
+
+def test_released_passes_run_earliest_deadline_first():
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner(name) for name in "abcd"], 1)
+    now = time.monotonic()
+    for job, (release_in, interval_sec) in zip(deadline_scheduler.jobs, [(0, 600), (-10, 900), (-5, 100), (50, 10)]):
+        job.release_at = now + release_in
+        job.interval_sec = interval_sec
+
+    # d has the earliest deadline but is not released yet, a was released after b but is due before it
+    assert [deadline_scheduler.claim_released(now).name for _ in range(3)] == ["c", "a", "b"]
+    assert deadline_scheduler.claim_released(now) is None
+    assert deadline_scheduler.claim_released(now + 50).name == "d"
+
+
+def test_a_running_scanner_is_not_claimed_twice():
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner("a")], 2)
+    now = time.monotonic()
+    job = deadline_scheduler.claim_released(now)
+    deadline_scheduler.start(job, now)
+    deadline_scheduler.remove_scanner("a")
+    deadline_scheduler.add_scanner(make_scanner("a"))
+    # the new job of "a" waits for the pass of the removed one
+    assert deadline_scheduler.claim_released(now + 1) is None
+    deadline_scheduler.finish(job, now, 1, 0, 1)
+    assert deadline_scheduler.claim_released(now + 1).name == "a"
+
+
+def test_intervals_follow_velocity_within_bounds():
+    names = ["busy", "steady", "quiet"] + [f"idle{index}" for index in range(5)]
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner(name, 600) for name in names], len(names))
+    comments = {"busy": 100000, "steady": 600, "quiet": 20}
+    for _ in range(2):
+        run_passes(deadline_scheduler, [(name, 1, comments.get(name, 0), 10) for name in names])
+
+    intervals = {job.name: job.interval_sec for job in deadline_scheduler.jobs}
+    assert intervals["busy"] < intervals["steady"] < intervals["quiet"] <= intervals["idle0"]
+    # the busiest and the idle subs would go past their bounds, and get them
+    assert intervals["busy"] == pytest.approx(600 * scheduler.MIN_INTERVAL_FACTOR)
+    assert intervals["idle0"] == pytest.approx(600 * scheduler.MAX_INTERVAL_FACTOR)
+    assert all(600 * scheduler.MIN_INTERVAL_FACTOR <= interval <= 600 * scheduler.MAX_INTERVAL_FACTOR
+               for interval in intervals.values())
+    # the requests are shared out, not added: at most as many per second as every sub once per 600 seconds
+    assert sum(10 / interval for interval in intervals.values()) <= len(names) * 10 / 600 + 1e-9
+    # the next release moves with the interval
+    busy = next(job for job in deadline_scheduler.jobs if job.name == "busy")
+    assert busy.release_at == busy.last_start + busy.interval_sec
+
+
+def test_the_budget_left_by_bounded_subs_goes_to_the_others():
+    names = ["a", "b", "c", "d"]
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner(name, 600) for name in names], len(names))
+    comments = {"a": 10 ** 6, "b": 10 ** 6}
+    for _ in range(2):
+        run_passes(deadline_scheduler, [(name, 1, comments.get(name, 0), 10) for name in names])
+
+    intervals = [job.interval_sec for job in deadline_scheduler.jobs]
+    assert intervals[2:] == pytest.approx([600 * scheduler.MAX_INTERVAL_FACTOR] * 2)
+    assert intervals[0] == pytest.approx(intervals[1])
+    assert sum(10 / interval for interval in intervals) == pytest.approx(len(names) * 10 / 600)
+
+
+def test_intervals_stretch_when_the_workers_are_overloaded():
+    names = ["a", "b", "c"]
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner(name, 100) for name in names], 1)
+    # each pass takes 60 seconds of the single worker, 180 seconds every 100 seconds does not fit
+    run_passes(deadline_scheduler, [(name, 60, 0, 1) for name in names])
+    intervals = [job.interval_sec for job in deadline_scheduler.jobs]
+    assert intervals == pytest.approx([180, 180, 180])
+    assert sum(60 / interval for interval in intervals) == pytest.approx(1)
+
+    # a second worker halves the load, so nothing is stretched
+    deadline_scheduler.workers = 2
+    run_passes(deadline_scheduler, [("a", 60, 0, 1)])
+    assert [job.interval_sec for job in deadline_scheduler.jobs] == pytest.approx([100, 100, 100])
+
+
+def test_concurrent_workers_grow_with_the_scanners():
+    deadline_scheduler = scheduler.DeadlineScheduler([], 1, concurrent=True)
+    for name in "abc":
+        deadline_scheduler.add_scanner(make_scanner(name))
+    assert deadline_scheduler.workers == 3
+    assert scheduler.DeadlineScheduler([], 1).workers == 1
+
+    # every pass of the three scanners runs at once, on a pool that grew after it was started
+    started = threading.Barrier(3, timeout=5)
+    stop_event = threading.Event()
+    deadline_scheduler = scheduler.DeadlineScheduler([make_scanner("a")], 1, concurrent=True)
+
+    def run_pass(scanner):
+        if scanner.sub_name == "a":
+            for name in "bc":
+                deadline_scheduler.add_scanner(make_scanner(name))
+        started.wait()
+        stop_event.set()
+        return 0
+
+    thread = threading.Thread(target=deadline_scheduler.run, args=(run_pass, stop_event))
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not started.broken
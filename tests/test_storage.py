@@ -0,0 +1,107 @@
+import os
+import pytest
+import storage
+import user_data
+
+
+def make_obj(comments_by_user: dict, timestamp: float = 1000.0) -> dict:
+    obj = user_data.new_data()
+    obj["timestamp"] = timestamp
+    for user, comments in comments_by_user.items():
+        for comment_id, score in comments.items():
+            obj["users"].set_score(user, comment_id, score)
+    return obj
+
+
+def to_lists(obj: dict) -> list:
+    """The users and their comments in order, which is what the JSON file and the leaderboard depend on."""
+    return [(user, list(comments.items())) for user, comments in obj["users"].items()]
+
+
+def get_changes(comments_by_user: dict) -> storage.Changes:
+    return {(user, comment_id): score for user, comments in comments_by_user.items()
+            for comment_id, score in comments.items()}
+
+
+def test_sqlite_save_writes_only_the_changed_rows(tmp_path):
+    comments_by_user = {"alice": {"a1": 5, "a2": -2}, "bob": {"b1": 7}, "carol": {f"c{i}": i for i in range(50)}}
+    obj = make_obj(comments_by_user)
+    with storage.SqliteStore(str(tmp_path), "sub") as store:
+        store.save(obj, get_changes(comments_by_user))
+
+        obj["users"].set_score("bob", "b1", 9)
+        obj["users"].set_score("dave", "d1", 1)
+        obj["timestamp"] = 2000.0
+        before = store.connection.total_changes
+        store.save(obj, {("bob", "b1"): 9, ("dave", "d1"): 1})
+        # the two comments and the two meta rows, none of the other 52 comments
+        assert store.connection.total_changes - before == 4
+
+    with storage.SqliteStore(str(tmp_path), "sub") as store:
+        loaded = store.load()
+    assert loaded["timestamp"] == 2000.0
+    assert to_lists(loaded) == to_lists(obj)
+
+
+def test_sqlite_imports_an_existing_json_file_once(tmp_path):
+    obj = make_obj({"bob": {"b2": 3, "b1": -1}, "alice": {"a1": 10}}, 1234.5)
+    with storage.JsonStore(str(tmp_path), "sub") as store:
+        store.save(obj, {})
+
+    with storage.SqliteStore(str(tmp_path), "sub") as store:
+        loaded = store.load()
+        assert loaded["timestamp"] == 1234.5
+        assert to_lists(loaded) == [("bob", [("b2", 3), ("b1", -1)]), ("alice", [("a1", 10)])]
+        store.save(loaded, {("alice", "a2"): 4})
+
+    # once imported, the database is what is loaded, even when the JSON file is still there
+    with storage.SqliteStore(str(tmp_path), "sub") as store:
+        assert to_lists(store.load())[1] == ("alice", [("a1", 10), ("a2", 4)])
+    assert os.path.isfile(tmp_path / "sub.json")
+
+
+def test_sqlite_clear_keeps_the_timestamp(tmp_path):
+    with storage.SqliteStore(str(tmp_path), "sub") as store:
+        obj = make_obj({"alice": {"a1": 5}}, 50.0)
+        store.save(obj, {("alice", "a1"): 5})
+        store.clear()
+        loaded = store.load()
+    assert loaded["timestamp"] == 50.0
+    assert len(loaded["users"]) == 0
+
+
+def test_json_save_rewrites_the_file_atomically(tmp_path, monkeypatch):
+    obj = make_obj({"alice": {"a1": 5}})
+    with storage.JsonStore(str(tmp_path), "sub") as store:
+        store.save(obj, {})
+        with open(store.path, "rb") as f:
+            saved = f.read()
+
+        obj["users"].set_score("bob", "b1", 1)
+
+        def crash(source, target):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(storage.os, "replace", crash)
+        with pytest.raises(OSError):
+            store.save(obj, {})
+        # the old file is untouched and the temporary file is gone
+        with open(store.path, "rb") as f:
+            assert f.read() == saved
+        assert os.listdir(tmp_path) == ["sub.json"]
+
+        monkeypatch.undo()
+        store.save(obj, {})
+        assert to_lists(store.load()) == to_lists(obj)
+    assert os.listdir(tmp_path) == ["sub.json"]
+
+
+def test_write_atomically_writes_text_and_bytes(tmp_path):
+    path = str(tmp_path / "file.txt")
+    storage.write_atomically(path, "text")
+    with open(path) as f:
+        assert f.read() == "text"
+    storage.write_atomically(path, b"\x00bytes")
+    with open(path, "rb") as f:
+        assert f.read() == b"\x00bytes"
+    assert os.listdir(tmp_path) == ["file.txt"]
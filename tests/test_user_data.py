@@ -0,0 +1,44 @@
+import json
+import os
+import main
+import user_data
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "json", "test.json")
+TOTAL_COMMENTS_IDX = 1
+
+
+def get_legacy_totals(legacy: dict) -> list:
+    """The totals loop of the bot before the format was versioned, over the parallel lists of version 1."""
+    totals_arr = []
+    for user, record in legacy["users"].items():
+        scores = record[user_data.LEGACY_SCORE_KEY]
+        totals_arr.append([user, len(scores), sum(scores), sum(1 for score in scores if score < 0)])
+    totals_arr.sort(reverse=True, key=lambda x: x[TOTAL_COMMENTS_IDX])
+    return totals_arr
+
+
+def test_unversioned_file_migrates_with_order_totals_and_leaderboard_unchanged(tmp_path):
+    with open(TEST_FILE, "rb") as f:
+        legacy = json.loads(f.read())
+    assert "version" not in legacy
+
+    obj = user_data.load_file(TEST_FILE)
+    assert obj["version"] == user_data.FORMAT_VERSION == 2
+    assert obj["timestamp"] == legacy["timestamp"]
+    assert list(obj["users"]) == list(legacy["users"])
+    for user, record in legacy["users"].items():
+        assert list(obj["users"][user].items()) == list(zip(record[user_data.LEGACY_ID_KEY],
+                                                            record[user_data.LEGACY_SCORE_KEY]))
+
+    legacy_totals = get_legacy_totals(legacy)
+    assert main.get_totals_array(obj) == legacy_totals
+    assert main.get_ratios_array(main.get_totals_array(obj)) == main.get_ratios_array(legacy_totals)
+
+    # and a version 2 file written from it reads back the same
+    path = str(tmp_path / "test.json")
+    with open(path, "wb") as f:
+        f.write(user_data.dumps(obj))
+    migrated = user_data.load_file(path)
+    assert [(user, list(comments.items())) for user, comments in migrated["users"].items()] == \
+        [(user, list(comments.items())) for user, comments in obj["users"].items()]
+    assert dict(user_data.iter_users(path)) == dict(user_data.iter_users(TEST_FILE))
@@ -0,0 +1,111 @@
+import os
+import pytest
+import serialization
+import user_data
+import web_deltas
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(monkeypatch):
+    # every test starts like a new process, whose first publish of a sub is a new base
+    monkeypatch.setattr(web_deltas, "_rebased", set())
+
+
+def make_obj(users=200):
+    obj = user_data.new_data()
+    for i in range(users):
+        obj["users"].set_score(f"user{i}", f"c{i}", i)
+    obj["timestamp"] = "t0"
+    return obj
+
+
+def read(directory, file_name):
+    with open(os.path.join(directory, file_name), "rb") as f:
+        return serialization.loads(f.read())
+
+
+def replay(directory, sub_name):
+    """Applies the base and the deltas of a manifest like the web page does."""
+    manifest = read(directory, sub_name + web_deltas.MANIFEST_SUFFIX)
+    users = read(directory, manifest["base"]["file"])["users"]
+    for delta in manifest["deltas"]:
+        users.update(read(directory, delta["file"])["users"])
+    return users
+
+
+def expected(obj):
+    return {user: web_deltas.to_web_record(comments) for user, comments in obj["users"].items()}
+
+
+def test_deltas_hold_only_changed_users_and_replay_to_the_full_data(tmp_path):
+    directory = str(tmp_path) + os.sep
+    obj = make_obj()
+    written, removed = web_deltas.publish(directory, "sub", obj, set())
+    assert written[0].startswith("sub.base.") and written[-1] == "sub.manifest.json"
+    assert removed == []
+
+    for i in range(3):
+        obj["users"].set_score(f"user{i}", f"new{i}", -i)
+        obj["users"].set_score(f"newcomer{i}", f"n{i}", 1)
+        written, removed = web_deltas.publish(directory, "sub", obj, {f"user{i}", f"newcomer{i}"})
+        assert written[0].startswith("sub.delta.") and written[-1] == "sub.manifest.json"
+        assert set(read(directory, written[0])["users"]) == {f"user{i}", f"newcomer{i}"}
+
+    manifest = read(directory, "sub.manifest.json")
+    assert len(manifest["deltas"]) == 3
+    assert manifest["version"] == 4
+    assert replay(directory, "sub") == expected(obj)
+
+
+def test_files_are_named_after_their_hash(tmp_path):
+    directory = str(tmp_path) + os.sep
+    web_deltas.publish(directory, "sub", make_obj(), set())
+    manifest = read(directory, "sub.manifest.json")
+    assert manifest["base"]["sha256"][:web_deltas.FILE_HASH_LENGTH] in manifest["base"]["file"]
+
+
+def test_rebase_replaces_the_deltas_and_old_files_go_a_pass_later(tmp_path):
+    directory = str(tmp_path) + os.sep
+    obj = make_obj()
+    first_base = web_deltas.publish(directory, "sub", obj, set())[0][0]
+    obj["users"].set_score("user1", "x", 5)
+    delta = web_deltas.publish(directory, "sub", obj, {"user1"})[0][0]
+
+    # a new month, users were removed
+    obj = make_obj(users=10)
+    written, removed = web_deltas.publish(directory, "sub", obj, set(), rebase=True)
+    second_base = written[0]
+    # a visitor may still hold the previous manifest, so its files stay for now
+    assert removed == []
+    assert replay(directory, "sub") == expected(obj)
+
+    obj["users"].set_score("user1", "y", 5)
+    written, removed = web_deltas.publish(directory, "sub", obj, {"user1"})
+    assert removed == sorted([first_base, delta])
+    assert second_base in os.listdir(directory)
+
+
+def test_first_publish_of_a_process_and_too_many_deltas_rebase(tmp_path, monkeypatch):
+    directory = str(tmp_path) + os.sep
+    obj = make_obj()
+    web_deltas.publish(directory, "sub", obj, set())
+    monkeypatch.setattr(web_deltas, "_rebased", set())
+    # a delta published before a crash may be lost, so a restart starts over
+    assert web_deltas.publish(directory, "sub", obj, set())[0][0].startswith("sub.base.")
+
+    monkeypatch.setattr(web_deltas, "MAX_DELTAS", 2)
+    for i in range(2):
+        obj["users"].set_score(f"user{i}", "z", 0)
+        assert web_deltas.publish(directory, "sub", obj, {f"user{i}"})[0][0].startswith("sub.delta.")
+    obj["users"].set_score("user5", "z", 0)
+    assert web_deltas.publish(directory, "sub", obj, {"user5"})[0][0].startswith("sub.base.")
+    assert replay(directory, "sub") == expected(obj)
+
+
+def test_a_pass_without_changes_only_moves_the_timestamp(tmp_path):
+    directory = str(tmp_path) + os.sep
+    obj = make_obj()
+    web_deltas.publish(directory, "sub", obj, set())
+    obj["timestamp"] = "t1"
+    assert web_deltas.publish(directory, "sub", obj, set()) == (["sub.manifest.json"], [])
+    assert read(directory, "sub.manifest.json")["timestamp"] == "t1"
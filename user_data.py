@@ -0,0 +1,128 @@
+import records
+import serialization
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+# Version 1 kept two parallel lists per user: {"commentId": [...], "commentScore": [...]}
+# Version 2 keys every comment by its ID:   {"c": {comment_id: score}}
+# In memory, "users" is a `records.UserTable` rather than a dict, `dumps` writes it back out as version 2.
+# Files are compact JSON with one user per line, see `dumps`. Older files are indented, and are read whole.
+FORMAT_VERSION = 2
+COMMENTS_KEY = "c"
+LEGACY_ID_KEY = "commentId"
+LEGACY_SCORE_KEY = "commentScore"
+# the end of the first line of a file written by `dumps`, the users follow one per line
+USERS_LINE_END = b'"users":{'
+USERS_END = b"}}"
+
+
+def new_data() -> dict:
+    """Returns an empty per-subreddit data object in the current format."""
+    return {"version": FORMAT_VERSION, "users": records.UserTable(), "timestamp": []}
+
+
+def clear_users(obj: dict) -> None:
+    """Forgets every user and comment, used at the start of a new month."""
+    obj["users"] = records.UserTable()
+
+
+def migrate(obj: dict) -> dict:
+    """Upgrades a per-subreddit data object to the current format, in place.
+
+    Files written before the format was versioned have no "version" key and are treated as version 1. Comment order is
+    preserved, so every total and leaderboard computed from a migrated file is unchanged. The users are moved into a
+    `records.UserTable`.
+
+    Args:
+      obj: A dictionary loaded from a `<sub>.json` file.
+
+    Returns:
+      The same dictionary, now in the current format.
+    """
+    version = obj.get("version", 1)
+    users = obj.get("users", {})
+    if isinstance(users, records.UserTable):
+        return obj
+
+    table = records.UserTable()
+    if version == 1:
+        for user in users:
+            for comment_id, score in zip(users[user][LEGACY_ID_KEY], users[user][LEGACY_SCORE_KEY]):
+                table.set_score(user, comment_id, score)
+        obj["version"] = FORMAT_VERSION
+    elif version == FORMAT_VERSION:
+        for user in users:
+            _add_user(table, user, users[user][COMMENTS_KEY])
+    else:
+        raise ValueError(f"Unsupported data file version: {version}")
+
+    obj["users"] = table
+    obj.setdefault("timestamp", [])
+    return obj
+
+
+def _add_user(table: records.UserTable, user: str, comments: Dict[str, int]) -> None:
+    # the IDs of one user are dict keys, so they are known to be new
+    user_index = table.add_user(user)
+    for comment_id, score in comments.items():
+        table.append(user_index, table.add_id(comment_id), score)
+
+
+def dumps(obj: dict) -> bytes:
+    """Serializes a data object into the layout `<sub>.json` files are written in.
+
+    The file is a single compact JSON object, so any JSON parser can read it, but the header comes first and every user
+    has a line of their own, which lets `iter_users` and `load_file` parse it one user at a time.
+    """
+    header = serialization.dumps({"version": FORMAT_VERSION, "timestamp": obj["timestamp"], "users": {}})
+    # every user is dumped as a one-key object, without its braces
+    users = b",\n".join(serialization.dumps({user: {COMMENTS_KEY: dict(comments.items())}})[1:-1]
+                        for user, comments in obj["users"].items())
+    return header[:-len(USERS_END)] + b"\n" + users + (b"\n" if users else b"") + USERS_END + b"\n"
+
+
+def _iter_user_lines(f: BinaryIO) -> Iterator[Tuple[str, Dict[str, int]]]:
+    for line in f:
+        line = line.rstrip()
+        if line == USERS_END:
+            return
+        for user, record in serialization.loads(b"{" + line.rstrip(b",") + b"}").items():
+            yield user, record[COMMENTS_KEY]
+
+
+def iter_users(path: str) -> Iterator[Tuple[str, Dict[str, int]]]:
+    """Yields the (username, {comment ID: score}) pairs of a `<sub>.json` file, without loading all of it.
+
+    Files in an older layout are loaded and migrated first, so they take as much memory as `load_file`.
+    """
+    with open(path, "rb") as f:
+        if f.readline().rstrip().endswith(USERS_LINE_END):
+            yield from _iter_user_lines(f)
+            return
+        f.seek(0)
+        obj = migrate(serialization.loads(f.read()))
+    for user, comments in obj["users"].items():
+        yield user, dict(comments.items())
+
+
+def load_file(path: str) -> dict:
+    """Loads a `<sub>.json` file and migrates it to the current format.
+
+    Files written by `dumps` are parsed one line at a time, straight into the table, so the parsed JSON of the whole
+    month never has to be in memory at once.
+    """
+    with open(path, "rb") as f:
+        first_line = f.readline().rstrip()
+        if not first_line.endswith(USERS_LINE_END):
+            f.seek(0)
+            return migrate(serialization.loads(f.read()))
+
+        obj = migrate(serialization.loads(first_line + USERS_END))
+        for user, comments in _iter_user_lines(f):
+            _add_user(obj["users"], user, comments)
+        return obj
+
+
+def get_comments(obj: dict, user_id: str) -> records.UserComments:
+    """Returns the {comment ID: score} mapping of one user, a view that can be read and written like a dict."""
+    return obj["users"][user_id]
+
@@ -2,21 +2,47 @@ const JSON_PATH = "/json/";
 const JSON_QUERY = ".json?" + Date.now().toString();
 const SUBS_STRING = "subreddits";
 const SUBS_KEY = "subs";
+const LEADERBOARD_SUFFIX = ".leaderboard.json";
+const MANIFEST_SUFFIX = ".manifest.json";
+const DB_NAME = "statsbot";
+const DB_VERSION = 3;
+const DB_STORE = "pages";
+// each sub's copy of every user's comment scores, kept up to date from its manifest, see `syncSub`
+const SUBS_STORE = "subs";
+// the layout of the users in the base and delta files, see `web_deltas.to_web_record`
+const COMMENT_ID_KEY = "commentId";
+const COMMENT_SCORE_KEY = "commentScore";
 const USERNAME_IDX = 0;
 const TOTAL_COMMENTS_IDX = 1;
 const TOTAL_SCORE_IDX = 2;
 const TOTAL_NEG_COMMENTS_IDX = 3;
+// the leaderboard's name of each table column, see `web_leaderboard.py`
+const COLUMN_KEYS = ["user", "comments", "score", "negatives"];
+// every row of the table is this tall, see main.css, so the scroll position tells which rows are visible
+const ROW_HEIGHT = 32;
+// rows rendered above and below the visible ones, so a short scroll does not show blank space
+const OVERSCAN_ROWS = 20;
 const WINDOW_RATIO = window.innerWidth / window.innerHeight;
+// what the table shows: the sub's leaderboard index, the sort order, and the matching rows while searching
+const view = {index: null, column: "comments", descending: true, rows: null};
+// the rows of every page fetched since the page was loaded, by the page's hash
+const pageRows = new Map();
+// the promise of each sub's up-to-date copy of the comment scores, synced once per selection of the sub
+const subData = new Map();
+// where the copies are kept when IndexedDB is unavailable
+const memoryCache = {};
+let database = null;
+let renderToken = 0;
+let renderScheduled = false;
 
 window.onload = () =>
 {
     setSelectBoxWidth();
+    document.getElementById("output-table-div").addEventListener("scroll", scheduleRender, {passive: true});
     fetchSubreddits()
         .then(data =>
         {
             fillSelectBox(data);
-            saveUserData()
-                .then(/* */);
         });
 };
 
@@ -39,60 +65,6 @@ function fillSelectBox(data)
     }
 }
 
-/**
- * Saves the user data for each JSON file to session storage. We loop through a
- * comma-separated list in session storage to get each sub's name, which
- * corresponds to a JSON file where the user data is saved. Because these files
- * are updated on the server every 6 hours, we need to avoid the browser cache
- * each time a user loads the web page. Appending "?<unique string>" to the end
- * of the URL will avoid the cache.
- *
- * @returns {Promise<void>}
- */
-async function saveUserData()
-{
-    const subsArr = sessionStorage.getItem(SUBS_KEY).split(",");
-    for (const sub of subsArr)
-    {
-        const path = JSON_PATH + sub + JSON_QUERY;
-        fetch(path)
-            .then(response =>
-            {
-                if (response.ok)
-                {
-                    return response.json();
-                }
-                return Promise.reject()
-            })
-            .then(jsonResponse =>
-            {
-                navigator.storage.estimate().then(estimate =>
-                {
-                    const quotaPct = ((estimate.usage / estimate.quota) * 100).toFixed(2) + "%"
-                    const quotaMB = (estimate.quota / 1024 / 1024).toFixed(2) + "MB"
-                    console.log("Currently using about " +
-                        quotaPct +
-                        " of estimated storage quota (" +
-                        quotaMB +
-                        ").")
-                });
-
-                try
-                {
-                    sessionStorage.setItem(sub, JSON.stringify(jsonResponse));
-                    sessionStorage.setItem(sub + "-timestamp", JSON.stringify(jsonResponse.timestamp));
-                } catch (DOMException)
-                {
-                    console.warn("SessionStorage is full! " + DOMException);
-                }
-            })
-            .catch(error =>
-            {
-                console.error(error)
-            });
-    }
-}
-
 /**
  * We fetch a list of subreddits from the "subreddits.json" file saved to the
  * webserver, and we save it to one long comma-separated string in session
@@ -110,211 +82,622 @@ async function fetchSubreddits()
 }
 
 /**
- * Displays a summary of each user's comment history.
+ * Displays the leaderboard of a sub. The server publishes it already added up
+ * and sorted by every column, split into pages, and lists the pages in
+ * "<sub>.leaderboard.json". The index is fetched past the browser cache every
+ * time, the pages under their content hash, and only the pages of the rows
+ * on screen are fetched, see `renderTable`.
  *
  * @param value
  */
-function displayAllUsers(value)
+async function displayAllUsers(value)
 {
     if (value === "0")
     {   // value is 0 when user selects the default select box option, so don't do anything in that case
         return;
     }
 
-    const table = document.getElementById("output-table").getElementsByTagName("tbody")[0];
     const footerText = document.getElementById("footer-timestamp");
     const subsArr = sessionStorage.getItem(SUBS_KEY).split(",");
-    const users = JSON.parse(sessionStorage.getItem(subsArr[value - 1]));
-    const totalsArray = getTotalsArray(users);
+    const sub = subsArr[value - 1];
+    document.body.className = 'waiting';
+    try
+    {
+        const index = await fetchJson(JSON_PATH + sub + LEADERBOARD_SUFFIX + "?" + Date.now().toString());
+        view.index = index;
+        subData.delete(sub);
+        document.getElementById("user-details").replaceChildren();
+        view.column = "comments";
+        view.descending = true;
+        view.rows = null;
+        await filterInput();
+
+        // TODO convert this UTC string into the browser's local time
+        //  see here: https://www.tutorialspoint.com/how-to-convert-utc-date-time-into-local-date-time-using-javascript
+        footerText.innerText = "Last updated (UTC): " + index.timestamp;
+        prunePages(index);
+    } catch (error)
+    {
+        console.error(error);
+    }
+    document.body.className = '';
+}
+
+/**
+ * Shows the rows of the table that are on screen, with spacer rows standing in
+ * for the others, so the table never holds more than a few dozen rows. Called
+ * again on every scroll, see `scheduleRender`.
+ *
+ * @returns {Promise<void>}
+ */
+async function renderTable()
+{
+    if (view.index === null)
+    {
+        return;
+    }
 
-    // remove all rows when you select a different sub
-    clearTable(table.rows.length);
+    const container = document.getElementById("output-table-div");
+    const table = document.getElementById("output-table").getElementsByTagName("tbody")[0];
+    const count = view.rows === null ? view.index.users : view.rows.length;
+    const first = Math.max(0, Math.floor(container.scrollTop / ROW_HEIGHT) - OVERSCAN_ROWS);
+    const last = Math.min(count, Math.ceil((container.scrollTop + container.clientHeight) / ROW_HEIGHT) + OVERSCAN_ROWS);
+    const token = ++renderToken;
+
+    const rows = view.rows === null
+        ? await readColumn(view.index, view.column, view.descending, first, last)
+        : view.rows.slice(first, last);
+    if (token !== renderToken)
+    {   // the table was scrolled, sorted or filtered again while the pages were on their way
+        return;
+    }
 
-    document.body.className = 'waiting';
-    for (const user of totalsArray)
+    const fragment = new DocumentFragment();
+    fragment.appendChild(createSpacer(first * ROW_HEIGHT));
+    for (const user of rows)
     {
-        // TODO this can all be refactored into smaller nested functions
-        const newRow = table.insertRow(table.rows.length);
+        fragment.appendChild(createRow(user));
+    }
+    fragment.appendChild(createSpacer(Math.max(0, count - last) * ROW_HEIGHT));
+    table.replaceChildren(fragment);
+}
 
-        const newCell0 = newRow.insertCell(USERNAME_IDX);
-        const newCell1 = newRow.insertCell(TOTAL_COMMENTS_IDX);
-        const newCell2 = newRow.insertCell(TOTAL_SCORE_IDX);
-        const newCell3 = newRow.insertCell(TOTAL_NEG_COMMENTS_IDX);
+function scheduleRender()
+{
+    if (renderScheduled)
+    {
+        return;
+    }
 
-        newCell0.style.width = "40%";
-        newCell1.style.width = "20%";
-        newCell2.style.width = "20%";
-        newCell3.style.width = "20%";
+    renderScheduled = true;
+    requestAnimationFrame(() =>
+    {
+        renderScheduled = false;
+        renderTable().catch(error => console.error(error));
+    });
+}
 
-        const userName = document.createTextNode(truncateUsername(user));
-        const totalComments = document.createTextNode(user[TOTAL_COMMENTS_IDX]);
-        const totalScore = document.createTextNode(user[TOTAL_SCORE_IDX]);
-        const totalNegatives = document.createTextNode(user[TOTAL_NEG_COMMENTS_IDX]);
+function createRow(user)
+{
+    const newRow = document.createElement("tr");
+    const widths = ["40%", "20%", "20%", "20%"];
+    const values = [
+        truncateUsername(user),
+        user[TOTAL_COMMENTS_IDX],
+        user[TOTAL_SCORE_IDX],
+        user[TOTAL_NEG_COMMENTS_IDX]
+    ];
+
+    for (let i = 0; i < values.length; i++)
+    {
+        const newCell = newRow.insertCell(i);
+        newCell.style.width = widths[i];
+        newCell.appendChild(document.createTextNode(values[i]));
+    }
+    newRow.onclick = () => showUserDetails(user[USERNAME_IDX]).catch(error => console.error(error));
+    return newRow;
+}
 
-        newCell0.appendChild(userName)
-        newCell1.appendChild(totalComments);
-        newCell2.appendChild(totalScore);
-        newCell3.appendChild(totalNegatives);
+/**
+ * Shows every comment score of one user below the table. The leaderboard
+ * only has each user's totals, so the first time a sub's details are opened,
+ * its copy of the comment scores is brought up to date, see `getSubCopy`.
+ *
+ * @param name - The username of the clicked row.
+ * @returns {Promise<void>}
+ */
+async function showUserDetails(name)
+{
+    const index = view.index;
+    const details = document.getElementById("user-details");
+    details.textContent = "Loading the comments of u/" + name + "...";
+    const copy = await getSubCopy(index.sub);
+    if (index !== view.index)
+    {   // another sub was selected while the copy was on its way
+        return;
     }
 
-    // TODO convert this UTC string into the browser's local time
-    //  see here: https://www.tutorialspoint.com/how-to-convert-utc-date-time-into-local-date-time-using-javascript
-    footerText.innerText = "Last updated (UTC): " +
-        JSON.parse(sessionStorage.getItem(subsArr[value - 1] + "-timestamp"))
+    const user = copy === undefined ? undefined : copy.users[name];
+    if (user === undefined)
+    {
+        details.textContent = "No comments of u/" + name + " are available yet.";
+        return;
+    }
 
-    document.body.className = '';
+    const scores = user[COMMENT_SCORE_KEY];
+    const sorted = scores.slice().sort((x, y) => x - y);
+    const median = sorted.length % 2 === 1
+        ? sorted[(sorted.length - 1) / 2]
+        : (sorted[sorted.length / 2 - 1] + sorted[sorted.length / 2]) / 2;
+    const summary = document.createElement("p");
+    summary.textContent = "u/" + name + ": " + scores.length + " comments, best " + sorted[sorted.length - 1] +
+        ", worst " + sorted[0] + ", median " + median;
+    const list = document.createElement("p");
+    list.textContent = user[COMMENT_ID_KEY].map((id, i) => id + ": " + scores[i]).join(", ");
+    details.replaceChildren(summary, list);
 }
 
-function truncateUsername(user)
+/**
+ * Returns a sub's copy of every user's comment scores, synced from its
+ * manifest once per selection of the sub. If the sub cannot be updated, its
+ * cached copy is used as it is.
+ *
+ * @param sub - The sub's name.
+ * @returns {Promise<{sub, base, deltas, timestamp, users}|undefined>}
+ */
+function getSubCopy(sub)
 {
-    let userNameString = user[0]
+    if (!subData.has(sub))
+    {
+        subData.set(sub, openDatabase()
+            .then(db => syncSub(db, sub)
+                .catch(error =>
+                {
+                    console.error(error);
+                    return readCached(db, sub);
+                })));
+    }
+    return subData.get(sub);
+}
 
-    if (WINDOW_RATIO < 0.70 && user[USERNAME_IDX].length > 11)
-    {   // truncate the username because we are short on horizontal space
-        userNameString = user[0].slice(0, 12);
-        userNameString += "...";
+/**
+ * Updates one sub's cached copy from its manifest, and returns the copy. The
+ * server publishes a manifest per sub, which lists a base file with every
+ * user and the delta files of the passes since then, each holding only the
+ * users that changed, see `web_deltas.py`. The manifest is fetched past the
+ * browser cache, the other files under their content hash.
+ *
+ * The copy remembers the hash of its base and of every delta applied to it.
+ * When the manifest still lists that base followed by those deltas, only the
+ * newer deltas are fetched, otherwise the copy starts over from the base.
+ *
+ * @param db - The IndexedDB database, or null to keep the copy in memory.
+ * @param sub - The sub's name.
+ * @returns {Promise<{sub, base, deltas, timestamp, users}>}
+ */
+async function syncSub(db, sub)
+{
+    const manifest = await fetchJson(JSON_PATH + sub + MANIFEST_SUFFIX + "?" + Date.now().toString());
+    const cached = await readCached(db, sub);
+    let record;
+    let pending;
+
+    if (cached && cached.base === manifest.base.sha256 &&
+        cached.deltas.every((sha256, i) => i < manifest.deltas.length && manifest.deltas[i].sha256 === sha256))
+    {
+        record = cached;
+        pending = manifest.deltas.slice(cached.deltas.length);
     }
-    else if (user[USERNAME_IDX].length > 25)
-    {   // Reddit username character limit is 36
-        userNameString = user[0].slice(0, 26);
-        userNameString += "...";
+    else
+    {
+        const base = await fetchVerified(manifest.base);
+        record = {sub: sub, base: manifest.base.sha256, deltas: [], users: base.users};
+        pending = manifest.deltas;
     }
 
-    return userNameString;
+    for (const delta of pending)
+    {
+        const changed = await fetchVerified(delta);
+        Object.assign(record.users, changed.users);
+        record.deltas.push(delta.sha256);
+    }
+
+    record.timestamp = manifest.timestamp;
+    await writeCached(db, record);
+    return record;
+}
+
+function createSpacer(height)
+{
+    const spacer = document.createElement("tr");
+    spacer.className = "spacer";
+    spacer.style.height = height + "px";
+    return spacer;
 }
 
 /**
- * Builds the totals array. Loop through the usersObj, adding up the total number of comments, the total score, and the total number of
- *     comments with a negative score.
+ * Returns rows [start, end) of the leaderboard in the order of one column.
+ * Each column's pages are sorted in one direction, the other direction reads
+ * them from the end.
  *
- *     For example: [["bob",31,278,0],["jane",12,773,2]]
+ * @param index - The sub's leaderboard index.
+ * @param column - One of `COLUMN_KEYS`.
+ * @param descending - The direction to read the column in.
+ * @param start - The first row.
+ * @param end - One past the last row.
+ * @returns {Promise<*[]>}
+ */
+async function readColumn(index, column, descending, start, end)
+{
+    const info = index.columns[column];
+    const reversed = descending !== info.descending;
+    const first = reversed ? index.users - end : start;
+    const last = reversed ? index.users - start : end;
+    if (first >= last)
+    {
+        return [];
+    }
+
+    const firstPage = Math.floor(first / index.page_size);
+    const pages = [];
+    for (let page = firstPage; page * index.page_size < last; page++)
+    {
+        pages.push(fetchPage(index.sub, info.pages[page]));
+    }
+
+    const offset = firstPage * index.page_size;
+    const rows = [].concat(...await Promise.all(pages)).slice(first - offset, last - offset);
+    return reversed ? rows.reverse() : rows;
+}
+
+/**
+ * Returns the rows of one leaderboard page, from memory, from IndexedDB, or
+ * from the server, in that order. A page's file name holds its hash, so the
+ * file behind a name never changes.
  *
- * @param usersObj - A key-value pair object that contains the user ID, and each comment ID and comment score.
- * @returns {*[]} - For example: [["bob",31,278,0],["jane",12,773,2]]
+ * @param sub - The sub's name.
+ * @param entry - The index's {file, sha256} of the page.
+ * @returns {Promise<*[]>}
  */
-function getTotalsArray(usersObj)
+function fetchPage(sub, entry)
 {
-    const totalsArray = [];
+    if (!pageRows.has(entry.sha256))
+    {
+        const rows = openDatabase()
+            .then(db => readPage(db, entry.sha256))
+            .then(cached =>
+            {
+                if (cached)
+                {
+                    return cached.rows;
+                }
+                return fetchVerified(entry)
+                    .then(fetched =>
+                    {
+                        writePage({sha256: entry.sha256, sub: sub, rows: fetched});
+                        return fetched;
+                    });
+            });
+        // a page that failed to arrive is asked for again by the next render
+        rows.catch(() => pageRows.delete(entry.sha256));
+        pageRows.set(entry.sha256, rows);
+    }
+    return pageRows.get(entry.sha256);
+}
 
-    if (typeof usersObj !== "object")
+async function fetchJson(path)
+{
+    const response = await fetch(path);
+    if (!response.ok)
     {
-        console.warn("Incompatible datatype")
-        return totalsArray;
+        throw new Error("Unable to fetch " + path + ": " + response.status);
     }
+    return response.json();
+}
 
-    for (const user in usersObj.users)
+/**
+ * Fetches a file listed in a leaderboard index or a manifest, and checks it
+ * against its SHA-256 when the browser can compute one (only on secure
+ * origins).
+ *
+ * @param entry - The {file, sha256} of the file.
+ * @returns {Promise<any>}
+ */
+async function fetchVerified(entry)
+{
+    const path = JSON_PATH + entry.file + "?" + entry.sha256;
+    const response = await fetch(path);
+    if (!response.ok)
     {
-        let totalUserComments = 0;
-        let totalUserScore = 0;
-        let totalNegativeComments = 0;
+        throw new Error("Unable to fetch " + path + ": " + response.status);
+    }
 
-        for (const score of usersObj.users[user].commentScore)
+    const buffer = await response.arrayBuffer();
+    if (window.crypto && crypto.subtle)
+    {
+        const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", buffer));
+        const hex = Array.from(digest, byte => byte.toString(16).padStart(2, "0")).join("");
+        if (hex !== entry.sha256)
         {
-            totalUserComments++;
-            totalUserScore += score;
-            if (score < 0)
-            {
-                totalNegativeComments++;
-            }
+            throw new Error("Hash mismatch for " + path);
         }
-
-        totalsArray.push([user, totalUserComments, totalUserScore, totalNegativeComments]);
     }
-
-    return totalsArray;
+    return JSON.parse(new TextDecoder().decode(buffer));
 }
 
-function filterInput()
+/**
+ * Opens the IndexedDB database that keeps the leaderboard pages and the
+ * copies of the comment scores between visits, once.
+ *
+ * @returns {Promise<IDBDatabase|null>} - null when IndexedDB is unavailable,
+ *     for example in some private browsing modes, everything is then only
+ *     kept in memory.
+ */
+function openDatabase()
 {
-    const input = document.getElementById("search-box");
-    const filter = input.value.toUpperCase();
-    const table = document.getElementById("output-table");
-    const tr = table.getElementsByTagName("tr");
-
-    for (let i = 0; i < tr.length; i++)
+    if (database === null)
     {
-        const td = tr[i].getElementsByTagName("td")[0];
-        if (td)
+        database = new Promise(resolve =>
         {
-            let txtValue = td.textContent || td.innerText;
-            if (txtValue.toUpperCase().indexOf(filter) > -1)
+            if (!window.indexedDB)
             {
-                tr[i].style.display = "";
+                resolve(null);
+                return;
             }
-            else
+
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () =>
             {
-                tr[i].style.display = "none";
-            }
-        }
+                const db = request.result;
+                if (!db.objectStoreNames.contains(DB_STORE))
+                {
+                    db.createObjectStore(DB_STORE, {keyPath: "sha256"}).createIndex("sub", "sub");
+                }
+                if (!db.objectStoreNames.contains(SUBS_STORE))
+                {   // version 2 dropped the copies of version 1, which have the same layout
+                    db.createObjectStore(SUBS_STORE, {keyPath: "sub"});
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () =>
+            {
+                console.warn("IndexedDB is unavailable, keeping the data in memory. " + request.error);
+                resolve(null);
+            };
+        });
     }
+    return database;
 }
 
-function clearTable(tableLength)
+function readPage(db, sha256)
 {
-    const table = document.getElementById("output-table").getElementsByTagName("tbody")[0]
-    for (let i = 0; i < tableLength; i++)
+    if (db === null)
     {
-        table.deleteRow(-1);
+        return Promise.resolve(undefined);
     }
+
+    return new Promise(resolve =>
+    {
+        const request = db.transaction(DB_STORE, "readonly").objectStore(DB_STORE).get(sha256);
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => resolve(undefined);
+    });
 }
 
-function sortTableRowsByColumn( columnIndex, ascending )
+async function writePage(record)
 {
-    const table = document.getElementById("output-table");
-    const rows = Array.from( table.querySelectorAll( ':scope > tbody > tr' ) );
-    document.body.className = 'waiting';
-    rows.sort( ( x, y ) => {
+    const db = await openDatabase();
+    if (db === null)
+    {
+        return;
+    }
 
-        const xValue = x.cells[columnIndex].textContent;
-        const yValue = y.cells[columnIndex].textContent;
+    const transaction = db.transaction(DB_STORE, "readwrite");
+    transaction.objectStore(DB_STORE).put(record);
+    transaction.onerror = () =>
+    {
+        // the storage quota may be full, the page is still in memory until the next visit
+        console.warn("Unable to cache a page of r/" + record.sub + ". " + transaction.error);
+    };
+}
 
-        const xNum = parseFloat( xValue );
-        const yNum = parseFloat( yValue );
+function readCached(db, sub)
+{
+    if (db === null)
+    {
+        return Promise.resolve(memoryCache[sub]);
+    }
 
-        return ascending ? ( xNum - yNum ) : ( yNum - xNum );
-    } );
+    return new Promise((resolve, reject) =>
+    {
+        const request = db.transaction(SUBS_STORE, "readonly").objectStore(SUBS_STORE).get(sub);
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
 
-    const fragment = new DocumentFragment();
-    for( let row of rows )
+function writeCached(db, record)
+{
+    if (db === null)
     {
-        fragment.appendChild( row );
+        memoryCache[record.sub] = record;
+        return Promise.resolve();
     }
 
-    table.tBodies[0].appendChild( fragment );
-    document.body.className = '';
+    return new Promise(resolve =>
+    {
+        const transaction = db.transaction(SUBS_STORE, "readwrite");
+        transaction.objectStore(SUBS_STORE).put(record);
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () =>
+        {
+            // the storage quota may be full, the copy still works from memory until the next visit
+            console.warn("Unable to cache r/" + record.sub + ". " + transaction.error);
+            memoryCache[record.sub] = record;
+            resolve();
+        };
+    });
 }
 
 /**
- * Sort table data based on a direction of asc or desc for a specific column
- * @param {number} n - column number calling this sort
- * @param {string} dir - direction of the sort (asc or desc)
- * @param {HTMLTableElement} targetElem - sort icon
+ * Deletes the cached pages of a sub that its latest index no longer lists.
+ *
+ * @param index - The sub's leaderboard index.
+ * @returns {Promise<void>}
  */
-function sortTable(n, dir = "asc", targetElem) {
-    targetElem.style.cursor = "progress";
-    let sortArr = [];
-    let table = targetElem.closest('table');
-    table.querySelectorAll('tbody > tr > td:nth-Child(' + parseInt(n) + ')').forEach((x, y) => sortArr.push(
+async function prunePages(index)
+{
+    const db = await openDatabase();
+    if (db === null)
+    {
+        return;
+    }
+
+    const current = new Set();
+    for (const column of Object.values(index.columns))
+    {
+        column.pages.forEach(page => current.add(page.sha256));
+    }
+
+    const store = db.transaction(DB_STORE, "readwrite").objectStore(DB_STORE);
+    store.index("sub").openCursor(IDBKeyRange.only(index.sub)).onsuccess = event =>
+    {
+        const cursor = event.target.result;
+        if (cursor)
         {
-            sortText: x.innerHTML.toLowerCase(),
-            rowElement: x.closest('tr')
-        }));
-    var sorted = sortArr.sort(function (a, b) {
-        if (dir == "asc") {
-            if (a.sortText < b.sortText) {
-                return -1;
-            }
-        } else if (dir == "desc") {
-            if (a.sortText > b.sortText) {
-                return -1;
+            if (!current.has(cursor.primaryKey))
+            {
+                cursor.delete();
             }
+            cursor.continue();
         }
-        return 0;
-    });
-    sorted.forEach((x, y) => {
-        x.rowElement.parentNode.insertBefore(x.rowElement, x.rowElement.parentNode.children[y]);
+    };
+}
+
+function truncateUsername(user)
+{
+    let userNameString = user[0]
+
+    if (WINDOW_RATIO < 0.70 && user[USERNAME_IDX].length > 11)
+    {   // truncate the username because we are short on horizontal space
+        userNameString = user[0].slice(0, 12);
+        userNameString += "...";
+    }
+    else if (user[USERNAME_IDX].length > 25)
+    {   // Reddit username character limit is 36
+        userNameString = user[0].slice(0, 26);
+        userNameString += "...";
+    }
+
+    return userNameString;
+}
+
+/**
+ * Shows the users whose name starts with the search box's text. The prefix
+ * index of the leaderboard gives the range of rows, in the "user" order, that
+ * share the text's first characters, so only the pages of that range are
+ * fetched and filtered.
+ *
+ * @returns {Promise<void>}
+ */
+async function filterInput()
+{
+    const index = view.index;
+    if (index === null)
+    {
+        return;
+    }
+
+    const input = document.getElementById("search-box");
+    const filter = input.value.toLowerCase();
+    let rows = null;
+    if (filter !== "")
+    {
+        const range = getPrefixRange(index, filter);
+        const candidates = range === null ? [] : await readColumn(index, "user", false, range[0], range[1]);
+        if (index !== view.index || filter !== input.value.toLowerCase())
+        {   // another sub was selected or the text changed while the pages were on their way
+            return;
+        }
+        rows = candidates.filter(user => user[USERNAME_IDX].toLowerCase().startsWith(filter));
+        sortRows(rows);
+    }
+
+    view.rows = rows;
+    document.getElementById("output-table-div").scrollTop = 0;
+    await renderTable();
+}
+
+/**
+ * Returns the [start, end) rows of the "user" order whose name starts with
+ * `filter`, as far as the prefix index can tell, or null if there are none.
+ *
+ * @param index - The sub's leaderboard index.
+ * @param filter - The lowercase search text.
+ * @returns {number[]|null}
+ */
+function getPrefixRange(index, filter)
+{
+    const prefix = filter.slice(0, index.prefix_length);
+    if (prefix.length === index.prefix_length)
+    {
+        return index.prefixes[prefix] || null;
+    }
+
+    // shorter than the indexed prefixes, the ranges of every prefix it starts are next to each other
+    let range = null;
+    for (const [key, [start, end]] of Object.entries(index.prefixes))
+    {
+        if (key.startsWith(prefix))
+        {
+            range = range === null ? [start, end] : [Math.min(range[0], start), Math.max(range[1], end)];
+        }
+    }
+    return range;
+}
+
+/**
+ * Sorts the rows of a search by the current column and direction, like the
+ * pages of the leaderboard are.
+ *
+ * @param rows
+ */
+function sortRows(rows)
+{
+    const columnIndex = COLUMN_KEYS.indexOf(view.column);
+    const sign = view.descending ? -1 : 1;
+    rows.sort((x, y) =>
+    {
+        const xValue = columnIndex === USERNAME_IDX ? x[columnIndex].toLowerCase() : x[columnIndex];
+        const yValue = columnIndex === USERNAME_IDX ? y[columnIndex].toLowerCase() : y[columnIndex];
+        return xValue < yValue ? -sign : xValue > yValue ? sign : 0;
     });
-    targetElem.style.cursor = null;
+}
+
+/**
+ * Sorts the table by a column. Clicking the column it is already sorted by
+ * flips the direction, otherwise names start in ascending and numbers in
+ * descending order.
+ *
+ * @param {number} columnIndex - The column that was clicked.
+ */
+function sortTableRowsByColumn(columnIndex)
+{
+    if (view.index === null)
+    {
+        return;
+    }
+
+    const column = COLUMN_KEYS[columnIndex];
+    view.descending = column === view.column ? !view.descending : view.index.columns[column].descending;
+    view.column = column;
+    if (view.rows !== null)
+    {
+        sortRows(view.rows);
+    }
+
+    document.getElementById("output-table-div").scrollTop = 0;
+    renderTable().catch(error => console.error(error));
 }
 
 function setSelectBoxWidth()
@@ -325,4 +708,4 @@ function setSelectBoxWidth()
         selectBox.style.width = "25%";
         selectBox.style.maxWidth = "25%";
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import log
+import records
+import serialization
+import storage
+import user_data
+from typing import Iterable, List, Optional, Set, Tuple
+
+MANIFEST_SUFFIX = ".manifest.json"
+BASE_INFIX = ".base."
+DELTA_INFIX = ".delta."
+FILE_SUFFIX = ".json"
+# the hex digits of a file's SHA-256 in its name, like the leaderboard pages, see `web_leaderboard.PAGE_HASH_LENGTH`
+FILE_HASH_LENGTH = 16
+MANIFEST_VERSION = 2
+# a new base is published once there are this many deltas, so a client that is far behind never fetches more
+MAX_DELTAS = 24
+# or once the deltas add up to this fraction of the base, at which point fetching the base is about as cheap
+MAX_DELTA_FRACTION = 0.5
+
+# subs whose base was written by this process, see `publish`
+_rebased = set()
+
+
+def publish(directory: str,
+            sub_name: str,
+            obj: dict,
+            changed_users: Iterable[str],
+            rebase: bool = False) -> Tuple[List[str], List[str]]:
+    """Writes the files the web page needs to bring its copy of a subreddit's comment scores up to date.
+
+    Once a visitor opens the details of a user, the web page keeps a copy of the comment scores of every user of that
+    sub, see `web/js/main.js`. Instead of the whole sub after every pass, it fetches `<sub>.manifest.json`, which lists
+    a base file with every user and the delta files published since. Each delta only holds the users that changed in
+    one pass, in the same layout as the base, and a client whose copy already has the base applies the deltas it has
+    not seen yet. Every file is listed with its SHA-256, and named after it, so a file on the server never changes.
+
+    A new base replaces the deltas the first time this process publishes a sub, since a crash may have lost a delta
+    before, at the start of a month, and once the deltas grow past `MAX_DELTAS` or `MAX_DELTA_FRACTION` of the base.
+    Like the leaderboard pages, the files of the previous manifest stay until the pass after, and older ones are
+    removed.
+
+    Args:
+      directory: Where the web files are written, `ftp.LOCAL_WEB_DIR`.
+      sub_name: The subreddit, which names the files.
+      obj: The data object of the subreddit, after the pass was saved.
+      changed_users: The users that got a new or changed comment during the pass.
+      rebase: True when users were removed from `obj`, which a delta cannot express.
+
+    Returns:
+      The names of the files to upload, in upload order with the manifest last, and the names of the files to remove,
+      once the manifest is uploaded.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_name = sub_name + MANIFEST_SUFFIX
+    previous = _read_manifest(directory + manifest_name)
+    previous_files = _get_listed_files(previous)
+    manifest = None if rebase or sub_name not in _rebased else previous
+    if manifest is None or len(manifest["deltas"]) >= MAX_DELTAS:
+        written = _publish_base(directory, sub_name, obj, manifest)
+    else:
+        written = _publish_delta(directory, sub_name, obj, manifest, changed_users)
+    return written, _remove_files(directory, sub_name, set(written) | previous_files)
+
+
+def _publish_delta(directory: str,
+                   sub_name: str,
+                   obj: dict,
+                   manifest: dict,
+                   changed_users: Iterable[str]) -> List[str]:
+    manifest_name = sub_name + MANIFEST_SUFFIX
+    manifest["timestamp"] = obj["timestamp"]
+    users = obj["users"]
+    changed = {user: to_web_record(users[user]) for user in changed_users if user in users}
+    if not changed:
+        # only the timestamp moved, the page still shows when the sub was last scanned
+        _write(directory, manifest_name, manifest)
+        return [manifest_name]
+
+    version = manifest["version"] + 1
+    data = serialization.dumps({"version": version, "timestamp": obj["timestamp"], "users": changed})
+    delta_bytes = sum(delta["bytes"] for delta in manifest["deltas"]) + len(data)
+    if delta_bytes > manifest["base"]["bytes"] * MAX_DELTA_FRACTION:
+        return _publish_base(directory, sub_name, obj, manifest)
+
+    delta = _write_file(directory, sub_name, DELTA_INFIX, version, data)
+    manifest["version"] = version
+    manifest["deltas"].append(delta)
+    _write(directory, manifest_name, manifest)
+    log.debug("Published %s changed users of r/%s in %s", len(changed), sub_name, delta["file"])
+    return [delta["file"], manifest_name]
+
+
+def _publish_base(directory: str, sub_name: str, obj: dict, manifest: Optional[dict]) -> List[str]:
+    version = 1 if manifest is None else manifest["version"] + 1
+    users = {user: to_web_record(comments) for user, comments in obj["users"].items()}
+    data = serialization.dumps({"version": version, "timestamp": obj["timestamp"], "users": users})
+    base = _write_file(directory, sub_name, BASE_INFIX, version, data)
+
+    manifest_name = sub_name + MANIFEST_SUFFIX
+    _write(directory, manifest_name, {
+        "manifest_version": MANIFEST_VERSION,
+        "sub": sub_name,
+        "version": version,
+        "timestamp": obj["timestamp"],
+        "base": base,
+        "deltas": [],
+    })
+    _rebased.add(sub_name)
+    log.debug("Published a new base of r/%s, %s bytes", sub_name, len(data))
+    return [base["file"], manifest_name]
+
+
+def to_web_record(comments: records.UserComments) -> dict:
+    """Builds the parallel "commentId" and "commentScore" lists of one user, the layout of version 1 files."""
+    pairs = list(comments.items())
+    return {user_data.LEGACY_ID_KEY: [pair[0] for pair in pairs],
+            user_data.LEGACY_SCORE_KEY: [pair[1] for pair in pairs]}
+
+
+def _write_file(directory: str, sub_name: str, infix: str, version: int, data: bytes) -> dict:
+    """Writes a base or delta under its hash, and returns the manifest's entry for it."""
+    digest = hashlib.sha256(data).hexdigest()
+    file_name = sub_name + infix + digest[:FILE_HASH_LENGTH] + FILE_SUFFIX
+    if not os.path.exists(directory + file_name):
+        storage.write_atomically(directory + file_name, data)
+    return {"file": file_name, "version": version, "sha256": digest, "bytes": len(data)}
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(path, "rb") as f:
+            manifest = serialization.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warn("%s: Unable to read %s, publishing a new base", e, path)
+        return None
+    return manifest if manifest.get("manifest_version") == MANIFEST_VERSION else None
+
+
+def _get_listed_files(manifest: Optional[dict]) -> Set[str]:
+    if manifest is None:
+        return set()
+    return {manifest["base"]["file"]} | {delta["file"] for delta in manifest["deltas"]}
+
+
+def _remove_files(directory: str, sub_name: str, kept: Set[str]) -> List[str]:
+    """Deletes the bases and deltas of a subreddit that are not in `kept`, and returns their names."""
+    prefixes = (sub_name + BASE_INFIX, sub_name + DELTA_INFIX)
+    removed = []
+    for file_name in os.listdir(directory):
+        if file_name.startswith(prefixes) and file_name.endswith(FILE_SUFFIX) and file_name not in kept:
+            try:
+                os.remove(directory + file_name)
+            except FileNotFoundError:
+                continue
+            removed.append(file_name)
+    return sorted(removed)
+
+
+def _write(directory: str, file_name: str, manifest: dict) -> None:
+    storage.write_atomically(directory + file_name, serialization.dumps(manifest))
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import leaderboard
+import log
+import serialization
+import storage
+from typing import Dict, List, Set, Tuple
+
+INDEX_SUFFIX = ".leaderboard.json"
+PAGE_INFIX = ".top."
+PAGE_SUFFIX = ".json"
+# the hex digits of a page's SHA-256 in its file name
+PAGE_HASH_LENGTH = 16
+LEADERBOARD_VERSION = 2
+# rows per page, a page of 1000 users is about 30 KB before gzip
+PAGE_SIZE = 1000
+# the prefix index maps the first characters of every lowercase username to its rows in the "user" order
+PREFIX_LENGTH = 2
+# the order each column's pages are sorted in, the web page reads them backwards for the other direction. Rows that tie
+# keep the order of `leaderboard.get_totals_array`, most comments first.
+COLUMNS = {
+    "user": False,
+    "comments": True,
+    "score": True,
+    "negatives": True,
+}
+_ROW_INDEXES = {"user": 0, "comments": 1, "score": 2, "negatives": 3}
+
+
+def publish(directory: str, sub_name: str, obj: dict) -> Tuple[List[str], List[str]]:
+    """Writes the leaderboard of a subreddit the way the web page reads it, so visitors never aggregate it themselves.
+
+    Each column of the table gets every row of `leaderboard.get_totals_array`, sorted by that column and split into
+    `<sub>.top.<column>.<hash>.json` files of `PAGE_SIZE` rows, so the page only fetches the rows it shows. Usernames
+    are sorted by their lowercase form, so the users whose name starts with a given prefix are a contiguous range of
+    the "user" pages. `<sub>.leaderboard.json` lists every page with its SHA-256, and holds the prefix index: the range
+    of rows of each `PREFIX_LENGTH` character prefix.
+
+    A page is named after its content, so a file on the server never changes, and a visitor who still has the
+    previous index keeps reading the pages it lists. Those stay until the pass after, every older page is removed.
+
+    Args:
+      directory: Where the web files are written, `ftp.LOCAL_WEB_DIR`.
+      sub_name: The subreddit, which names the files.
+      obj: The data object of the subreddit, after the pass was saved.
+
+    Returns:
+      The names of the files to upload, in upload order with the index last, and the names of the pages to remove,
+      once the index is uploaded.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_name = sub_name + INDEX_SUFFIX
+    previous_pages = _get_listed_pages(directory + index_name)
+    rows = leaderboard.get_totals_array(obj)
+    written = []
+    columns = {}
+    orders = {}
+
+    for column, descending in COLUMNS.items():
+        index = _ROW_INDEXES[column]
+        if column == "user":
+            order = sorted(rows, key=lambda row: row[0].lower())
+        else:
+            order = sorted(rows, key=lambda row: row[index], reverse=descending)
+        orders[column] = order
+
+        pages = []
+        for start in range(0, len(order), PAGE_SIZE):
+            data = serialization.dumps(order[start:start + PAGE_SIZE])
+            digest = hashlib.sha256(data).hexdigest()
+            page_name = sub_name + PAGE_INFIX + column + "." + digest[:PAGE_HASH_LENGTH] + PAGE_SUFFIX
+            if not os.path.exists(directory + page_name):
+                storage.write_atomically(directory + page_name, data)
+            pages.append({"file": page_name, "sha256": digest})
+            written.append(page_name)
+        columns[column] = {"descending": descending, "pages": pages}
+
+    storage.write_atomically(directory + index_name, serialization.dumps({
+        "version": LEADERBOARD_VERSION,
+        "sub": sub_name,
+        "timestamp": obj["timestamp"],
+        "users": len(rows),
+        "page_size": PAGE_SIZE,
+        "prefix_length": PREFIX_LENGTH,
+        "prefixes": get_prefix_index(orders["user"]),
+        "columns": columns,
+    }))
+    written.append(index_name)
+    return written, _remove_pages(directory, sub_name, set(written) | previous_pages)
+
+
+def get_prefix_index(rows_by_name: List[list]) -> Dict[str, List[int]]:
+    """Returns the [start, end) row range of every `PREFIX_LENGTH` character prefix, in rows sorted by lowercase name.
+
+    Names shorter than the prefix are their own prefix.
+    """
+    prefixes = {}
+    for position, row in enumerate(rows_by_name):
+        prefix = row[0][:PREFIX_LENGTH].lower()
+        if prefix in prefixes:
+            prefixes[prefix][1] = position + 1
+        else:
+            prefixes[prefix] = [position, position + 1]
+    return prefixes
+
+
+def _get_listed_pages(index_path: str) -> Set[str]:
+    try:
+        with open(index_path, "rb") as f:
+            index = serialization.loads(f.read())
+    except FileNotFoundError:
+        return set()
+    except (OSError, ValueError) as e:
+        log.warn("%s: Unable to read %s, its pages are removed", e, index_path)
+        return set()
+    return {page["file"] for column in index.get("columns", {}).values() for page in column["pages"]}
+
+
+def _remove_pages(directory: str, sub_name: str, kept: Set[str]) -> List[str]:
+    """Deletes the pages of a subreddit that are not in `kept`, and returns their names."""
+    prefix = sub_name + PAGE_INFIX
+    removed = []
+    for file_name in os.listdir(directory):
+        if file_name.startswith(prefix) and file_name.endswith(PAGE_SUFFIX) and file_name not in kept:
+            try:
+                os.remove(directory + file_name)
+            except FileNotFoundError:
+                continue
+            removed.append(file_name)
+    return sorted(removed)